@@ -0,0 +1,69 @@
+"""Hash only non-default analysis params
+
+Revision ID: 5b8e2f6a1c0d
+Revises: c4e1a7d2f9b3
+Create Date: 2026-10-17 18:05:44.291630
+
+"""
+
+import hashlib
+import json
+from typing import Callable, Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5b8e2f6a1c0d"
+down_revision: Union[str, None] = "c4e1a7d2f9b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every parameter there was when all of them were hashed, with its default
+_PREVIOUS_DEFAULTS = {
+    "sample_rate": None,
+    "mono": False,
+    "window": "tukey",
+    "nperseg": 256,
+    "noverlap": None,
+    "scale": "db",
+    "frequency_scale": "linear",
+    "colormap": "viridis",
+    "width": 1000,
+    "height": 400,
+}
+
+_audio = sa.table(
+    "audio",
+    sa.column("id", sa.Uuid()),
+    sa.column("params", sa.JSON()),
+    sa.column("params_hash", sa.String()),
+)
+
+
+def _hash(params: dict) -> str:
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def _rehash(params_hash: Callable[[dict], str]) -> None:
+    """Set the hash of every row from its params, which only hold non-default values."""
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(_audio.c.id, _audio.c.params)).all()
+    for audio_id, params in rows:
+        connection.execute(
+            sa.update(_audio)
+            .where(_audio.c.id == audio_id)
+            .values(params_hash=params_hash(params or {}))
+        )
+
+
+def upgrade() -> None:
+    """Upgrade data."""
+    _rehash(_hash)
+
+
+def downgrade() -> None:
+    """Downgrade data."""
+    _rehash(lambda params: _hash({**_PREVIOUS_DEFAULTS, **params}))
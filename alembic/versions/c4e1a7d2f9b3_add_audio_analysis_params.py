@@ -0,0 +1,65 @@
+"""Add audio analysis params
+
+Revision ID: c4e1a7d2f9b3
+Revises: 3f6d2c1a9b7e
+Create Date: 2026-10-17 15:40:12.703394
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e1a7d2f9b3"
+down_revision: Union[str, None] = "3f6d2c1a9b7e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Existing rows were processed with the default parameters
+_DEFAULT_PARAMS_HASH = "41f6496737b0e703"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "audio",
+        sa.Column("params", sa.JSON(), nullable=False, server_default="{}"),
+    )
+    op.add_column(
+        "audio",
+        sa.Column(
+            "params_hash",
+            sqlmodel.sql.sqltypes.AutoString(),
+            nullable=False,
+            server_default=_DEFAULT_PARAMS_HASH,
+        ),
+    )
+    op.add_column("audio", sa.Column("object_id", sa.Uuid(), nullable=True))
+    op.alter_column("audio", "params", server_default=None)
+    op.alter_column("audio", "params_hash", server_default=None)
+
+    # Content is now unique per parameter set
+    op.drop_index(op.f("ix_audio_content_hash"), table_name="audio")
+    op.create_index(
+        op.f("ix_audio_content_hash"), "audio", ["content_hash"], unique=False
+    )
+    op.create_unique_constraint(
+        "audio_content_hash_params_hash_key", "audio", ["content_hash", "params_hash"]
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Fails if some content was uploaded with several parameter sets
+    op.drop_constraint("audio_content_hash_params_hash_key", "audio", type_="unique")
+    op.drop_index(op.f("ix_audio_content_hash"), table_name="audio")
+    op.create_index(
+        op.f("ix_audio_content_hash"), "audio", ["content_hash"], unique=True
+    )
+    op.drop_column("audio", "object_id")
+    op.drop_column("audio", "params_hash")
+    op.drop_column("audio", "params")
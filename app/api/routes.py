@@ -1,19 +1,40 @@
-from typing import Annotated, cast
+from contextlib import AsyncExitStack
+from typing import Annotated, Optional, cast
 from uuid import UUID
 
-from fastapi import (APIRouter, Depends, File, HTTPException, Request,
+from botocore.exceptions import ClientError
+from fastapi import (APIRouter, Depends, File, Form, HTTPException, Request,
                      UploadFile)
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
 from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette import status
 
-from app.api.schemas import HealthCheckResponse, UploadResponse
+from app.api.schemas import (AudioStatusBatchRequest, AudioStatusBatchResponse,
+                             AudioStatusResponse, DirectUploadCompleteRequest,
+                             DirectUploadRequest, DirectUploadResponse,
+                             HealthCheckResponse, UploadResponse)
+from app.api.sse import (SubscriptionStreamingResponse, format_sse,
+                         stream_progress_events)
 from app.celery_app import celery_app
+from app.config import get_settings
 from app.db import session_generator
 from app.events import AUDIO_UPLOADED
 from app.exceptions import InvalidAudioFile
+from app.models.audio import Audio
+from app.models.constants import AUDIO_STATUS_DONE
 from app.repositories.audio import AudioRepository
+from app.services.analysis_params import (DEFAULT_ANALYSIS_PARAMS,
+                                          AnalysisParams)
+from app.services.audio_status import AudioStatusService
 from app.services.audio_upload import AudioUploadService
+from app.services.constants import PROGRESS_DONE
+from app.services.progress import ProgressEvent, ProgressHub
 from app.services.s3_storage import S3StorageService
+from app.services.status_cache import StatusCache
+from app.services.task_batcher import TaskBatcher
+from app.services.tiles import manifest_key, tile_key
 
 router = APIRouter()
 
@@ -22,6 +43,47 @@ def get_audio_store(request: Request) -> S3StorageService:
     return request.app.state.audio_store
 
 
+def get_spectrogram_store(request: Request) -> S3StorageService:
+    return request.app.state.spectrogram_store
+
+
+def get_task_batcher(request: Request) -> Optional[TaskBatcher[UUID]]:
+    """None when batching is disabled, tasks are then sent one per upload."""
+    return getattr(request.app.state, "task_batcher", None)
+
+
+def get_progress_hub(request: Request) -> Optional[ProgressHub]:
+    """None when progress events are disabled."""
+    return getattr(request.app.state, "progress_hub", None)
+
+
+def get_status_cache(request: Request) -> Optional[StatusCache]:
+    """None when the status cache is disabled, statuses are then read from the DB."""
+    return getattr(request.app.state, "status_cache", None)
+
+
+def get_analysis_params(
+    params: Annotated[
+        Optional[str],
+        Form(description="JSON object of analysis parameters, defaults if left out"),
+    ] = None,
+) -> AnalysisParams:
+    """Parameters are sent as a JSON form field next to the file, since the upload
+    is multipart."""
+    if params is None:
+        return DEFAULT_ANALYSIS_PARAMS
+    try:
+        return AnalysisParams.model_validate_json(params)
+    except ValidationError as exc:
+        # Reported like any other invalid request field
+        raise RequestValidationError(
+            [
+                {**error, "loc": ("body", "params", *error["loc"])}
+                for error in exc.errors(include_url=False, include_context=False)
+            ]
+        )
+
+
 async def get_audio_repository(
     session: AsyncSession = Depends(session_generator),
 ) -> AudioRepository:
@@ -35,6 +97,13 @@ async def get_audio_upload_service(
     return AudioUploadService(audio_repo, audio_store)
 
 
+async def get_audio_status_service(
+    audio_repo: AudioRepository = Depends(get_audio_repository),
+    status_cache: Optional[StatusCache] = Depends(get_status_cache),
+) -> AudioStatusService:
+    return AudioStatusService(audio_repo, status_cache)
+
+
 @router.get("/", response_model=HealthCheckResponse)
 def health_check() -> HealthCheckResponse:
     return HealthCheckResponse(status="ok")
@@ -45,14 +114,218 @@ def health_check() -> HealthCheckResponse:
 )
 async def upload_audio(
     audio_file: Annotated[UploadFile, File(description="mp3 or wav file")],
+    params: AnalysisParams = Depends(get_analysis_params),
     service: AudioUploadService = Depends(get_audio_upload_service),
+    task_batcher: Optional[TaskBatcher[UUID]] = Depends(get_task_batcher),
 ) -> UploadResponse:
-
+    """Uploading the same file with the same analysis parameters again returns the first
+    audio, see ``get_analysis_params``."""
     try:
-        uploaded_file = await service.handle_upload(audio_file)
+        uploaded_file, created = await service.handle_upload(audio_file, params)
     except InvalidAudioFile as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    celery_app.send_task(AUDIO_UPLOADED, args=[uploaded_file.id])
+    # Duplicate uploads return the existing audio, queued by the upload that created it.
+    # If its processing is stuck, the task's retries recover it, not another upload
+    if created:
+        _process_unless_done(uploaded_file, task_batcher)
 
     return UploadResponse(audio_id=cast(UUID, uploaded_file.id))
+
+
+@router.post(
+    "/uploads", response_model=DirectUploadResponse, status_code=status.HTTP_201_CREATED
+)
+async def start_direct_upload(
+    body: DirectUploadRequest,
+    service: AudioUploadService = Depends(get_audio_upload_service),
+) -> DirectUploadResponse:
+    """Presigned URLs the file is uploaded to, straight to S3 instead of through the
+    API. Call ``/uploads/{audio_id}/complete`` once it's uploaded."""
+    expires_in = get_settings().PRESIGNED_UPLOAD_EXPIRES_SECONDS
+    try:
+        audio, upload = await service.start_direct_upload(
+            body.filename, body.size, body.params, expires_in
+        )
+    except InvalidAudioFile as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return DirectUploadResponse(
+        audio_id=cast(UUID, audio.id),
+        url=upload.url,
+        multipart_upload_id=upload.multipart_upload_id,
+        part_size=upload.part_size,
+        part_urls=upload.part_urls,
+        expires_in=expires_in,
+    )
+
+
+@router.post(
+    "/uploads/{audio_id}/complete",
+    response_model=UploadResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def complete_direct_upload(
+    audio_id: UUID,
+    body: Optional[DirectUploadCompleteRequest] = None,
+    service: AudioUploadService = Depends(get_audio_upload_service),
+    task_batcher: Optional[TaskBatcher[UUID]] = Depends(get_task_batcher),
+    status_cache: Optional[StatusCache] = Depends(get_status_cache),
+) -> UploadResponse:
+    """Check the start of the uploaded file and queue it for processing, like
+    ``/upload`` does. Completing it again only queues it again if it isn't done."""
+    body = body or DirectUploadCompleteRequest()
+    try:
+        audio = await service.complete_direct_upload(
+            audio_id,
+            body.multipart_upload_id,
+            [(part.part_number, part.etag) for part in body.parts],
+        )
+    except InvalidAudioFile as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if audio is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Audio not found"
+        )
+
+    # Pollers may have cached "uploading"
+    if status_cache is not None:
+        await status_cache.set([audio_id], audio.status)
+    _process_unless_done(audio, task_batcher)
+
+    return UploadResponse(audio_id=audio_id)
+
+
+@router.get("/audio/{audio_id}", response_model=AudioStatusResponse)
+async def get_audio_status(
+    audio_id: UUID,
+    service: AudioStatusService = Depends(get_audio_status_service),
+) -> AudioStatusResponse:
+    statuses = await service.get_statuses([audio_id])
+    audio_status = statuses[audio_id]
+    if audio_status is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Audio not found"
+        )
+
+    return AudioStatusResponse(audio_id=audio_id, status=audio_status)
+
+
+@router.post("/audio/status", response_model=AudioStatusBatchResponse)
+async def get_audio_statuses(
+    body: AudioStatusBatchRequest,
+    service: AudioStatusService = Depends(get_audio_status_service),
+) -> AudioStatusBatchResponse:
+    statuses = await service.get_statuses(body.audio_ids)
+
+    return AudioStatusBatchResponse(
+        statuses=[
+            AudioStatusResponse(audio_id=audio_id, status=audio_status)
+            for audio_id, audio_status in statuses.items()
+            if audio_status is not None
+        ],
+        missing=[
+            audio_id
+            for audio_id, audio_status in statuses.items()
+            if audio_status is None
+        ],
+    )
+
+
+@router.get(
+    "/audio/{audio_id}/events",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def stream_audio_progress(
+    audio_id: UUID,
+    service: AudioStatusService = Depends(get_audio_status_service),
+    progress_hub: Optional[ProgressHub] = Depends(get_progress_hub),
+) -> StreamingResponse:
+    """Server-sent progress events of an audio, the stream ends after the "done" event."""
+    if progress_hub is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Progress events are disabled",
+        )
+
+    subscription = AsyncExitStack()
+    # Subscribed before the status is checked, so the audio can't finish in between
+    events = await subscription.enter_async_context(progress_hub.subscribe(audio_id))
+    try:
+        audio_status = (await service.get_statuses([audio_id]))[audio_id]
+    except BaseException:
+        await subscription.aclose()
+        raise
+
+    if audio_status is None:
+        await subscription.aclose()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Audio not found"
+        )
+
+    if audio_status == AUDIO_STATUS_DONE:
+        await subscription.aclose()
+        done = ProgressEvent(audio_id=audio_id, stage=PROGRESS_DONE)
+        return StreamingResponse(
+            iter([format_sse(done)]), media_type="text/event-stream"
+        )
+
+    return SubscriptionStreamingResponse(
+        stream_progress_events(events, get_settings()), subscription
+    )
+
+
+@router.get(
+    "/audio/{audio_id}/tiles",
+    response_class=Response,
+    responses={200: {"content": {"application/json": {}}}},
+)
+async def get_tile_manifest(
+    audio_id: UUID,
+    spectrogram_store: S3StorageService = Depends(get_spectrogram_store),
+) -> Response:
+    """Layout of the tile pyramid of an audio, 404 until its tiles are stored."""
+    manifest = await _retrieve_or_404(
+        spectrogram_store, manifest_key(audio_id), "Tiles not found"
+    )
+    return Response(manifest, media_type="application/json")
+
+
+@router.get(
+    "/audio/{audio_id}/tiles/{channel}/{zoom}/{x}/{y}.png",
+    response_class=Response,
+    responses={200: {"content": {"image/png": {}}}},
+)
+async def get_tile(
+    audio_id: UUID,
+    channel: int,
+    zoom: int,
+    x: int,
+    y: int,
+    spectrogram_store: S3StorageService = Depends(get_spectrogram_store),
+) -> Response:
+    tile = await _retrieve_or_404(
+        spectrogram_store, tile_key(audio_id, channel, zoom, x, y), "Tile not found"
+    )
+    return Response(tile, media_type="image/png")
+
+
+def _process_unless_done(
+    audio: Audio, task_batcher: Optional[TaskBatcher[UUID]]
+) -> None:
+    if audio.status == AUDIO_STATUS_DONE:
+        return
+    if task_batcher is not None:
+        task_batcher.add(cast(UUID, audio.id))
+    else:
+        celery_app.send_task(AUDIO_UPLOADED, args=[audio.id])
+
+
+async def _retrieve_or_404(store: S3StorageService, key: str, detail: str) -> bytes:
+    try:
+        return await store.retrieve(key)
+    except ClientError as exc:
+        if exc.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+        raise
@@ -1,6 +1,13 @@
+from typing import List, Optional
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from app.services.analysis_params import (DEFAULT_ANALYSIS_PARAMS,
+                                          AnalysisParams)
+from app.services.constants import (S3_MULTIPART_MAX_PARTS,
+                                    S3_MULTIPART_PART_SIZE,
+                                    STATUS_BATCH_MAX_IDS)
 
 
 class HealthCheckResponse(BaseModel):
@@ -9,3 +16,51 @@ class HealthCheckResponse(BaseModel):
 
 class UploadResponse(BaseModel):
     audio_id: UUID
+
+
+class DirectUploadRequest(BaseModel):
+    filename: str = Field(min_length=1)
+    # Bytes of the file, big files are uploaded in parts. Unknown is one PUT, which S3
+    # limits to 5 GiB.
+    size: Optional[int] = Field(
+        default=None, ge=0, le=S3_MULTIPART_MAX_PARTS * S3_MULTIPART_PART_SIZE
+    )
+    params: AnalysisParams = DEFAULT_ANALYSIS_PARAMS
+
+
+class DirectUploadResponse(BaseModel):
+    audio_id: UUID
+    # PUT the whole file here
+    url: Optional[str] = None
+    # Or PUT every part_size bytes of it to part_urls in order, then send the ETag
+    # response header of every part to /uploads/{audio_id}/complete
+    multipart_upload_id: Optional[str] = None
+    part_size: Optional[int] = None
+    part_urls: List[str] = []
+    expires_in: int
+
+
+class UploadedPart(BaseModel):
+    part_number: int = Field(ge=1, le=S3_MULTIPART_MAX_PARTS)
+    etag: str
+
+
+class DirectUploadCompleteRequest(BaseModel):
+    # Both left out for files uploaded with one PUT
+    multipart_upload_id: Optional[str] = None
+    parts: List[UploadedPart] = Field(default=[], max_length=S3_MULTIPART_MAX_PARTS)
+
+
+class AudioStatusResponse(BaseModel):
+    audio_id: UUID
+    status: str
+
+
+class AudioStatusBatchRequest(BaseModel):
+    audio_ids: List[UUID] = Field(min_length=1, max_length=STATUS_BATCH_MAX_IDS)
+
+
+class AudioStatusBatchResponse(BaseModel):
+    statuses: List[AudioStatusResponse]
+    # Requested IDs that don't exist
+    missing: List[UUID]
@@ -0,0 +1,55 @@
+import asyncio
+from contextlib import AsyncExitStack
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.config import Settings
+from app.services.constants import PROGRESS_DONE
+from app.services.progress import ProgressEvent
+
+
+def format_sse(event: ProgressEvent) -> str:
+    """One server-sent event, named after the progress stage."""
+    return f"event: {event.stage}\ndata: {event.model_dump_json()}\n\n"
+
+
+async def stream_progress_events(
+    events: "asyncio.Queue[ProgressEvent]", settings: Settings
+) -> AsyncIterator[str]:
+    """Yield progress events as server-sent events until the "done" one."""
+    while True:
+        try:
+            event = await asyncio.wait_for(
+                events.get(), settings.PROGRESS_KEEPALIVE_SECONDS
+            )
+        except asyncio.TimeoutError:
+            # Comment lines are ignored by clients but keep the connection busy
+            yield ": keepalive\n\n"
+            continue
+
+        yield format_sse(event)
+        if event.stage == PROGRESS_DONE:
+            return
+
+
+class SubscriptionStreamingResponse(StreamingResponse):
+    """Event stream that closes ``subscription`` once the response is over.
+
+    Also when the client goes away or sending fails before the first event, where the
+    generator never runs and background tasks are skipped.
+    """
+
+    def __init__(
+        self,
+        content: AsyncIterator[str],
+        subscription: AsyncExitStack,
+        media_type: str = "text/event-stream",
+    ) -> None:
+        super().__init__(content, media_type=media_type)
+        self.subscription = subscription
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async with self.subscription:
+            await super().__call__(scope, receive, send)
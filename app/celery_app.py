@@ -1,19 +1,45 @@
 import asyncio
+import logging
+import os
+from concurrent.futures import (Executor, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
 from contextlib import AsyncExitStack
 from functools import lru_cache
+from multiprocessing import get_context
 from typing import Any, Dict
 
 from celery import Celery
-from celery.signals import worker_process_init, worker_process_shutdown
+from celery.concurrency import get_implementation
+from celery.concurrency.prefork import TaskPool as PreforkTaskPool
+from celery.concurrency.thread import TaskPool as ThreadTaskPool
+from celery.signals import (worker_init, worker_process_init,
+                            worker_process_shutdown, worker_shutdown)
+from celery.worker.control import inspect_command
+from threadpoolctl import threadpool_limits
 
 from app import db
-from app.config import get_settings
+from app.config import Settings, get_settings
+from app.services import s3_storage, stft
 from app.services.constants import AUDIO_BUCKET, SPECTROGRAM_BUCKET
+from app.services.progress import ProgressPublisher, open_progress_publisher
 from app.services.s3_storage import S3StorageService, open_s3_stores
+from app.services.status_cache import StatusCache, open_status_cache
+from app.worker_runtime import WorkerRuntime
+
+logger = logging.getLogger(__name__)
 
 _audio_store: S3StorageService | None = None
 _spectrogram_store: S3StorageService | None = None
-_s3_context_manager_stack: AsyncExitStack | None = None
+_context_manager_stack: AsyncExitStack | None = None
+_render_executor: Executor | None = None
+_status_cache: StatusCache | None = None
+_progress_publisher: ProgressPublisher | None = None
+_runtime: WorkerRuntime | None = None
+_render_slots: asyncio.Semaphore | None = None
+# Processes of the worker pool, recorded by the parent before the pool starts
+_worker_processes: int | None = None
+# Tasks each worker process runs at the same time, the threads of a thread pool
+_process_concurrency: int = 1
 
 
 def get_audio_store() -> S3StorageService:
@@ -30,41 +56,221 @@ def get_spectrogram_store() -> S3StorageService:
     return _spectrogram_store
 
 
+def get_status_cache() -> StatusCache | None:
+    """None when the status cache is disabled."""
+    return _status_cache
+
+
+def get_progress_publisher() -> ProgressPublisher | None:
+    """None when progress events are disabled."""
+    return _progress_publisher
+
+
+def get_worker_runtime() -> WorkerRuntime:
+    """Event loop every task of this worker process runs on."""
+    if _runtime is None:
+        raise RuntimeError("_runtime is not initialized")
+
+    return _runtime
+
+
+def get_render_executor() -> Executor:
+    """Executor that renders spectrograms off the event loop, created on first use."""
+    global _render_executor
+    if _render_executor is None:
+        settings = get_settings()
+        if settings.WORKER_RENDER_EXECUTOR == "process":
+            _render_executor = ProcessPoolExecutor(
+                settings.WORKER_RENDER_WORKERS,
+                # Forked children would inherit the event loop thread, S3 clients and
+                # DB connections of this process, in whatever state they're in
+                mp_context=get_context("forkserver"),
+                initializer=_init_render_process,
+                initargs=(
+                    render_threads(settings, _worker_processes),
+                    settings.SPECTROGRAM_RENDERER,
+                ),
+            )
+        else:
+            _render_executor = ThreadPoolExecutor(
+                settings.WORKER_RENDER_WORKERS, thread_name_prefix="render"
+            )
+
+    return _render_executor
+
+
+def discard_render_executor(executor: Executor) -> None:
+    """Shut ``executor`` down and, if it's still the render executor, have the next
+    render create a new one. For process pools broken by a process that died."""
+    global _render_executor
+    if _render_executor is executor:
+        _render_executor = None
+    executor.shutdown(wait=False)
+
+
+def get_render_slots() -> asyncio.Semaphore:
+    """Held by every render while it's submitted to the render executor.
+
+    Tasks beyond ``WORKER_RENDER_WORKERS`` wait on the event loop, without holding the
+    audio in memory, instead of piling up in the executor's unbounded queue.
+    """
+    global _render_slots
+    if _render_slots is None:
+        _render_slots = asyncio.Semaphore(get_settings().WORKER_RENDER_WORKERS)
+
+    return _render_slots
+
+
+def warm_up_render_executor() -> None:
+    """Start every process of a process render executor now instead of on the first
+    renders, each importing and warming up the render path in its initializer."""
+    executor = get_render_executor()
+    if isinstance(executor, ProcessPoolExecutor):
+        # Submitted together, each call finds no idle process and starts a new one
+        workers = get_settings().WORKER_RENDER_WORKERS
+        for future in [executor.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+
+
+def render_threads(settings: Settings, worker_processes: int | None) -> int:
+    """Threads each render may use for FFTs and BLAS, ``WORKER_FFT_THREADS`` or the
+    cores split evenly between every render the worker pool runs at the same time."""
+    if settings.WORKER_FFT_THREADS is not None:
+        return settings.WORKER_FFT_THREADS
+
+    renders = (worker_processes or 1) * settings.WORKER_RENDER_WORKERS
+    return max(1, len(os.sched_getaffinity(0)) // renders)
+
+
+def limit_compute_threads(threads: int) -> None:
+    """Cap the FFT and BLAS threads of this process, so prefork children and their
+    renders don't fight each other for the cores."""
+    threadpool_limits(limits=threads)
+    stft.set_fft_workers(threads)
+
+
+def _init_render_process(threads: int, renderer: str) -> None:
+    limit_compute_threads(threads)
+    _warm_up_render_path(renderer)
+
+
+def _warm_up_render_path(renderer: str) -> None:
+    # Imported here, the API imports this module too and never renders
+    from app.services.spectrogram import warm_up
+
+    warm_up(renderer)
+
+
+@worker_init.connect
+def _init_worker(sender: Any = None, **_: Any) -> None:
+    """Runs in the parent worker process before the pool starts.
+
+    Prefork children inherit the number of processes. A thread pool runs its tasks in
+    this process and never sends ``worker_process_init``, so resources open here.
+    """
+    global _worker_processes, _process_concurrency
+    pool = get_implementation(getattr(sender, "pool_cls", None))
+    _worker_processes = (
+        getattr(sender, "concurrency", None) if pool is PreforkTaskPool else 1
+    )
+    if pool is ThreadTaskPool:
+        _process_concurrency = getattr(sender, "concurrency", None) or 1
+        _init_resources()
+
+
 @worker_process_init.connect
 def _init_resources(**_: Any) -> None:
     """Runs once per worker and does the following:
     1) Initialize the SQLAlchemy engine inside every Celery worker process.
     FastAPI runs its own db.init() at startup, this covers the worker side.
-    2) Open S3 clients and keeps them open
+    2) Open S3 clients, the status cache and the progress publisher and keeps them open
+    3) Limit the FFT and BLAS threads to this process' share of the cores and warm up
+    the render path, so the first task doesn't pay for imports and caches
+    Everything async is opened on the worker runtime loop, which every task runs on,
+    and the DB pool is filled there with a connection per task running at the same
+    time. Tasks then only check out connections, see ``pool_stats``.
     """
-    db.init(get_settings())
+    global _runtime
+    settings = get_settings()
+    db.init(settings, "worker", _process_concurrency)
+    _runtime = WorkerRuntime()
+    limit_compute_threads(render_threads(settings, _worker_processes))
 
     async def _setup() -> None:
-        global _audio_store, _spectrogram_store, _s3_context_manager_stack
-        _s3_context_manager_stack = AsyncExitStack()
+        global _audio_store, _spectrogram_store, _status_cache, _progress_publisher
+        global _context_manager_stack
+        _context_manager_stack = AsyncExitStack()
         # enter_async_context keeps open_s3_stores alive for the worker lifetime
         stores: Dict[str, S3StorageService] = (
-            await _s3_context_manager_stack.enter_async_context(
+            await _context_manager_stack.enter_async_context(
                 open_s3_stores(AUDIO_BUCKET, SPECTROGRAM_BUCKET)
             )
         )
         _audio_store = stores[AUDIO_BUCKET]
         _spectrogram_store = stores[SPECTROGRAM_BUCKET]
+        _status_cache = await _context_manager_stack.enter_async_context(
+            open_status_cache()
+        )
+        _progress_publisher = await _context_manager_stack.enter_async_context(
+            open_progress_publisher()
+        )
+        await db.warm_up(_process_concurrency)
+
+    _runtime.run(_setup())
 
-    asyncio.get_event_loop().run_until_complete(_setup())
+    if settings.WORKER_RENDER_EXECUTOR == "process":
+        warm_up_render_executor()
+    else:
+        # Render threads share this process' imports and caches
+        _warm_up_render_path(settings.SPECTROGRAM_RENDERER)
 
 
 @worker_process_shutdown.connect
 def _close_resources(**_: Any) -> None:
     """Called once when the worker process exits.
-    Cleans up DB engine and S3 clients."""
+    Cleans up DB engine, S3 clients, the status cache, the progress publisher
+    and the render executor."""
+    if _render_executor is not None:
+        _render_executor.shutdown()
 
     async def _cleanup() -> None:
-        if _s3_context_manager_stack is not None:
-            await _s3_context_manager_stack.aclose()
+        if _context_manager_stack is not None:
+            await _context_manager_stack.aclose()
         await db.destroy_engine()
 
-    asyncio.get_event_loop().run_until_complete(_cleanup())
+    if _runtime is not None:
+        logger.info(
+            f"[WORKER] DB pool: {db.get_pool_stats()}."
+            f" S3 pool: {s3_storage.get_pool_stats()}"
+        )
+        _runtime.run(_cleanup())
+        _runtime.close()
+
+
+@worker_shutdown.connect
+def _close_thread_pool_resources(sender: Any = None, **_: Any) -> None:
+    """A thread pool never sends ``worker_process_shutdown``, its resources are closed
+    with the worker."""
+    if get_implementation(getattr(sender, "pool_cls", None)) is ThreadTaskPool:
+        _close_resources()
+
+
+@inspect_command()
+def pool_stats(state: Any, **_: Any) -> Dict[str, Dict[str, Any]]:
+    """Connection pool use of the worker, ``celery -A app.celery_app inspect
+    pool_stats``.
+
+    Answered by the worker's main process, which runs the tasks of a thread or solo
+    pool. Prefork children log theirs when they exit.
+    """
+    return _pool_stats()
+
+
+def _pool_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        "db": db.get_pool_stats().as_dict(),
+        "s3": s3_storage.get_pool_stats().as_dict(),
+    }
 
 
 @lru_cache()
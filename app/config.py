@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -12,12 +13,108 @@ class Settings(BaseSettings):
     )
 
     DATABASE_URL: str
+    # Connection pool of each API process, every request running at the same time
+    # can hold a connection
+    DB_API_POOL_SIZE: int = 10
+    DB_API_MAX_OVERFLOW: int = 10
+    # Connection pool of each worker process. None keeps a connection per task the
+    # process runs at the same time, 1 with prefork or solo, the threads of a thread
+    # pool. Size it so processes x (size + overflow) fits max_connections.
+    DB_WORKER_POOL_SIZE: Optional[int] = None
+    DB_WORKER_MAX_OVERFLOW: int = 1
+    # Seconds to wait for a connection once the pool and its overflow are in use
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    # Pooled connections are replaced after this long, keep it under the idle timeouts
+    # of the server and of anything in between
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    # Check connections with a round trip on checkout, replacing ones that were dropped
+    DB_POOL_PRE_PING: bool = True
+    # Prepared statements asyncpg keeps per connection, 0 disables the cache
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # DATABASE_URL points to PgBouncer in transaction pooling mode. PgBouncer does the
+    # pooling, connections aren't pooled again nor reuse prepared statements.
+    DB_PGBOUNCER: bool = False
 
     CELERY_BROKER_URL: str
 
     S3_ENDPOINT: str
     S3_ID: str
     S3_SECRET: str
+    # Connections the S3 client, shared by every bucket, keeps open at the same time
+    S3_MAX_POOL_CONNECTIONS: int = 50
+    S3_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    S3_READ_TIMEOUT_SECONDS: float = 60.0
+    # Idle connections are closed after this long, under S3's own 20 s idle timeout
+    S3_KEEPALIVE_TIMEOUT_SECONDS: float = 12.0
+    # TCP keepalive probes, so half-open connections are detected
+    S3_TCP_KEEPALIVE: bool = True
+    # Attempts per request. "adaptive" retries also slow the client down when throttled.
+    S3_MAX_ATTEMPTS: int = 5
+    S3_RETRY_MODE: Literal["legacy", "standard", "adaptive"] = "adaptive"
+    # Check the buckets exist and are accessible when the API or a worker starts
+    S3_CHECK_BUCKETS: bool = True
+    # How long the URLs of presigned uploads (POST /uploads) are valid
+    PRESIGNED_UPLOAD_EXPIRES_SECONDS: int = 3600
+
+    # Memory ceiling of the streaming STFT in workers, bigger outputs are memory-mapped
+    STFT_MAX_MEMORY_BYTES: int = 256 * 1024 * 1024
+    # "raster" skips matplotlib and is several times faster, "matplotlib" is the fallback
+    SPECTROGRAM_RENDERER: Literal["raster", "matplotlib"] = "raster"
+    # Draw title, labels and axes on raster spectrograms
+    SPECTROGRAM_ANNOTATED: bool = True
+    # Also store a pyramid of tiles for zoomable viewers, see app.services.tiles
+    SPECTROGRAM_TILES_ENABLED: bool = False
+    SPECTROGRAM_TILE_SIZE: int = 256
+    # How cells are merged going one zoom level out, "max" keeps short events visible
+    SPECTROGRAM_TILE_POOLING: Literal["max", "mean"] = "max"
+    # Also store the dB matrix itself for downstream jobs, see
+    # app.services.spectrogram_matrix
+    SPECTROGRAM_MATRIX_ENABLED: bool = False
+    # uint8 is a quarter of the size but only has 256 levels over the dB range, power
+    # spectrograms are always stored as float32
+    SPECTROGRAM_MATRIX_DTYPE: Literal["float16", "uint8"] = "float16"
+    # Frames per chunk, the smallest time range a consumer can download
+    SPECTROGRAM_MATRIX_CHUNK_FRAMES: int = 1024
+    # Uncompressed chunks can be memory-mapped or range-read
+    SPECTROGRAM_MATRIX_COMPRESSION: Literal["zlib", "none"] = "zlib"
+
+    # The API groups uploaded audio IDs into batch tasks of up to this many IDs,
+    # 1 sends a task per upload.
+    TASK_BATCH_MAX_SIZE: int = 1
+    # A batch is sent at the latest this long after its first ID arrived
+    TASK_BATCH_MAX_WAIT_SECONDS: float = 0.5
+    # Spectrogram uploads running at the same time in a batch task
+    BATCH_IO_CONCURRENCY: int = 8
+
+    # Audio downloaded ahead of the one being rendered in a batch task
+    WORKER_PIPELINE_PREFETCH: int = 2
+    # Where workers render. "process" sidesteps the GIL but needs a worker pool that
+    # allows child processes (e.g. `--pool solo` or `--pool threads`), not prefork.
+    WORKER_RENDER_EXECUTOR: Literal["thread", "process"] = "thread"
+    # Renders running at the same time in each worker process
+    WORKER_RENDER_WORKERS: int = 1
+    # Threads of each FFT and of BLAS in workers. None splits the cores evenly between
+    # the worker processes and the renders each of them runs.
+    WORKER_FFT_THREADS: Optional[int] = None
+
+    # Audio statuses are cached in Redis so polling them doesn't reach the DB
+    STATUS_CACHE_ENABLED: bool = True
+    # Redis for the status cache, the Celery broker is used when not set
+    STATUS_CACHE_REDIS_URL: Optional[str] = None
+    # How long cached statuses live. Pending ones expire soon in case a worker couldn't
+    # write through, done never changes again. Run Redis with a volatile-* maxmemory
+    # policy to evict them under memory pressure.
+    STATUS_CACHE_TTL_SECONDS: int = 60
+    STATUS_CACHE_DONE_TTL_SECONDS: int = 24 * 60 * 60
+    # Unknown IDs are cached too, so polling them doesn't reach the DB either
+    STATUS_CACHE_MISSING_TTL_SECONDS: int = 10
+
+    # Workers publish progress events to Redis pub/sub, the API streams them to clients
+    PROGRESS_EVENTS_ENABLED: bool = True
+    # Redis for progress events, the Celery broker is used when not set
+    PROGRESS_REDIS_URL: Optional[str] = None
+    # Idle event streams get a comment this often so proxies don't close them
+    PROGRESS_KEEPALIVE_SECONDS: float = 15.0
 
 
 @lru_cache()
@@ -1,28 +1,91 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
 from threading import Lock
-from typing import AsyncGenerator, AsyncIterator, Optional
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Literal, Optional
+from uuid import uuid4
 
+from sqlalchemy import event, make_url
 from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool, QueuePool
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.config import Settings
+from app.pool_stats import PoolStats
 
 _engine_lock = Lock()
 _engine: Optional[AsyncEngine] = None
+_pool_stats = PoolStats()
 
+Role = Literal["api", "worker"]
 
-def init(settings: Settings) -> AsyncEngine:
-    """Initialise and return the global database engine."""
+
+def init(settings: Settings, role: Role = "api", concurrency: int = 1) -> AsyncEngine:
+    """Initialise and return the global database engine, pooled for the process
+    ``role``, see ``engine_options``."""
 
     global _engine
     if _engine is None:
         with _engine_lock:
             if _engine is None:  # re-check, in case another thread set it already
-                _engine = create_async_engine(settings.DATABASE_URL, echo=False)
+                _engine = create_async_engine(
+                    settings.DATABASE_URL,
+                    echo=False,
+                    **engine_options(settings, role, concurrency),
+                )
+                _count_pool_use(_engine)
 
     return _engine
 
 
+def engine_options(
+    settings: Settings, role: Role = "api", concurrency: int = 1
+) -> Dict[str, Any]:
+    """Pool and driver arguments of ``create_async_engine`` for an API or a worker
+    process, ``concurrency`` being the tasks a worker process runs at the same time.
+
+    Only Postgres is tuned, other databases (SQLite in tests) keep SQLAlchemy's
+    defaults. With ``DB_PGBOUNCER`` connections aren't pooled here and statements
+    aren't cached, PgBouncer in transaction pooling mode may run each transaction on
+    a different server connection, which doesn't have them prepared.
+    """
+    url = make_url(settings.DATABASE_URL)
+    if url.get_backend_name() != "postgresql":
+        return {}
+
+    options: Dict[str, Any] = {}
+    cache_size = 0 if settings.DB_PGBOUNCER else settings.DB_STATEMENT_CACHE_SIZE
+    if url.get_driver_name() == "asyncpg":
+        # SQLAlchemy prepares statements itself and asyncpg caches the ones it
+        # prepares on its own, both are bounded by the same size
+        connect_args: Dict[str, Any] = {
+            "prepared_statement_cache_size": cache_size,
+            "statement_cache_size": cache_size,
+        }
+        if settings.DB_PGBOUNCER:
+            # Names unique across every client of PgBouncer
+            connect_args["prepared_statement_name_func"] = _statement_name
+        options["connect_args"] = connect_args
+
+    if settings.DB_PGBOUNCER:
+        options["poolclass"] = NullPool
+        return options
+
+    if role == "worker":
+        pool_size = settings.DB_WORKER_POOL_SIZE or concurrency
+        max_overflow = settings.DB_WORKER_MAX_OVERFLOW
+    else:
+        pool_size = settings.DB_API_POOL_SIZE
+        max_overflow = settings.DB_API_MAX_OVERFLOW
+    options.update(
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    return options
+
+
 def get_engine() -> AsyncEngine:
     if _engine is None:
         raise RuntimeError(
@@ -31,6 +94,49 @@ def get_engine() -> AsyncEngine:
     return _engine
 
 
+def get_pool_stats() -> PoolStats:
+    """Connection pool use of the current engine."""
+    return _pool_stats
+
+
+async def warm_up(connections: int) -> None:
+    """Open up to ``connections`` connections at once and return them to the pool, so
+    the first tasks don't wait for connection setup. Capped at the pool size, overflow
+    connections would be closed as soon as they're returned.
+
+    Run it on the event loop the engine will be used from, asyncpg connections belong
+    to the loop they were opened on.
+    """
+    engine = get_engine()
+    if isinstance(engine.pool, NullPool):
+        return
+    if isinstance(engine.pool, QueuePool):
+        connections = min(connections, engine.pool.size())
+
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(
+            *(stack.enter_async_context(engine.connect()) for _ in range(connections))
+        )
+
+
+def _count_pool_use(engine: AsyncEngine) -> None:
+    global _pool_stats
+    _pool_stats = stats = PoolStats()
+
+    def on_connect(*_: Any) -> None:
+        stats.connects += 1
+
+    def on_checkout(*_: Any) -> None:
+        stats.checkouts += 1
+
+    event.listen(engine.sync_engine.pool, "connect", on_connect)
+    event.listen(engine.sync_engine.pool, "checkout", on_checkout)
+
+
+def _statement_name() -> str:
+    return f"__asyncpg_{uuid4()}__"
+
+
 async def destroy_engine() -> None:
     global _engine
     if _engine is not None:
@@ -1 +1,2 @@
 AUDIO_UPLOADED = "event.audio_uploaded"
+AUDIO_UPLOADED_BATCH = "event.audio_uploaded_batch"
@@ -1,25 +1,53 @@
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
+from uuid import UUID
 
 from fastapi import FastAPI
 
 import app.db as db
 from app.api.routes import router as api_router
+from app.celery_app import celery_app
 from app.config import get_settings
+from app.events import AUDIO_UPLOADED_BATCH
 from app.services.constants import AUDIO_BUCKET, SPECTROGRAM_BUCKET
+from app.services.progress import open_progress_hub
 from app.services.s3_storage import open_s3_stores
+from app.services.status_cache import open_status_cache
+from app.services.task_batcher import TaskBatcher
 
 
 @asynccontextmanager
 async def lifespan(fastapi_app: FastAPI) -> AsyncGenerator[None, None]:
-    db.init(get_settings())
-
-    async with open_s3_stores(AUDIO_BUCKET, SPECTROGRAM_BUCKET) as stores:
+    settings = get_settings()
+    db.init(settings, "api")
+
+    task_batcher: Optional[TaskBatcher[UUID]] = None
+    if settings.TASK_BATCH_MAX_SIZE > 1:
+        task_batcher = TaskBatcher(
+            lambda audio_ids: celery_app.send_task(
+                AUDIO_UPLOADED_BATCH, args=[audio_ids]
+            ),
+            max_size=settings.TASK_BATCH_MAX_SIZE,
+            max_wait=settings.TASK_BATCH_MAX_WAIT_SECONDS,
+        )
+    fastapi_app.state.task_batcher = task_batcher
+
+    async with (
+        open_s3_stores(AUDIO_BUCKET, SPECTROGRAM_BUCKET) as stores,
+        open_status_cache() as status_cache,
+        open_progress_hub() as progress_hub,
+    ):
         fastapi_app.state.audio_store = stores[AUDIO_BUCKET]
         fastapi_app.state.spectrogram_store = stores[SPECTROGRAM_BUCKET]
+        fastapi_app.state.status_cache = status_cache
+        fastapi_app.state.progress_hub = progress_hub
 
         yield
 
+    if task_batcher is not None:
+        # Don't lose IDs that are still waiting for their batch
+        task_batcher.flush()
+
     await db.destroy_engine()
 
 
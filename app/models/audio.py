@@ -1,19 +1,42 @@
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Dict, Optional, cast
 from uuid import UUID, uuid4
 
-from sqlalchemy import Column, DateTime
+from sqlalchemy import JSON, Column, DateTime, UniqueConstraint
 from sqlmodel import Field, SQLModel
 
-from app.models.constants import AUDIO_STATUS_PENDING
+from app.models.constants import AUDIO_STATUS_PENDING, DEFAULT_PARAMS_HASH
 
 
 class Audio(SQLModel, table=True):
+    # The same content is processed once per parameter set
+    __table_args__ = (
+        UniqueConstraint(
+            "content_hash", "params_hash", name="audio_content_hash_params_hash_key"
+        ),
+    )
+
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
     filename: str
     content_type: str
     status: str = AUDIO_STATUS_PENDING
+    # SHA-256 of the file contents, used to deduplicate uploads
+    content_hash: Optional[str] = Field(default=None, index=True)
+    # Analysis parameters as sent on upload, see app.services.analysis_params.
+    # Empty means the defaults.
+    params: Dict[str, Any] = Field(
+        default_factory=dict, sa_column=Column(JSON, nullable=False)
+    )
+    params_hash: str = DEFAULT_PARAMS_HASH
+    # ID the audio file is stored under when it's shared with an earlier upload of the
+    # same content, None when it's stored under this audio's own ID
+    object_id: Optional[UUID] = None
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),
         sa_column=Column(DateTime(timezone=True)),
     )
+
+    @property
+    def object_key(self) -> UUID:
+        """Key of the audio file in the audio store."""
+        return cast(UUID, self.object_id or self.id)
@@ -1,2 +1,8 @@
+# Presigned upload started, the file isn't in the audio store yet
+AUDIO_STATUS_UPLOADING = "uploading"
 AUDIO_STATUS_PENDING = "pending"
 AUDIO_STATUS_DONE = "done"
+
+# AnalysisParams().params_hash(), the parameters of audio uploaded without any.
+# A literal so models don't depend on services, a test keeps them in sync.
+DEFAULT_PARAMS_HASH = "44136fa355b3678a"
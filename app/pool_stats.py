@@ -0,0 +1,39 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class PoolStats:
+    """Connections taken from a pool and how many of them had to be opened for it.
+
+    Counted on the event loop the pool belongs to, read from anywhere. A warm pool
+    hands out connections it already has, its hit rate stays close to 1.
+    """
+
+    checkouts: int = 0
+    connects: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.checkouts - self.connects
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        """Share of checkouts that reused a connection, None before the first one."""
+        if self.checkouts == 0:
+            return None
+        return self.hits / self.checkouts
+
+    def as_dict(self) -> Dict[str, Optional[float]]:
+        return {
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "hit_rate": self.hit_rate,
+        }
+
+    def __str__(self) -> str:
+        hit_rate = "n/a" if self.hit_rate is None else f"{self.hit_rate:.1%}"
+        return (
+            f"{self.checkouts} checkouts, {self.connects} new connections,"
+            f" hit rate {hit_rate}"
+        )
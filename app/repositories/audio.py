@@ -1,12 +1,15 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional, Sequence
 from uuid import UUID
 
-from sqlmodel import select
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import col, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.models.audio import Audio
-from app.models.constants import AUDIO_STATUS_DONE
+from app.models.constants import (AUDIO_STATUS_DONE, AUDIO_STATUS_PENDING,
+                                  AUDIO_STATUS_UPLOADING)
 
 
 @dataclass
@@ -14,18 +17,88 @@ class AudioRepository:
     session: AsyncSession
 
     async def create(self, audio: Audio) -> Audio:
-        self.session.add(audio)
-        await self.session.commit()
-        await self.session.refresh(audio)
-        return audio
+        """Store ``audio`` with a single ``INSERT ... RETURNING`` and return the stored row.
+
+        The returned instance is not attached to the session, so it stays readable after
+        the commit without another round trip to reload it.
+
+        Raises ``IntegrityError`` if audio with the same content hash and parameters
+        exists already.
+        The session is rolled back in that case so it can still be used."""
+        try:
+            result = await self.session.exec(
+                insert(Audio)  # type: ignore[call-overload]
+                .values(**audio.model_dump())
+                .returning(*Audio.__table__.columns)  # type: ignore[attr-defined]
+            )
+            row = result.one()
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            raise
+        return Audio.model_validate(row._mapping)
 
     async def get_by_id(self, audio_id: UUID) -> Optional[Audio]:
         result = await self.session.exec(select(Audio).where(Audio.id == audio_id))
         return result.first()
 
+    async def get_many(self, audio_ids: Sequence[UUID]) -> List[Audio]:
+        """Fetch several audios with one query. Missing IDs are left out of the result."""
+        if not audio_ids:
+            return []
+        result = await self.session.exec(
+            select(Audio).where(col(Audio.id).in_(audio_ids))
+        )
+        return list(result.all())
+
+    async def get_by_content_hash(
+        self, content_hash: str, params_hash: str
+    ) -> Optional[Audio]:
+        result = await self.session.exec(
+            select(Audio).where(
+                Audio.content_hash == content_hash, Audio.params_hash == params_hash
+            )
+        )
+        return result.first()
+
+    async def get_object_key_by_content_hash(self, content_hash: str) -> Optional[UUID]:
+        """Key the audio file with this content is stored under, if any audio has it."""
+        result = await self.session.exec(
+            select(Audio.object_id, Audio.id)
+            .where(Audio.content_hash == content_hash)
+            .limit(1)
+        )
+        row = result.first()
+        return None if row is None else (row[0] or row[1])
+
+    async def complete_upload(self, audio_id: UUID, content_type: str) -> bool:
+        """Move an audio from "uploading" to "pending" with the content type found in its
+        file. Returns False if it wasn't uploading, e.g. it was completed already."""
+        result = await self.session.exec(
+            update(Audio)  # type: ignore[call-overload]
+            .where(
+                col(Audio.id) == audio_id, col(Audio.status) == AUDIO_STATUS_UPLOADING
+            )
+            .values(status=AUDIO_STATUS_PENDING, content_type=content_type)
+        )
+        await self.session.commit()
+        return result.rowcount == 1
+
     async def mark_done(self, audio_id: UUID) -> None:
-        audio = await self.get_by_id(audio_id)
-        if audio:
-            audio.status = AUDIO_STATUS_DONE
-            self.session.add(audio)
-            await self.session.commit()
+        await self.mark_many_done([audio_id])
+
+    async def mark_many_done(self, audio_ids: Sequence[UUID]) -> None:
+        """Mark several audios as done. Missing IDs are ignored."""
+        await self.set_status_many(audio_ids, AUDIO_STATUS_DONE)
+
+    async def set_status_many(self, audio_ids: Sequence[UUID], status: str) -> None:
+        """Change the status of several audios with a single UPDATE, without loading
+        them first. Missing IDs are ignored."""
+        if not audio_ids:
+            return
+        await self.session.exec(
+            update(Audio)  # type: ignore[call-overload]
+            .where(col(Audio.id).in_(audio_ids))
+            .values(status=status)
+        )
+        await self.session.commit()
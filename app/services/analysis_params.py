@@ -0,0 +1,100 @@
+import hashlib
+import json
+from typing import Literal, Optional, Tuple, Union
+
+from matplotlib import colormaps
+from pydantic import (BaseModel, ConfigDict, Field, field_validator,
+                      model_validator)
+
+from app.services.raster import CHANNEL_HEIGHT_PX, CHANNEL_WIDTH_PX
+from app.services.stft import DEFAULT_NPERSEG, DEFAULT_WINDOW
+
+# Lowest band of the "cqt" frequency scale when fmin isn't set, C1
+CQT_DEFAULT_FMIN = 32.703
+
+
+class AnalysisParams(BaseModel):
+    """How an audio is analysed and drawn, chosen per upload.
+
+    The defaults are what every spectrogram was made with before these were configurable,
+    so audio stored without parameters gets exactly these.
+    """
+
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+    # Load settings, None keeps the sample rate of the file
+    sample_rate: Optional[int] = Field(default=None, ge=1000, le=192_000)
+    mono: bool = False
+
+    # STFT settings, same meaning as in scipy.signal.spectrogram
+    window: Literal["tukey", "hann", "hamming", "blackman", "boxcar"] = "tukey"
+    nperseg: int = Field(default=DEFAULT_NPERSEG, ge=16, le=16384)
+    # None is nperseg // 8, scipy's default
+    noverlap: Optional[int] = Field(default=None, ge=0)
+
+    # "power" keeps the linear power values instead of converting them to dB
+    scale: Literal["db", "power"] = "db"
+    # "mel" and "cqt" map the STFT bins to mel or geometrically spaced bands,
+    # see app.services.filterbanks
+    frequency_scale: Literal["linear", "mel", "cqt"] = "linear"
+    n_mels: int = Field(default=128, ge=8, le=512)
+    bins_per_octave: int = Field(default=12, ge=1, le=96)
+    # Band limits in Hz, None is 0 (C1 for "cqt") and half the sample rate
+    fmin: Optional[float] = Field(default=None, ge=0)
+    fmax: Optional[float] = Field(default=None, gt=0)
+
+    # "fast" analyses only what the image can show, see compute_spectrogram
+    mode: Literal["exact", "fast"] = "exact"
+
+    # Output image, sizes are per channel
+    colormap: str = "viridis"
+    width: int = Field(default=CHANNEL_WIDTH_PX, ge=64, le=4096)
+    height: int = Field(default=CHANNEL_HEIGHT_PX, ge=64, le=4096)
+
+    @field_validator("colormap")
+    @classmethod
+    def _known_colormap(cls, colormap: str) -> str:
+        if colormap not in colormaps:
+            raise ValueError(f"Unknown colormap {colormap}")
+        return colormap
+
+    @model_validator(mode="after")
+    def _consistent_ranges(self) -> "AnalysisParams":
+        if self.noverlap is not None and self.noverlap >= self.nperseg:
+            raise ValueError("noverlap must be less than nperseg")
+        if self.fmin is not None and self.fmax is not None and self.fmin >= self.fmax:
+            raise ValueError("fmin must be less than fmax")
+        if self.frequency_scale == "cqt" and self.fmin == 0:
+            raise ValueError("fmin must be above 0 for the cqt frequency scale")
+        return self
+
+    @property
+    def scipy_window(self) -> Union[str, Tuple[str, float]]:
+        return DEFAULT_WINDOW if self.window == "tukey" else self.window
+
+    def params_hash(self) -> str:
+        """Short, stable hash of the parameters, whatever order they were sent in.
+
+        Parameters left at their default aren't hashed, so adding new ones doesn't change
+        the hash of existing audio. Upload stores exactly these in ``Audio.params``.
+        """
+        canonical = json.dumps(
+            self.model_dump(exclude_defaults=True),
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+    def band_limits(self, sample_rate: float) -> Tuple[float, float]:
+        """``(fmin, fmax)`` of the mel or cqt bands, fmax capped at the Nyquist
+        frequency."""
+        nyquist = sample_rate / 2
+        default_fmin = CQT_DEFAULT_FMIN if self.frequency_scale == "cqt" else 0.0
+        fmin = default_fmin if self.fmin is None else self.fmin
+        fmax = nyquist if self.fmax is None else min(self.fmax, nyquist)
+        if fmin >= fmax:
+            raise ValueError(f"fmin {fmin} Hz is not below fmax {fmax} Hz")
+        return fmin, fmax
+
+
+DEFAULT_ANALYSIS_PARAMS = AnalysisParams()
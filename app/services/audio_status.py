@@ -0,0 +1,38 @@
+from typing import Dict, Optional, Sequence
+from uuid import UUID
+
+from app.repositories.audio import AudioRepository
+from app.services.status_cache import StatusCache
+
+
+class AudioStatusService:
+    def __init__(self, audio_repo: AudioRepository, cache: Optional[StatusCache]):
+        self.audio_repo = audio_repo
+        self.cache = cache
+
+    async def get_statuses(
+        self, audio_ids: Sequence[UUID]
+    ) -> Dict[UUID, Optional[str]]:
+        """Status of every requested audio, None if it doesn't exist.
+
+        Served from the cache when possible, the rest is loaded with one query
+        and cached for the next poll.
+        """
+        audio_ids = list(dict.fromkeys(audio_ids))
+        if self.cache is None:
+            return await self._load(audio_ids)
+
+        statuses = await self.cache.get_many(audio_ids)
+        misses = [audio_id for audio_id in audio_ids if audio_id not in statuses]
+        if misses:
+            loaded = await self._load(misses)
+            await self.cache.fill(loaded)
+            statuses.update(loaded)
+
+        return {audio_id: statuses[audio_id] for audio_id in audio_ids}
+
+    async def _load(self, audio_ids: Sequence[UUID]) -> Dict[UUID, Optional[str]]:
+        statuses: Dict[UUID, Optional[str]] = dict.fromkeys(audio_ids)
+        for audio in await self.audio_repo.get_many(audio_ids):
+            statuses[audio.id] = audio.status  # type: ignore[index]
+        return statuses
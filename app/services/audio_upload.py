@@ -1,17 +1,24 @@
+import hashlib
 from pathlib import Path
-from typing import Optional, cast
+from typing import AsyncIterator, Optional, Sequence, Tuple, cast
 from uuid import UUID
 
+from botocore.exceptions import ClientError
 from fastapi import UploadFile
 from filetype import guess as guess_filetype
 from filetype.types.audio import Mp3, Wav
 from filetype.types.base import Type
+from sqlalchemy.exc import IntegrityError
 
 from app.exceptions import InvalidAudioFile
 from app.models.audio import Audio
+from app.models.constants import AUDIO_STATUS_PENDING, AUDIO_STATUS_UPLOADING
 from app.repositories.audio import AudioRepository
-from app.services.constants import FILE_HEADER_READ_SIZE
-from app.services.s3_storage import S3StorageService
+from app.services.analysis_params import (DEFAULT_ANALYSIS_PARAMS,
+                                          AnalysisParams)
+from app.services.constants import (FILE_HEADER_READ_SIZE,
+                                    UPLOAD_READ_CHUNK_SIZE)
+from app.services.s3_storage import PresignedUpload, S3StorageService
 
 
 class AudioUploadService:
@@ -19,7 +26,14 @@ class AudioUploadService:
         self.audio_repo = audio_repo
         self.audio_store = audio_store
 
-    async def handle_upload(self, audio_file: UploadFile) -> Audio:
+    async def handle_upload(
+        self, audio_file: UploadFile, params: AnalysisParams = DEFAULT_ANALYSIS_PARAMS
+    ) -> Tuple[Audio, bool]:
+        """Validate and store an upload, returns the audio and whether it was created.
+
+        If the same content was uploaded before with the same parameters, the existing
+        audio is returned and nothing is stored. With other parameters a new audio is
+        created, sharing the file stored for the first one."""
         if not audio_file.filename:
             raise InvalidAudioFile("Uploaded file must have a filename")
 
@@ -27,30 +41,160 @@ class AudioUploadService:
         # if it's an expected audio type before reading the entire thing.
         # No point reading possibly lots of MB if the header is wrong.
         header = await audio_file.read(FILE_HEADER_READ_SIZE)
+        mimetype = _audio_mimetype(header)
 
-        guessed_type: Optional[Type] = guess_filetype(header)
+        sanitized_filename = Path(audio_file.filename).name
 
-        # noinspection PyUnreachableCode
-        match guessed_type:
-            case Mp3() | Wav():
-                mimetype = guessed_type.mime
-            case _:
-                raise InvalidAudioFile("Unsupported audio file type")
+        # File passed validation, hash it to find out if it was uploaded before.
+        # The upload is spooled locally, so this costs a read of the file but no S3 traffic.
+        content_hash = await _hash_chunks(_iter_chunks(audio_file))
 
-        # File passed validation so move the cursor to the start
-        await audio_file.seek(0)
+        params_hash = params.params_hash()
+        existing = await self.audio_repo.get_by_content_hash(content_hash, params_hash)
+        if existing is not None:
+            return existing, False
 
-        audio_bytes = await audio_file.read()
+        audio = Audio(
+            filename=sanitized_filename,
+            content_type=mimetype,
+            content_hash=content_hash,
+            # Only what was set explicitly, so new defaults don't rewrite old rows
+            params=params.model_dump(exclude_defaults=True),
+            params_hash=params_hash,
+            object_id=await self.audio_repo.get_object_key_by_content_hash(
+                content_hash
+            ),
+        )
 
-        sanitized_filename = Path(audio_file.filename).name
+        if audio.object_id is None:
+            # Stream the file to the store instead of reading it whole,
+            # memory use per request stays the same regardless of file size.
+            # Stored before the DB row exists so a row always has its object.
+            await self.audio_store.store_stream(
+                cast(UUID, audio.id), _iter_chunks(audio_file), mimetype
+            )
 
-        audio = await self.audio_repo.create(
-            Audio(
-                filename=sanitized_filename,
-                content_type=mimetype,
+        try:
+            return await self.audio_repo.create(audio), True
+        except IntegrityError:
+            # A concurrent upload of the same content and parameters got in first,
+            # keep that one
+            if audio.object_id is None:
+                await self.audio_store.delete(cast(UUID, audio.id))
+            existing = await self.audio_repo.get_by_content_hash(
+                content_hash, params_hash
             )
+            if existing is None:
+                raise
+            return existing, False
+
+    async def start_direct_upload(
+        self,
+        filename: str,
+        size: Optional[int] = None,
+        params: AnalysisParams = DEFAULT_ANALYSIS_PARAMS,
+        expires_in: int = 3600,
+    ) -> Tuple[Audio, PresignedUpload]:
+        """Create an "uploading" audio and the URLs its file is uploaded to, straight
+        to the audio store. ``complete_direct_upload`` checks the file once it's there.
+
+        The file never passes through here, so it isn't hashed and uploads of the same
+        content aren't deduplicated.
+        """
+        sanitized_filename = Path(filename).name
+        if not sanitized_filename:
+            raise InvalidAudioFile("Uploaded file must have a filename")
+
+        audio = Audio(
+            filename=sanitized_filename,
+            # Known once the file is uploaded
+            content_type="",
+            status=AUDIO_STATUS_UPLOADING,
+            params=params.model_dump(exclude_defaults=True),
+            params_hash=params.params_hash(),
         )
+        upload = await self.audio_store.presign_upload(
+            cast(UUID, audio.id), size, expires_in
+        )
+        return await self.audio_repo.create(audio), upload
+
+    async def complete_direct_upload(
+        self,
+        audio_id: UUID,
+        multipart_upload_id: Optional[str] = None,
+        parts: Sequence[Tuple[int, str]] = (),
+    ) -> Optional[Audio]:
+        """Check the file of an "uploading" audio and mark it pending, ready to be
+        processed. Returns None if the audio doesn't exist and the audio as it is if it
+        was completed already.
+
+        Only the first ``FILE_HEADER_READ_SIZE`` bytes are read from the store. A file
+        that isn't supported audio is deleted and the audio stays "uploading". A single
+        PUT can then be made again while its URL is valid. A multipart upload can't:
+        completing it used up its upload ID, so its part URLs no longer work and the
+        file needs a new direct upload. Parts that don't add up leave the multipart
+        upload open, so they can be sent again.
+        """
+        audio = await self.audio_repo.get_by_id(audio_id)
+        if audio is None or audio.status != AUDIO_STATUS_UPLOADING:
+            return audio
+
+        try:
+            if multipart_upload_id is not None:
+                await self.audio_store.complete_multipart_upload(
+                    audio_id, multipart_upload_id, parts
+                )
+            header = await self.audio_store.retrieve_range(
+                audio_id, 0, FILE_HEADER_READ_SIZE - 1
+            )
+        except ClientError as exc:
+            code = exc.response["Error"]["Code"]
+            if code in ("404", "NoSuchKey", "NoSuchUpload"):
+                raise InvalidAudioFile("Audio file wasn't uploaded")
+            if code in ("InvalidPart", "InvalidPartOrder", "EntityTooSmall"):
+                raise InvalidAudioFile(f"Audio file parts don't add up: {code}")
+            if code == "InvalidRange":
+                # The range starts past the end, only of an empty file
+                raise InvalidAudioFile("Audio file is empty")
+            raise
+
+        try:
+            mimetype = _audio_mimetype(header)
+        except InvalidAudioFile:
+            await self.audio_store.delete(audio_id)
+            raise
+
+        if await self.audio_repo.complete_upload(audio_id, mimetype):
+            audio.status, audio.content_type = AUDIO_STATUS_PENDING, mimetype
+            return audio
+        # Completed by a concurrent request
+        return await self.audio_repo.get_by_id(audio_id)
+
+
+def _audio_mimetype(header: bytes) -> str:
+    """MIME type of a supported audio file, from the first ``FILE_HEADER_READ_SIZE``
+    bytes of it."""
+    guessed_type: Optional[Type] = guess_filetype(header)
+
+    # noinspection PyUnreachableCode
+    match guessed_type:
+        case Mp3() | Wav():
+            return guessed_type.mime
+        case _:
+            raise InvalidAudioFile("Unsupported audio file type")
+
+
+async def _iter_chunks(
+    upload_file: UploadFile, chunk_size: int = UPLOAD_READ_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """Yield the whole file in chunks, starting from the beginning."""
+    await upload_file.seek(0)
+    while chunk := await upload_file.read(chunk_size):
+        yield chunk
 
-        await self.audio_store.store(cast(UUID, audio.id), audio_bytes)
 
-        return audio
+async def _hash_chunks(chunks: AsyncIterator[bytes]) -> str:
+    content_hash = hashlib.sha256()
+    async for chunk in chunks:
+        content_hash.update(chunk)
+    return content_hash.hexdigest()
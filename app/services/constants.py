@@ -1,3 +1,58 @@
 FILE_HEADER_READ_SIZE = 256
 AUDIO_BUCKET = "audio"
 SPECTROGRAM_BUCKET = "spectrogram"
+
+# How much of an uploaded file is read from the request at a time
+UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
+# S3 requires every multipart part except the last one to be at least 5 MiB
+S3_MULTIPART_PART_SIZE = 8 * 1024 * 1024
+# Most parts of an S3 multipart upload
+S3_MULTIPART_MAX_PARTS = 10000
+# Presigned uploads of files bigger than this are split in parts, which clients can
+# upload in parallel and retry one by one
+PRESIGNED_UPLOAD_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+# How much of a stored object is read from S3 at a time
+S3_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Downloads bigger than this are spooled to a temp file on disk instead of kept in memory
+DOWNLOAD_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Default memory ceiling of the streaming STFT, see StreamingSpectrogram
+STFT_MAX_MEMORY_BYTES = 256 * 1024 * 1024
+
+# Fast mode analyses this many STFT frames per pixel column of the image
+FAST_MODE_FRAMES_PER_COLUMN = 2
+# Fast mode resamples to this much more than twice the highest band, leaving room for
+# the transition band of the anti-aliasing filter
+FAST_MODE_BANDWIDTH_MARGIN = 1.1
+
+# Windows and filterbanks kept per worker process, per shape, see app.services.filterbanks.
+# Sample rates and sizes come from a small set, so few entries are ever needed.
+FILTERBANK_CACHE_SIZE = 32
+
+# Sample rate of the silence workers render at startup, see warm_up
+WARM_UP_SAMPLE_RATE = 22050
+
+# Spectrogram renderers, see generate_spectrogram
+RENDERER_MATPLOTLIB = "matplotlib"
+RENDERER_RASTER = "raster"
+
+# Spectrogram tiles rendered at a time, uploads of a batch overlap rendering the next
+TILE_BATCH_SIZE = 32
+
+# S3 metadata key holding the hash of the parameters a spectrogram was rendered with
+RENDER_PARAMS_METADATA_KEY = "render-params"
+
+# Most audio IDs accepted by one batch status request
+STATUS_BATCH_MAX_IDS = 1000
+
+# Progress stages published while an audio is processed, see app.services.progress
+PROGRESS_DOWNLOADED = "downloaded"
+PROGRESS_DECODED = "decoded"
+# Comes with the percentage of STFT frames computed
+PROGRESS_STFT = "stft"
+PROGRESS_RENDERED = "rendered"
+PROGRESS_STORED = "stored"
+# Last event, the audio is marked done
+PROGRESS_DONE = "done"
+# STFT progress is published in steps of at least this many percent
+PROGRESS_STFT_STEP_PERCENT = 5
@@ -0,0 +1,310 @@
+import io
+import logging
+import mmap
+import struct
+from dataclasses import dataclass
+from math import ceil
+from typing import (IO, BinaryIO, Dict, Iterator, Optional, Protocol, Tuple,
+                    cast)
+
+import librosa
+import numpy as np
+import soundfile
+import soxr
+
+from app.services.stft import iter_blocks
+
+logger = logging.getLogger(__name__)
+
+# WAVE format tags, WAVE_FORMAT_EXTENSIBLE stores the actual tag in its subformat
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Sample dtypes read straight from the mapping and the scale libsndfile converts them
+# to float with. 24 bit samples are widened to 32 bit per block, see _to_float32.
+_PCM_SAMPLES: Dict[Tuple[int, int], Tuple[np.dtype, float]] = {
+    (_WAVE_FORMAT_PCM, 16): (np.dtype("<i2"), 1 / 0x8000),
+    (_WAVE_FORMAT_PCM, 24): (np.dtype("u1"), 1 / 0x800000),
+    (_WAVE_FORMAT_PCM, 32): (np.dtype("<i4"), 1 / 0x80000000),
+    (_WAVE_FORMAT_IEEE_FLOAT, 32): (np.dtype("<f4"), 1.0),
+    (_WAVE_FORMAT_IEEE_FLOAT, 64): (np.dtype("<f8"), 1.0),
+}
+
+
+class AudioDecoder(Protocol):
+    """Audio decoded block by block, as ``(n_channels, n)`` float32 arrays.
+
+    ``n_samples`` is the length announced by the container, the blocks may add up to a
+    few samples less for compressed formats.
+    """
+
+    sample_rate: float
+    n_channels: int
+    n_samples: int
+
+    def iter_blocks(self, block_samples: int) -> Iterator[np.ndarray]:
+        """Yield the audio from the start in blocks of up to ``block_samples``."""
+
+    def close(self) -> None:
+        """Release the file and buffers, blocks can't be read afterwards."""
+
+
+@dataclass(frozen=True)
+class WavLayout:
+    """Where the samples of a PCM or float WAV file are and how they're stored."""
+
+    sample_rate: int
+    n_channels: int
+    bits: int
+    dtype: np.dtype
+    scale: float
+    data_offset: int
+    n_samples: int
+
+
+def read_wav_layout(audio: IO[bytes]) -> Optional[WavLayout]:
+    """Parse the RIFF header of ``audio``, or return None unless it's a WAV file with
+    16, 24 or 32 bit integer or 32 or 64 bit float samples. Leaves the position of
+    ``audio`` anywhere."""
+    audio.seek(0)
+    header = audio.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:] != b"WAVE":
+        return None
+
+    fmt: Optional[bytes] = None
+    while True:
+        chunk = audio.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if chunk_id == b"fmt ":
+            fmt = audio.read(size)
+        elif chunk_id == b"data":
+            break
+        else:
+            audio.seek(size, io.SEEK_CUR)
+        # Chunks are padded to an even size
+        if size % 2:
+            audio.seek(1, io.SEEK_CUR)
+
+    if fmt is None or len(fmt) < 16:
+        return None
+    format_tag, n_channels, sample_rate, _, block_align, bits = struct.unpack(
+        "<HHIIHH", fmt[:16]
+    )
+    if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        format_tag = struct.unpack("<H", fmt[24:26])[0]
+    if (format_tag, bits) not in _PCM_SAMPLES or n_channels < 1:
+        return None
+    if block_align != n_channels * bits // 8:
+        return None
+
+    data_offset = audio.tell()
+    # Streamed WAVs can announce a bogus size, the file ends the data at the latest
+    file_size = audio.seek(0, io.SEEK_END)
+    data_size = min(size, file_size - data_offset)
+    dtype, scale = _PCM_SAMPLES[(format_tag, bits)]
+    return WavLayout(
+        sample_rate,
+        n_channels,
+        bits,
+        dtype,
+        scale,
+        data_offset,
+        data_size // block_align,
+    )
+
+
+class PcmWavDecoder:
+    """Reads the samples of an uncompressed WAV straight from a memory mapping of the
+    file, or from the buffer of a ``BytesIO``. Nothing is copied until a block is
+    converted to float32, so the samples never have to fit in memory."""
+
+    def __init__(self, audio: IO[bytes], layout: WavLayout):
+        self._mmap: Optional[mmap.mmap] = None
+        buffer: memoryview | mmap.mmap
+        if isinstance(audio, io.BytesIO):
+            buffer = audio.getbuffer()
+        else:
+            # Spooled temp files roll over to disk here, they're mapped from there on
+            self._mmap = mmap.mmap(audio.fileno(), 0, access=mmap.ACCESS_READ)
+            buffer = self._mmap
+        self._buffer = buffer
+
+        self.sample_rate: float = layout.sample_rate
+        self.n_channels: int = layout.n_channels
+        self.n_samples: int = layout.n_samples
+        self._layout = layout
+        # Frames first, the way they're interleaved in the file
+        sample_width = 3 if layout.bits == 24 else 1
+        self._samples: Optional[np.ndarray] = np.frombuffer(
+            buffer,
+            dtype=layout.dtype,
+            count=layout.n_samples * layout.n_channels * sample_width,
+            offset=layout.data_offset,
+        ).reshape(layout.n_samples, layout.n_channels * sample_width)
+
+    def iter_blocks(self, block_samples: int) -> Iterator[np.ndarray]:
+        for start in range(0, self.n_samples, block_samples):
+            # Not kept in a local, a suspended generator mustn't keep the mapping open
+            if self._samples is None:
+                raise ValueError("Decoder is closed")
+            yield self._to_float32(self._samples[slice(start, start + block_samples)]).T
+
+    def _to_float32(self, frames: np.ndarray) -> np.ndarray:
+        if self._layout.bits == 24:
+            # Three bytes per sample, shifted into the top of an int32 for the sign
+            widened = np.zeros((len(frames), self.n_channels, 4), dtype=np.uint8)
+            widened[:, :, 1:] = frames.reshape(len(frames), self.n_channels, 3)
+            frames = widened.view("<i4")[:, :, 0] >> 8
+        if self._layout.dtype == np.float32:
+            return frames.copy()
+        converted = frames.astype(np.float32)
+        if self._layout.scale != 1.0:
+            converted *= np.float32(self._layout.scale)
+        return converted
+
+    def close(self) -> None:
+        # The mapping can only be closed once no array views it anymore
+        self._samples = None
+        if isinstance(self._buffer, memoryview):
+            self._buffer.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+
+class SoundfileDecoder:
+    """Decodes with libsndfile: WAV and the other formats it reads natively, and MP3
+    since libsndfile 1.1. Only one block of samples is in memory at a time."""
+
+    def __init__(self, audio: IO[bytes]):
+        self._file = soundfile.SoundFile(cast(BinaryIO, audio))
+        self.sample_rate: float = self._file.samplerate
+        self.n_channels: int = self._file.channels
+        self.n_samples: int = self._file.frames
+
+    def iter_blocks(self, block_samples: int) -> Iterator[np.ndarray]:
+        self._file.seek(0)
+        while True:
+            block = self._file.read(block_samples, dtype="float32", always_2d=True)
+            if not len(block):
+                return
+            # Samples are interleaved, the transposed view has channels first
+            yield block.T
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class LibrosaDecoder:
+    """Fallback for what libsndfile can't read, librosa tries audioread's backends.
+    Decodes the whole file up front."""
+
+    def __init__(self, audio: IO[bytes]):
+        audio_data, self.sample_rate = librosa.load(
+            cast(BinaryIO, audio), sr=None, mono=False
+        )
+        self._audio_data: np.ndarray = np.atleast_2d(audio_data)
+        self.n_channels, self.n_samples = self._audio_data.shape
+
+    def iter_blocks(self, block_samples: int) -> Iterator[np.ndarray]:
+        yield from iter_blocks(self._audio_data, block_samples)
+
+    def close(self) -> None:
+        del self._audio_data
+
+
+class DownmixDecoder:
+    """Averages the channels of another decoder, like ``librosa.to_mono``."""
+
+    def __init__(self, decoder: AudioDecoder):
+        self._decoder = decoder
+        self.sample_rate = decoder.sample_rate
+        self.n_channels = 1
+        self.n_samples = decoder.n_samples
+
+    def iter_blocks(self, block_samples: int) -> Iterator[np.ndarray]:
+        for block in self._decoder.iter_blocks(block_samples):
+            yield block.mean(axis=0, keepdims=True)
+
+    def close(self) -> None:
+        self._decoder.close()
+
+
+class ResampleDecoder:
+    """Resamples another decoder with a streaming soxr resampler, the same filter
+    ``librosa.load`` uses by default."""
+
+    def __init__(self, decoder: AudioDecoder, sample_rate: float):
+        self._decoder = decoder
+        self.sample_rate = sample_rate
+        self.n_channels = decoder.n_channels
+        self.n_samples = ceil(decoder.n_samples * sample_rate / decoder.sample_rate)
+
+    def iter_blocks(self, block_samples: int) -> Iterator[np.ndarray]:
+        stream = soxr.ResampleStream(
+            self._decoder.sample_rate,
+            self.sample_rate,
+            self.n_channels,
+            dtype="float32",
+            quality="HQ",
+        )
+        # Sized so a block comes out at about block_samples
+        in_block = max(
+            1, ceil(block_samples * self._decoder.sample_rate / self.sample_rate)
+        )
+        blocks = self._decoder.iter_blocks(in_block)
+        block = next(blocks, None)
+        while block is not None:
+            following = next(blocks, None)
+            # soxr takes frames first, the last block flushes the resampler
+            resampled = stream.resample_chunk(
+                np.ascontiguousarray(block.T), last=following is None
+            )
+            if len(resampled):
+                yield resampled.T
+            block = following
+
+    def close(self) -> None:
+        self._decoder.close()
+
+
+def open_decoder(
+    audio: IO[bytes], sample_rate: Optional[float] = None, mono: bool = False
+) -> AudioDecoder:
+    """Open the fastest decoder that reads ``audio``, a seekable binary file.
+
+    Decoding starts at the beginning of the file whatever its position. ``sample_rate``
+    resamples unless it's None or the rate of the file already, ``mono`` averages the
+    channels. Raises ``ValueError`` if no decoder can read the file.
+    """
+    decoder: AudioDecoder
+    layout = read_wav_layout(audio)
+    audio.seek(0)
+    try:
+        decoder = _open_native(audio, layout)
+    except soundfile.LibsndfileError as exc:
+        logger.info(f"libsndfile can't read the audio, falling back to librosa: {exc}")
+        audio.seek(0)
+        try:
+            decoder = LibrosaDecoder(audio)
+        except Exception as fallback_exc:
+            raise ValueError(str(fallback_exc)) from fallback_exc
+
+    if mono and decoder.n_channels > 1:
+        decoder = DownmixDecoder(decoder)
+    if sample_rate is not None and sample_rate != decoder.sample_rate:
+        decoder = ResampleDecoder(decoder, sample_rate)
+    return decoder
+
+
+def _open_native(audio: IO[bytes], layout: Optional[WavLayout]) -> AudioDecoder:
+    if layout is not None and layout.n_samples:
+        try:
+            return PcmWavDecoder(audio, layout)
+        except OSError as exc:
+            # Files without a descriptor can't be mapped, libsndfile reads them instead
+            logger.info(f"Can't map the WAV samples, decoding with libsndfile: {exc}")
+            audio.seek(0)
+    return SoundfileDecoder(audio)
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from io import BytesIO
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import QuadMesh
+from matplotlib.figure import Figure
+
+# Layouts remembered per template, they only differ by tick labels and title height
+_MAX_CACHED_LAYOUTS = 32
+# Templates kept per process, each holds its figure and Agg buffer
+_MAX_CACHED_TEMPLATES = 8
+
+_SUBPLOT_PARAMS = ("left", "right", "bottom", "top", "wspace", "hspace")
+
+TemplateKey = Tuple[int, Tuple[float, float]]
+
+_templates: OrderedDict[TemplateKey, "FigureTemplate"] = OrderedDict()
+_templates_lock = Lock()
+
+
+class FigureTemplate:
+    """Pre-built spectrogram figure that's reused for every render with the same layout.
+
+    The figure, axes, labels and titles are created once. A render only swaps the
+    spectrogram meshes and the title, then redraws. ``tight_layout`` runs only when the
+    tick labels or the title height change, otherwise the cached subplot params are
+    applied, so the output is the same as that of a freshly built figure.
+    """
+
+    def __init__(self, n_channels: int, figsize: Tuple[float, float]):
+        self._lock = Lock()
+        self._figure = Figure(figsize=figsize)
+        self._canvas = FigureCanvasAgg(self._figure)
+        self._axes: List[Axes] = list(
+            np.atleast_1d(self._figure.subplots(n_channels, 1))
+        )
+
+        for ch, ax in enumerate(self._axes):
+            ax.set(
+                ylabel="Frequency [Hz]",
+                xlabel="Time [s]",
+                title=f"Channel {ch + 1}",
+            )
+
+        self._suptitle = self._figure.suptitle("", fontsize=16)
+        self._default_params = self._subplot_params()
+        self._layouts: OrderedDict[Tuple, Dict[str, float]] = OrderedDict()
+
+    def render(
+        self,
+        f: np.ndarray,
+        t: np.ndarray,
+        db: Sequence[np.ndarray],
+        title: str,
+        colormap: str = "viridis",
+    ) -> bytes:
+        """Render one ``(n_freqs, n_frames)`` dB matrix per channel as PNG bytes."""
+        with self._lock:
+            # Layout is computed from the default positions, same as in a fresh figure
+            self._figure.subplots_adjust(**self._default_params)
+
+            meshes: List[QuadMesh] = []
+            try:
+                for ax, channel_db in zip(self._axes, db):
+                    # Drop the limits of the previous render's data
+                    ax.ignore_existing_data_limits = True
+                    meshes.append(
+                        ax.pcolormesh(
+                            t, f, channel_db, shading="gouraud", cmap=colormap
+                        )
+                    )
+
+                self._suptitle.set_text(title)
+                self._apply_layout()
+
+                buf = BytesIO()
+                self._figure.savefig(buf, format="png")
+            finally:
+                # Don't keep the spectrogram data alive between renders
+                for mesh in meshes:
+                    mesh.remove()
+
+        return buf.getvalue()
+
+    def _apply_layout(self) -> None:
+        key = self._layout_key()
+        params = self._layouts.get(key)
+
+        if params is None:
+            self._figure.tight_layout()
+            self._layouts[key] = self._subplot_params()
+            if len(self._layouts) > _MAX_CACHED_LAYOUTS:
+                self._layouts.popitem(last=False)
+        else:
+            self._layouts.move_to_end(key)
+            self._figure.subplots_adjust(**params)
+
+    def _layout_key(self) -> Tuple:
+        """Everything ``tight_layout`` depends on that changes between renders."""
+        ticks = tuple(
+            (
+                tuple(
+                    ax.xaxis.get_major_formatter().format_ticks(list(ax.get_xticks()))
+                ),
+                tuple(
+                    ax.yaxis.get_major_formatter().format_ticks(list(ax.get_yticks()))
+                ),
+            )
+            for ax in self._axes
+        )
+        title_height = self._suptitle.get_window_extent(
+            self._canvas.get_renderer()
+        ).height
+        return ticks, title_height
+
+    def _subplot_params(self) -> Dict[str, float]:
+        return {
+            name: getattr(self._figure.subplotpars, name) for name in _SUBPLOT_PARAMS
+        }
+
+
+def get_figure_template(
+    n_channels: int, figsize: Tuple[float, float]
+) -> FigureTemplate:
+    """Return the figure template of this process for the channel count and size.
+
+    The least recently used template is dropped once more than
+    ``_MAX_CACHED_TEMPLATES`` are built, renders still using it finish normally.
+    """
+    key = (n_channels, figsize)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            template = _templates[key] = FigureTemplate(n_channels, figsize)
+            if len(_templates) > _MAX_CACHED_TEMPLATES:
+                _templates.popitem(last=False)
+        else:
+            _templates.move_to_end(key)
+    return template
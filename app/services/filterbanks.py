@@ -0,0 +1,84 @@
+from functools import lru_cache
+from typing import Tuple, Union
+
+import librosa
+import numpy as np
+from scipy.signal import get_window
+from scipy.sparse import csr_array
+
+from app.services.constants import FILTERBANK_CACHE_SIZE
+
+WindowSpec = Union[str, Tuple[str, float]]
+
+
+@lru_cache(maxsize=FILTERBANK_CACHE_SIZE)
+def window(spec: WindowSpec, length: int, dtype: str = "float64") -> np.ndarray:
+    """STFT window as ``scipy.signal.spectrogram`` builds it, in ``dtype``, cached per
+    process. The array is shared between callers and read-only."""
+    return _read_only(get_window(spec, length).astype(dtype, copy=False))
+
+
+@lru_cache(maxsize=FILTERBANK_CACHE_SIZE)
+def mel(
+    sr: float, n_fft: int, n_mels: int, fmin: float, fmax: float
+) -> Tuple[csr_array, np.ndarray]:
+    """Mel filterbank over the ``n_fft // 2 + 1`` bins of an STFT, and the center
+    frequency of every band, cached per process.
+
+    Most weights are zero, so the filterbank is sparse and applying it costs a product
+    per non-zero weight instead of per bin. Cached filterbanks are shared, don't modify
+    them.
+    """
+    weights = librosa.filters.mel(
+        sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=fmin, fmax=fmax, dtype=np.float32
+    )
+    centers = librosa.mel_frequencies(n_mels=n_mels + 2, fmin=fmin, fmax=fmax)[1:-1]
+    return csr_array(weights), _read_only(centers)
+
+
+@lru_cache(maxsize=FILTERBANK_CACHE_SIZE)
+def constant_q(
+    sr: float, n_fft: int, bins_per_octave: int, fmin: float, fmax: float
+) -> Tuple[csr_array, np.ndarray]:
+    """Filterbank mapping the bins of an STFT to geometrically spaced bands,
+    ``bins_per_octave`` of them per octave from ``fmin`` up to ``fmax``, and the center
+    frequency of every band. Cached per process.
+
+    This is a constant-Q approximation over STFT power, the resolution at low frequencies
+    is that of the STFT. Each band is a triangle reaching the centers of its neighbours.
+    Bands too narrow to cover an STFT bin interpolate between the two nearest bins.
+    """
+    n_bins = int(np.floor(bins_per_octave * np.log2(fmax / fmin))) + 1
+    # Neighbours of the first and last band bound their triangles
+    edges = fmin * 2.0 ** (np.arange(-1, n_bins + 1) / bins_per_octave)
+    fft_freqs = np.linspace(0, sr / 2, n_fft // 2 + 1)
+
+    weights = np.zeros((n_bins, len(fft_freqs)), dtype=np.float32)
+    for k in range(n_bins):
+        low, center, high = edges[k], edges[k + 1], edges[k + 2]
+        rising = (fft_freqs - low) / (center - low)
+        falling = (high - fft_freqs) / (high - center)
+        row = np.maximum(0, np.minimum(rising, falling))
+        if row.any():
+            weights[k] = row / row.sum()
+        else:
+            weights[k] = _interpolation_row(fft_freqs, center)
+
+    return csr_array(weights), _read_only(edges[1:-1])
+
+
+def _interpolation_row(fft_freqs: np.ndarray, freq: float) -> np.ndarray:
+    row = np.zeros(len(fft_freqs), dtype=np.float32)
+    upper = min(int(np.searchsorted(fft_freqs, freq)), len(fft_freqs) - 1)
+    lower = max(upper - 1, 0)
+    if upper == lower:
+        row[upper] = 1.0
+    else:
+        position = (freq - fft_freqs[lower]) / (fft_freqs[upper] - fft_freqs[lower])
+        row[lower], row[upper] = 1.0 - position, position
+    return row
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    array.setflags(write=False)
+    return array
@@ -0,0 +1,83 @@
+import asyncio
+from collections import deque
+from itertools import islice
+from typing import (Awaitable, Callable, Deque, Dict, Hashable, Iterable, List,
+                    Optional, Tuple, TypeVar)
+
+K = TypeVar("K", bound=Hashable)
+D = TypeVar("D")
+R = TypeVar("R")
+
+
+async def run_pipeline(
+    keys: Iterable[K],
+    download: Callable[[K], Awaitable[Optional[D]]],
+    render: Callable[[K, D], Awaitable[R]],
+    upload: Callable[[K, R], Awaitable[None]],
+    prefetch: int,
+    max_uploads: int,
+) -> Dict[K, Optional[BaseException]]:
+    """Run every key through download -> render -> upload with the stages overlapping.
+
+    The render stage handles one key at a time, up to ``prefetch`` downloads run ahead
+    of it and up to ``max_uploads`` uploads drain in the background. ``render`` should
+    hand the CPU work to an executor, otherwise it blocks the transfers of the other
+    stages. Memory stays bounded by the number of downloaded and rendered items in flight.
+
+    ``download`` returning None means there's nothing to render for that key, it counts
+    as done. Returns every key mapped to the exception it failed with, or None if it went
+    through. A failure only affects its own key.
+    """
+    if prefetch < 1 or max_uploads < 1:
+        raise ValueError("prefetch and max_uploads must be at least 1")
+
+    results: Dict[K, Optional[BaseException]] = {}
+    pending_keys = iter(keys)
+    downloads: Deque[Tuple[K, asyncio.Task[Optional[D]]]] = deque()
+    uploads: List[asyncio.Task[None]] = []
+    upload_slots = asyncio.Semaphore(max_uploads)
+
+    def start_downloads() -> None:
+        for key in islice(pending_keys, prefetch - len(downloads)):
+            downloads.append((key, asyncio.ensure_future(download(key))))
+
+    async def upload_and_release(key: K, rendered: R) -> None:
+        try:
+            await upload(key, rendered)
+        except Exception as exc:
+            results[key] = exc
+        else:
+            results[key] = None
+        finally:
+            upload_slots.release()
+
+    try:
+        start_downloads()
+        while downloads:
+            key, downloading = downloads.popleft()
+            # Refill right away, the next downloads run while this key renders
+            start_downloads()
+
+            try:
+                downloaded = await downloading
+                if downloaded is None:
+                    results[key] = None
+                    continue
+                rendered = await render(key, downloaded)
+            except Exception as exc:
+                results[key] = exc
+                continue
+
+            # Waits when uploads fall behind, rendered results don't pile up in memory
+            await upload_slots.acquire()
+            uploads.append(asyncio.create_task(upload_and_release(key, rendered)))
+
+        await asyncio.gather(*uploads)
+    finally:
+        # Only has something to do if we're cancelled or a stage raised BaseException
+        for _, downloading in downloads:
+            downloading.cancel()
+        for uploading in uploads:
+            uploading.cancel()
+
+    return results
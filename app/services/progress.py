@@ -0,0 +1,189 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set
+from uuid import UUID
+
+from pydantic import BaseModel, ValidationError
+from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_CHANNEL_PREFIX = "audio-progress:"
+# Events held per subscriber that isn't reading, the oldest are dropped past this
+_SUBSCRIBER_QUEUE_SIZE = 64
+# How long the hub waits for a message before checking again, and after Redis errors
+_READ_TIMEOUT_SECONDS = 1.0
+
+
+class ProgressEvent(BaseModel):
+    audio_id: UUID
+    stage: str
+    # Only set for the STFT stage
+    percent: Optional[float] = None
+
+
+class ProgressPublisher:
+    """Publishes the progress of audios being processed, used by workers.
+
+    Nobody might be listening, events aren't stored anywhere. Redis errors are logged and
+    otherwise ignored, progress reporting never fails a task.
+    """
+
+    def __init__(self, redis: Redis):
+        self._redis = redis
+        # Events of one audio must arrive in order, but each publish could otherwise
+        # take a different pooled connection
+        self._lock = asyncio.Lock()
+
+    async def publish(
+        self, audio_id: UUID, stage: str, percent: Optional[float] = None
+    ) -> None:
+        event = ProgressEvent(audio_id=audio_id, stage=stage, percent=percent)
+        try:
+            async with self._lock:
+                await self._redis.publish(_channel(audio_id), event.model_dump_json())
+        except RedisError as exc:
+            logger.warning(
+                f"Publishing progress of audio ID {audio_id} failed: {exc!r}"
+            )
+
+
+class ProgressHub:
+    """Fans progress events out to the subscribers of one API process.
+
+    All subscriptions share one Redis pub/sub connection, a channel is subscribed to
+    while at least one client waits on its audio. Slow subscribers lose their oldest
+    events instead of holding up the others.
+
+    Example usage:
+    async with hub.subscribe(audio_id) as events:
+        event = await events.get()
+    """
+
+    def __init__(self, redis: Redis):
+        self._pubsub: PubSub = redis.pubsub(ignore_subscribe_messages=True)
+        self._subscribers: Dict[str, Set[asyncio.Queue[ProgressEvent]]] = {}
+        # Keeps subscribe and unsubscribe commands in the same order as the bookkeeping
+        self._lock = asyncio.Lock()
+        self._reader: Optional[asyncio.Task[None]] = None
+
+    @asynccontextmanager
+    async def subscribe(
+        self, audio_id: UUID
+    ) -> AsyncIterator[asyncio.Queue[ProgressEvent]]:
+        channel = _channel(audio_id)
+        queue: asyncio.Queue[ProgressEvent] = asyncio.Queue(_SUBSCRIBER_QUEUE_SIZE)
+
+        async with self._lock:
+            queues = self._subscribers.setdefault(channel, set())
+            queues.add(queue)
+            try:
+                if len(queues) == 1:
+                    await self._pubsub.subscribe(channel)
+            except BaseException:
+                del self._subscribers[channel]
+                raise
+            if self._reader is None:
+                self._reader = asyncio.create_task(self._read())
+
+        try:
+            yield queue
+        finally:
+            async with self._lock:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[channel]
+                    try:
+                        await self._pubsub.unsubscribe(channel)
+                    except RedisError as exc:
+                        # Events that still arrive on the channel are dropped
+                        logger.warning(f"Unsubscribing from {channel} failed: {exc!r}")
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+        await self._pubsub.aclose()
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=_READ_TIMEOUT_SECONDS
+                )
+            except RedisError as exc:
+                # Channels are subscribed to again once the connection is back
+                logger.warning(f"Reading progress events failed: {exc!r}")
+                await asyncio.sleep(_READ_TIMEOUT_SECONDS)
+                continue
+
+            if message is not None:
+                self._dispatch(message)
+
+    def _dispatch(self, message: Dict) -> None:
+        channel = message["channel"]
+        channel = channel.decode() if isinstance(channel, bytes) else channel
+        queues = self._subscribers.get(channel)
+        if not queues:
+            return
+
+        try:
+            event = ProgressEvent.model_validate_json(message["data"])
+        except ValidationError as exc:
+            logger.warning(f"Ignoring malformed progress event: {exc!r}")
+            return
+
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+@asynccontextmanager
+async def open_progress_publisher() -> AsyncIterator[Optional[ProgressPublisher]]:
+    """Yield a progress publisher configured from settings, or None if progress events
+    are disabled. The Redis connections are closed on exit."""
+    async with _open_redis() as redis:
+        yield None if redis is None else ProgressPublisher(redis)
+
+
+@asynccontextmanager
+async def open_progress_hub() -> AsyncIterator[Optional[ProgressHub]]:
+    """Yield a progress hub configured from settings, or None if progress events are
+    disabled. The hub and its Redis connections are closed on exit."""
+    async with _open_redis() as redis:
+        if redis is None:
+            yield None
+            return
+
+        hub = ProgressHub(redis)
+        try:
+            yield hub
+        finally:
+            await hub.close()
+
+
+@asynccontextmanager
+async def _open_redis() -> AsyncIterator[Optional[Redis]]:
+    settings = get_settings()
+    if not settings.PROGRESS_EVENTS_ENABLED:
+        yield None
+        return
+
+    redis = Redis.from_url(settings.PROGRESS_REDIS_URL or settings.CELERY_BROKER_URL)
+    try:
+        yield redis
+    finally:
+        await redis.aclose()
+
+
+def _channel(audio_id: UUID) -> str:
+    return f"{_CHANNEL_PREFIX}{audio_id}"
@@ -0,0 +1,260 @@
+import struct
+import zlib
+from functools import lru_cache
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from matplotlib import colormaps
+
+# Same size matplotlib produces for figsize=(10, 4) per channel at the default 100 dpi
+CHANNEL_WIDTH_PX = 1000
+CHANNEL_HEIGHT_PX = 400
+
+# Margins around each channel plot in annotated mode
+_TITLE_HEIGHT_PX = 30
+_MARGIN_LEFT_PX = 75
+_MARGIN_RIGHT_PX = 20
+_MARGIN_TOP_PX = 25
+_MARGIN_BOTTOM_PX = 40
+# Below this share of a channel band the margins shrink with the image
+_MIN_PLOT_FRACTION = 0.5
+_TICK_COUNT = 6
+_TICK_LENGTH_PX = 4
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_WHITE = 255
+_BLACK = (0, 0, 0)
+
+
+class _Margins(NamedTuple):
+    title: int
+    left: int
+    right: int
+    top: int
+    bottom: int
+
+
+def _margins(width: int, channel_height: int) -> _Margins:
+    """Margins of the annotated mode for bands of ``width`` x ``channel_height``.
+
+    Small images keep at least ``_MIN_PLOT_FRACTION`` of each band for the plot by
+    scaling the margins down, the labels then overlap but the plot never goes empty.
+    """
+    horizontal = _MARGIN_LEFT_PX + _MARGIN_RIGHT_PX
+    # The title counted against every channel, as if there was only one
+    vertical = _TITLE_HEIGHT_PX + _MARGIN_TOP_PX + _MARGIN_BOTTOM_PX
+    x_scale = min(1.0, width * (1 - _MIN_PLOT_FRACTION) / horizontal)
+    y_scale = min(1.0, channel_height * (1 - _MIN_PLOT_FRACTION) / vertical)
+    return _Margins(
+        title=int(_TITLE_HEIGHT_PX * y_scale),
+        left=int(_MARGIN_LEFT_PX * x_scale),
+        right=int(_MARGIN_RIGHT_PX * x_scale),
+        top=int(_MARGIN_TOP_PX * y_scale),
+        bottom=int(_MARGIN_BOTTOM_PX * y_scale),
+    )
+
+
+@lru_cache()
+def colormap_lut(name: str = "viridis") -> np.ndarray:
+    """256 x 3 uint8 RGB lookup table for a matplotlib colormap."""
+    return colormaps[name](np.linspace(0.0, 1.0, 256), bytes=True)[:, :3]
+
+
+def _interp_coords(n_in: int, n_out: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Indices and weights to linearly sample ``n_out`` pixel centres from ``n_in`` points
+    spanning the same extent, like matplotlib does when the axis limits fit the data."""
+    if n_in == 1:
+        zeros = np.zeros(n_out, dtype=np.intp)
+        return zeros, zeros, np.zeros(n_out, dtype=np.float32)
+
+    pos = (np.arange(n_out, dtype=np.float32) + 0.5) * ((n_in - 1) / n_out)
+    lo = np.minimum(pos.astype(np.intp), n_in - 2)
+    return lo, lo + 1, pos - lo
+
+
+def resample(matrix: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Bilinearly resample a ``(n_freqs, n_frames)`` matrix to ``(height, width)``.
+
+    Row 0 of the result is the highest frequency so it can be used as an image directly.
+    """
+    c0, c1, cw = _interp_coords(matrix.shape[1], width)
+    r0, r1, rw = _interp_coords(matrix.shape[0], height)
+
+    cols = matrix[:, c0] * (1 - cw) + matrix[:, c1] * cw
+    rows = cols[r0] * (1 - rw)[:, np.newaxis] + cols[r1] * rw[:, np.newaxis]
+    return rows[::-1]
+
+
+def colorize(
+    db: np.ndarray,
+    lut: np.ndarray,
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+) -> np.ndarray:
+    """Map values to RGB scaled between ``vmin`` and ``vmax``. They default to the min
+    and max of the values, same as pcolormesh's default."""
+    vmin = float(db.min()) if vmin is None else vmin
+    vmax = float(db.max()) if vmax is None else vmax
+    scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+
+    idx = db - vmin
+    idx *= scale
+    np.clip(idx, 0, 255, out=idx)
+    return lut[idx.astype(np.uint8)]
+
+
+def encode_png(rgb: np.ndarray, compress_level: int = 1) -> bytes:
+    """Encode a ``(height, width, 3)`` uint8 array as an 8 bit truecolor PNG."""
+    height, width, _ = rgb.shape
+
+    # Every scanline starts with its filter type, 0 means unfiltered
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + tag
+            + data
+            + struct.pack(">I", zlib.crc32(tag + data))
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        _PNG_SIGNATURE
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), compress_level))
+        + chunk(b"IEND", b"")
+    )
+
+
+def render_png(
+    f: np.ndarray,
+    t: np.ndarray,
+    db: Sequence[np.ndarray],
+    filename: str,
+    annotated: bool = True,
+    colormap: str = "viridis",
+    channel_size: Tuple[int, int] = (CHANNEL_WIDTH_PX, CHANNEL_HEIGHT_PX),
+) -> bytes:
+    """Render one ``(n_freqs, n_frames)`` dB matrix per channel, stacked vertically,
+    without going through matplotlib.
+
+    The matrices are resampled to the pixel grid, mapped through a colormap lookup table
+    and encoded straight to PNG. Without ``annotated`` every channel fills its whole band,
+    otherwise Pillow draws the title, channel names, ticks and axis labels on top.
+    ``channel_size`` is the ``(width, height)`` in pixels of the band of each channel.
+    """
+    lut = colormap_lut(colormap)
+    n_channels = len(db)
+    width, channel_height = channel_size
+    height = channel_height * n_channels
+
+    if not annotated:
+        canvas = np.empty((height, width, 3), dtype=np.uint8)
+        for ch, channel_db in enumerate(db):
+            rows = slice(ch * channel_height, (ch + 1) * channel_height)
+            canvas[rows] = colorize(resample(channel_db, channel_height, width), lut)
+        return encode_png(canvas)
+
+    canvas = np.full((height, width, 3), _WHITE, dtype=np.uint8)
+    margins = _margins(width, channel_height)
+    band_height = (height - margins.title) // n_channels
+    plot_width = width - margins.left - margins.right
+    plot_height = band_height - margins.top - margins.bottom
+
+    plot_boxes = []
+    for ch, channel_db in enumerate(db):
+        left = margins.left
+        top = margins.title + ch * band_height + margins.top
+        rows = slice(top, top + plot_height)
+        cols = slice(left, left + plot_width)
+        canvas[rows, cols] = colorize(
+            resample(channel_db, plot_height, plot_width), lut
+        )
+        plot_boxes.append((left, top, plot_width, plot_height))
+
+    return encode_png(_annotate(canvas, plot_boxes, margins, f, t, filename))
+
+
+def _annotate(
+    canvas: np.ndarray,
+    plot_boxes: Sequence[Tuple[int, int, int, int]],
+    margins: _Margins,
+    f: np.ndarray,
+    t: np.ndarray,
+    filename: str,
+) -> np.ndarray:
+    # Imported here so the plain mode doesn't pay for it
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.fromarray(canvas)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=11)
+    title_font = ImageFont.load_default(size=16)
+
+    draw.text(
+        (image.width // 2, margins.title // 2),
+        filename,
+        fill=_BLACK,
+        font=title_font,
+        anchor="mm",
+    )
+
+    # Rotated once, pasted next to every channel
+    ylabel = "Frequency [Hz]"
+    ylabel_box = draw.textbbox((0, 0), ylabel, font=font)
+    ylabel_size = (int(ylabel_box[2]), int(ylabel_box[3]))
+    ylabel_image = Image.new("L", ylabel_size, _WHITE)
+    ImageDraw.Draw(ylabel_image).text((0, 0), ylabel, fill=0, font=font)
+    ylabel_image = ylabel_image.rotate(90, expand=True)
+
+    t_min, t_max = (float(t[0]), float(t[-1])) if len(t) else (0.0, 0.0)
+
+    for ch, (left, top, width, height) in enumerate(plot_boxes):
+        right, bottom = left + width - 1, top + height - 1
+
+        draw.rectangle((left - 1, top - 1, right + 1, bottom + 1), outline=_BLACK)
+        draw.text(
+            (left + width // 2, top - 4),
+            f"Channel {ch + 1}",
+            fill=_BLACK,
+            font=font,
+            anchor="md",
+        )
+
+        for frac in np.linspace(0.0, 1.0, _TICK_COUNT):
+            x = left + round(frac * (width - 1))
+            draw.line((x, bottom + 1, x, bottom + _TICK_LENGTH_PX), fill=_BLACK)
+            draw.text(
+                (x, bottom + _TICK_LENGTH_PX + 2),
+                f"{t_min + frac * (t_max - t_min):.2f}",
+                fill=_BLACK,
+                font=font,
+                anchor="mt",
+            )
+
+            y = bottom - round(frac * (height - 1))
+            draw.line((left - _TICK_LENGTH_PX, y, left - 1, y), fill=_BLACK)
+            draw.text(
+                (left - _TICK_LENGTH_PX - 2, y),
+                # Interpolated along the rows, whose frequencies aren't evenly
+                # spaced on a mel scale
+                f"{np.interp(frac * (len(f) - 1), np.arange(len(f)), f):.0f}",
+                fill=_BLACK,
+                font=font,
+                anchor="rm",
+            )
+
+        draw.text(
+            (left + width // 2, bottom + margins.bottom - 4),
+            "Time [s]",
+            fill=_BLACK,
+            font=font,
+            anchor="md",
+        )
+        image.paste(
+            ylabel_image.convert("RGB"), (2, top + (height - ylabel_image.height) // 2)
+        )
+
+    return np.asarray(image)
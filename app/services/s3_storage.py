@@ -1,24 +1,47 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from contextlib import AsyncExitStack, asynccontextmanager
-from typing import AsyncGenerator, Dict
+import math
+import socket
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from tempfile import SpooledTemporaryFile
+from typing import (Any, AsyncGenerator, AsyncIterable, AsyncIterator, Dict,
+                    List, Optional, Sequence, Tuple)
 from uuid import UUID
 
 import aioboto3
+import aiohttp
 from aiobotocore.client import AioBaseClient
+from aiobotocore.config import AioConfig
+from aiobotocore.httpsession import AIOHTTPSession
+from botocore.exceptions import ClientError
 
-from app.config import get_settings
+from app.config import Settings, get_settings
+from app.pool_stats import PoolStats
+from app.services.constants import (DOWNLOAD_SPOOL_MAX_SIZE,
+                                    PRESIGNED_UPLOAD_MULTIPART_THRESHOLD,
+                                    S3_DOWNLOAD_CHUNK_SIZE,
+                                    S3_MULTIPART_PART_SIZE)
 
 logger = logging.getLogger(__name__)
 
+# Shared by every S3 client of the process
+_pool_stats = PoolStats()
+
+
+def get_pool_stats() -> PoolStats:
+    """Connection pool use of the S3 clients of this process."""
+    return _pool_stats
+
 
 @asynccontextmanager
 async def open_s3_stores(
     *buckets: str,
 ) -> AsyncGenerator[Dict[str, S3StorageService], None]:
     """Async CM that yields a dict {bucket_name: S3StorageService}
-    and keeps all underlying clients open until exit.
+    and keeps the client they share open until exit.
 
     Example usage:
     async with open_s3_stores(AUDIO_BUCKET, SPECTROGRAM_BUCKET) as stores:
@@ -26,13 +49,56 @@ async def open_s3_stores(
         spectrogram_store = stores[SPECTROGRAM_BUCKET]
         ...
     """
-    async with AsyncExitStack() as stack:
-        stores: Dict[str, S3StorageService] = {}
-        for bucket in buckets:
-            store = await stack.enter_async_context(S3StorageService.for_bucket(bucket))
-            stores[bucket] = store
+    async with open_s3_client() as client:
+        if get_settings().S3_CHECK_BUCKETS:
+            # Check if buckets exist and there's access to them
+            await asyncio.gather(*(client.head_bucket(Bucket=b) for b in buckets))
         # `yield` keeps resources open, `return` would close them
-        yield stores
+        yield {bucket: S3StorageService(bucket, client) for bucket in buckets}
+
+
+@asynccontextmanager
+async def open_s3_client() -> AsyncGenerator[AioBaseClient, None]:
+    """Async CM that yields an S3 client configured from settings, one connection pool
+    for every bucket it's used with."""
+    settings = get_settings()
+    session = aioboto3.Session()
+
+    async with session.client(
+        service_name="s3",
+        endpoint_url=settings.S3_ENDPOINT,
+        aws_access_key_id=settings.S3_ID,
+        aws_secret_access_key=settings.S3_SECRET,
+        config=s3_client_config(settings),
+    ) as client:
+        yield client
+
+
+def s3_client_config(settings: Settings) -> AioConfig:
+    return AioConfig(
+        http_session_cls=_CountingHTTPSession,
+        max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.S3_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=settings.S3_READ_TIMEOUT_SECONDS,
+        tcp_keepalive=settings.S3_TCP_KEEPALIVE,
+        retries={
+            "max_attempts": settings.S3_MAX_ATTEMPTS,
+            "mode": settings.S3_RETRY_MODE,
+        },
+        connector_args={"keepalive_timeout": settings.S3_KEEPALIVE_TIMEOUT_SECONDS},
+    )
+
+
+@dataclass
+class PresignedUpload:
+    """Where a client uploads an object itself: one PUT of the whole object to ``url``,
+    or for a multipart upload a PUT of every ``part_size`` bytes to ``part_urls`` in
+    order, the last part being whatever is left."""
+
+    url: Optional[str] = None
+    multipart_upload_id: Optional[str] = None
+    part_size: Optional[int] = None
+    part_urls: List[str] = field(default_factory=list)
 
 
 class S3StorageService:
@@ -41,45 +107,265 @@ class S3StorageService:
         self._client = client
 
     async def store(
-        self, object_uuid: UUID, data: bytes, content_type: str = ""
+        self,
+        key: UUID | str,
+        data: bytes,
+        content_type: str = "",
+        metadata: Optional[Dict[str, str]] = None,
     ) -> None:
+        """Store ``data`` under ``key``, the UUID of the object it belongs to, or a
+        string key for objects derived from it, e.g. spectrogram tiles."""
+        extra_args = {"Metadata": metadata} if metadata else {}
         await self._client.put_object(
             Bucket=self._bucket_name,
-            Key=str(object_uuid),
+            Key=str(key),
             Body=data,
             ContentType=content_type,
+            **extra_args,
         )
 
-    async def retrieve(self, object_uuid: UUID) -> bytes:
+    async def get_metadata(self, object_uuid: UUID) -> Optional[Dict[str, str]]:
+        """User metadata of the object, or None if the object doesn't exist."""
+        try:
+            resp = await self._client.head_object(
+                Bucket=self._bucket_name, Key=str(object_uuid)
+            )
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return resp.get("Metadata", {})
+
+    async def delete(self, object_uuid: UUID) -> None:
+        await self._client.delete_object(Bucket=self._bucket_name, Key=str(object_uuid))
+
+    async def store_stream(
+        self,
+        object_uuid: UUID,
+        chunks: AsyncIterable[bytes],
+        content_type: str = "",
+        part_size: int = S3_MULTIPART_PART_SIZE,
+    ) -> None:
+        """Store an object from an async stream of chunks using a multipart upload.
+
+        Chunks are coalesced into parts of ``part_size`` bytes, so memory use is bounded by
+        one part no matter how big the object is. If anything goes wrong the multipart
+        upload is aborted, which makes S3 discard the parts uploaded so far.
+        """
+        key = str(object_uuid)
+
+        upload = await self._client.create_multipart_upload(
+            Bucket=self._bucket_name, Key=key, ContentType=content_type
+        )
+        upload_id = upload["UploadId"]
+        parts: List[Dict[str, Any]] = []
+
+        async def upload_part(body: bytes) -> None:
+            part_number = len(parts) + 1
+            resp = await self._client.upload_part(
+                Bucket=self._bucket_name,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=body,
+            )
+            parts.append({"ETag": resp["ETag"], "PartNumber": part_number})
+
+        try:
+            buffer = bytearray()
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                while len(buffer) >= part_size:
+                    await upload_part(bytes(buffer[:part_size]))
+                    del buffer[:part_size]
+
+            # Last part may be smaller than part_size. An empty stream still needs one part.
+            if buffer or not parts:
+                await upload_part(bytes(buffer))
+
+            await self._client.complete_multipart_upload(
+                Bucket=self._bucket_name,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            # BaseException so that cancelled requests don't leave orphaned parts behind either
+            logger.warning(f"Aborting multipart upload of {key} to {self._bucket_name}")
+            await self._client.abort_multipart_upload(
+                Bucket=self._bucket_name, Key=key, UploadId=upload_id
+            )
+            raise
+
+    async def presign_upload(
+        self,
+        object_uuid: UUID,
+        size: Optional[int] = None,
+        expires_in: int = 3600,
+        part_size: int = S3_MULTIPART_PART_SIZE,
+        multipart_threshold: int = PRESIGNED_UPLOAD_MULTIPART_THRESHOLD,
+    ) -> PresignedUpload:
+        """URLs a client can upload the object to without its bytes passing through
+        here, valid for ``expires_in`` seconds.
+
+        Objects of unknown ``size`` or of up to ``multipart_threshold`` bytes are
+        uploaded with a single PUT. Bigger ones are split in parts of ``part_size``
+        bytes, which must then be put together with ``complete_multipart_upload``.
+        Signing happens locally, only starting a multipart upload reaches S3.
+        """
+        key = str(object_uuid)
+        if size is None or size <= multipart_threshold:
+            url = await self._client.generate_presigned_url(
+                "put_object",
+                Params={"Bucket": self._bucket_name, "Key": key},
+                ExpiresIn=expires_in,
+            )
+            return PresignedUpload(url=url)
+
+        upload = await self._client.create_multipart_upload(
+            Bucket=self._bucket_name, Key=key
+        )
+        upload_id = upload["UploadId"]
+        part_urls = [
+            await self._client.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": self._bucket_name,
+                    "Key": key,
+                    "UploadId": upload_id,
+                    "PartNumber": part_number,
+                },
+                ExpiresIn=expires_in,
+            )
+            for part_number in range(1, math.ceil(size / part_size) + 1)
+        ]
+        return PresignedUpload(
+            multipart_upload_id=upload_id, part_size=part_size, part_urls=part_urls
+        )
+
+    async def complete_multipart_upload(
+        self, object_uuid: UUID, upload_id: str, parts: Sequence[Tuple[int, str]]
+    ) -> None:
+        """Put together the parts a client uploaded to the URLs of ``presign_upload``,
+        ``parts`` being the number and ETag of every part."""
+        await self._client.complete_multipart_upload(
+            Bucket=self._bucket_name,
+            Key=str(object_uuid),
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"ETag": etag, "PartNumber": part_number}
+                    for part_number, etag in sorted(parts)
+                ]
+            },
+        )
+
+    async def retrieve(self, key: UUID | str) -> bytes:
+        resp = await self._client.get_object(Bucket=self._bucket_name, Key=str(key))
+        async with resp["Body"] as body:
+            return await body.read()
+
+    async def retrieve_chunks(
+        self, object_uuid: UUID, chunk_size: int = S3_DOWNLOAD_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        """Yield the object in chunks of at most ``chunk_size`` bytes."""
         resp = await self._client.get_object(
             Bucket=self._bucket_name, Key=str(object_uuid)
         )
+        async with resp["Body"] as body:
+            while chunk := await body.read(chunk_size):
+                yield chunk
+
+    async def retrieve_range(self, object_uuid: UUID, start: int, end: int) -> bytes:
+        """Return bytes ``start`` to ``end`` of the object. Both ends are inclusive,
+        same as the HTTP Range header."""
+        resp = await self._client.get_object(
+            Bucket=self._bucket_name, Key=str(object_uuid), Range=f"bytes={start}-{end}"
+        )
         async with resp["Body"] as body:
             return await body.read()
 
+    async def download_to_tempfile(
+        self,
+        object_uuid: UUID,
+        chunk_size: int = S3_DOWNLOAD_CHUNK_SIZE,
+        spool_max_size: int = DOWNLOAD_SPOOL_MAX_SIZE,
+    ) -> SpooledTemporaryFile[bytes]:
+        """Download the object into a temp file rewound to the start.
+
+        The file stays in memory while it's smaller than ``spool_max_size`` and rolls over
+        to disk after that, so only one chunk at a time is held in memory for big objects.
+        The caller owns the returned file and must close it.
+        """
+        tmp: SpooledTemporaryFile[bytes] = SpooledTemporaryFile(max_size=spool_max_size)
+        try:
+            async for chunk in self.retrieve_chunks(object_uuid, chunk_size):
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            raise
+
+        tmp.seek(0)
+        return tmp
+
     @classmethod
     @asynccontextmanager
     async def for_bucket(
         cls, bucket_name: str
     ) -> AsyncGenerator[S3StorageService, None]:
-        """Example usage:
+        """Store of a single bucket with a client of its own, use ``open_s3_stores``
+        for several buckets sharing one client.
+
+        Example usage:
         from uuid import uuid4
         async with S3StorageService.for_bucket("BucketName") as store:
             uuid = uuid4()
             await store.retrieve(uuid)
         """
-        settings = get_settings()
-        client_conf = dict(
-            service_name="s3",
-            endpoint_url=settings.S3_ENDPOINT,
-            aws_access_key_id=settings.S3_ID,
-            aws_secret_access_key=settings.S3_SECRET,
-        )
+        async with open_s3_stores(bucket_name) as stores:
+            yield stores[bucket_name]
+
+
+class _CountingHTTPSession(AIOHTTPSession):
+    """aiobotocore's HTTP session, counting in ``_pool_stats`` how many requests get a
+    connection from the pool and how many of those had to open it.
+
+    Also applies botocore's socket options, e.g. ``tcp_keepalive``, which aiobotocore
+    leaves out.
+
+    Relies on private parts of aiobotocore and aiohttp, which
+    ``test_http_session_relies_on_aiobotocore_internals`` checks for.
+    """
+
+    # Set by AIOHTTPSession.__init__, which isn't annotated
+    _connector_args: Dict[str, Any]
+    _socket_options: List[Tuple[int, int, Any]]
+
+    def _create_connector(self, proxy_url: Optional[str]) -> aiohttp.TCPConnector:
+        if self._socket_options:
+            self._connector_args = {
+                **self._connector_args,
+                "socket_factory": self._open_socket,
+            }
+        connector = super()._create_connector(proxy_url)
+        connect, create_connection = connector.connect, connector._create_connection
+
+        async def counted_connect(*args: Any, **kwargs: Any) -> Any:
+            _pool_stats.checkouts += 1
+            return await connect(*args, **kwargs)
 
-        session = aioboto3.Session()
+        async def counted_create_connection(*args: Any, **kwargs: Any) -> Any:
+            # Only called by connect() when there's no idle keep-alive connection
+            _pool_stats.connects += 1
+            return await create_connection(*args, **kwargs)
 
-        async with session.client(**client_conf) as client:
-            # Check if bucket exists and there's access to it
-            await client.head_bucket(Bucket=bucket_name)
+        connector.connect = counted_connect  # type: ignore[method-assign]
+        connector._create_connection = counted_create_connection  # type: ignore[method-assign]
+        return connector
 
-            yield cls(bucket_name, client)
+    def _open_socket(self, addr_info: Any) -> socket.socket:
+        family, type_, proto, _, _ = addr_info
+        sock = socket.socket(family=family, type=type_, proto=proto)
+        for level, option, value in self._socket_options:
+            sock.setsockopt(level, option, value)
+        return sock
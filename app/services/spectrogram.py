@@ -1,57 +1,273 @@
+import hashlib
+import json
+from contextlib import closing
+from dataclasses import dataclass
 from io import BytesIO
+from typing import IO, Callable, List, Optional, Tuple
 
-import librosa
-import matplotlib
+import numpy as np
+import soundfile
+from scipy.sparse import csr_array
 
 from app.exceptions import SpectrogramGenerationError
+from app.services import filterbanks, raster
+from app.services.analysis_params import (DEFAULT_ANALYSIS_PARAMS,
+                                          AnalysisParams)
+from app.services.constants import (FAST_MODE_BANDWIDTH_MARGIN,
+                                    FAST_MODE_FRAMES_PER_COLUMN,
+                                    PROGRESS_DECODED, PROGRESS_RENDERED,
+                                    PROGRESS_STFT, PROGRESS_STFT_STEP_PERCENT,
+                                    RENDERER_MATPLOTLIB, RENDERER_RASTER,
+                                    STFT_MAX_MEMORY_BYTES, WARM_UP_SAMPLE_RATE)
+from app.services.decoders import AudioDecoder, ResampleDecoder, open_decoder
+from app.services.figure_templates import get_figure_template
+from app.services.stft import StreamingSpectrogram, frame_count
 
-# Switch the matplotlib backend to non-GUI. Must be before importing pyplot!
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.signal import spectrogram
+# Called with a progress stage and, for the STFT, the percentage done
+ProgressCallback = Callable[[str, Optional[float]], None]
+
+
+def render_params_hash(**params: object) -> str:
+    """Short, stable hash of the parameters a spectrogram is rendered with.
+
+    Stored next to every spectrogram, so it's only reused if it was rendered the same way.
+    """
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+@dataclass
+class Spectrogram:
+    """Spectrogram of every channel, ``values[ch]`` is shaped ``(len(f), len(t))``.
+    Values are in dB, or linear power if ``scale`` is "power"."""
+
+    f: np.ndarray
+    t: np.ndarray
+    values: List[np.ndarray]
+    scale: str = "db"
+
+
+def generate_spectrogram(
+    audio: bytes | IO[bytes],
+    filename: str,
+    stft_max_memory_bytes: int = STFT_MAX_MEMORY_BYTES,
+    renderer: str = RENDERER_MATPLOTLIB,
+    annotated: bool = True,
+    progress: Optional[ProgressCallback] = None,
+    params: AnalysisParams = DEFAULT_ANALYSIS_PARAMS,
+) -> bytes:
+    """Render the spectrogram of ``audio`` as PNG bytes.
+
+    ``audio`` is either the raw file contents or a seekable binary file object, the latter
+    lets callers pass a file downloaded to disk without reading it into memory first.
+    ``stft_max_memory_bytes`` caps the memory used by the STFT, see ``StreamingSpectrogram``.
 
+    ``renderer`` picks between matplotlib and the much faster ``raster`` renderer.
+    ``annotated`` only applies to the latter, without it the PNG has no title, labels nor axes.
 
-def generate_spectrogram(audio_bytes: bytes, filename: str) -> bytes:
+    ``progress`` is called after decoding, between STFT blocks and after rendering. It runs
+    on the rendering thread and should return quickly.
 
+    ``params`` are the analysis parameters picked on upload, ``params.mode`` "fast" trades
+    accuracy for speed, see ``compute_spectrogram``.
+    """
+    _check_renderer(renderer)
+
+    spectrogram = compute_spectrogram(audio, stft_max_memory_bytes, progress, params)
+    image_bytes = render_spectrogram(spectrogram, filename, renderer, annotated, params)
+
+    if progress is not None:
+        progress(PROGRESS_RENDERED, None)
+
+    return image_bytes
+
+
+def warm_up(renderer: str = RENDERER_RASTER) -> None:
+    """Render a tenth of a second of silence, so the imports, window and FFT caches
+    and figure template of a first spectrogram are ready before a task waits on them."""
+    wav = BytesIO()
+    soundfile.write(
+        wav, np.zeros(WARM_UP_SAMPLE_RATE // 10), WARM_UP_SAMPLE_RATE, format="WAV"
+    )
+    generate_spectrogram(wav.getvalue(), "warm-up", renderer=renderer)
+
+
+def compute_spectrogram(
+    audio: bytes | IO[bytes],
+    stft_max_memory_bytes: int = STFT_MAX_MEMORY_BYTES,
+    progress: Optional[ProgressCallback] = None,
+    params: AnalysisParams = DEFAULT_ANALYSIS_PARAMS,
+) -> Spectrogram:
+    """Decode ``audio`` and compute its spectrogram, for callers that do more with it
+    than render one PNG. Arguments are the same as ``generate_spectrogram``'s.
+
+    With ``params.mode`` "fast" only what the image can show is analysed. The hop grows
+    to leave about ``FAST_MODE_FRAMES_PER_COLUMN`` frames per pixel column, and mel and
+    cqt spectrograms are first resampled, anti-aliased, to just above twice their highest
+    band. The frames kept are a subset of the exact ones, of the resampled audio for
+    mel and cqt, so events shorter than the hop can fall between two of them, and the
+    bands closest to fmax lose a little power in the resampling filter. ``params.mono``
+    downmixes the channels before any of this.
+    """
     try:
-        # Load audio data without resampling nor converting to mono
-        audio_data, sample_rate = librosa.load(
-            BytesIO(audio_bytes), sr=None, mono=False
-        )
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            audio = BytesIO(audio)
+        elif not hasattr(audio, "read"):
+            raise TypeError(f"Expected bytes or a binary file, got {type(audio)}")
+
+        # By default without resampling nor converting to mono
+        decoder = open_decoder(audio, params.sample_rate, params.mono)
     except Exception as exc:
         raise SpectrogramGenerationError(f"Failed to read audio data: {exc}")
 
-    # If mono audio, reshape the audio data to (1, n) for consistency, helps keep
-    # the plotting code cleaner later on
-    if audio_data.ndim == 1:
-        audio_data = audio_data[np.newaxis, :]
+    with closing(decoder):
+        if progress is not None:
+            progress(PROGRESS_DECODED, None)
 
-    fig, axes = plt.subplots(
-        audio_data.shape[0], 1, figsize=(10, 4 * audio_data.shape[0])
-    )
+        try:
+            nperseg, noverlap = params.nperseg, params.noverlap
+            if params.mode == "fast":
+                decoder, nperseg, noverlap = _display_analysis(decoder, params)
+            engine = StreamingSpectrogram(
+                decoder.n_channels,
+                decoder.n_samples,
+                decoder.sample_rate,
+                nperseg=nperseg,
+                noverlap=noverlap,
+                max_memory_bytes=stft_max_memory_bytes,
+                window=params.scipy_window,
+            )
+        except ValueError as exc:
+            raise SpectrogramGenerationError(f"Failed to analyse audio data: {exc}")
+
+        # Decoded block by block, the decoded audio is never in memory all at once
+        reported_percent = 0.0
+        blocks = decoder.iter_blocks(engine.block_samples)
+        while True:
+            try:
+                block = next(blocks, None)
+            except Exception as exc:
+                raise SpectrogramGenerationError(f"Failed to read audio data: {exc}")
+            if block is None:
+                break
+            engine.feed(block)
 
-    if audio_data.shape[0] == 1:
-        axes = [axes]
+            # Checked once per block, which spans many frames, so this costs next to
+            # nothing
+            if progress is not None:
+                percent = engine.progress * 100
+                step = percent - reported_percent
+                if step >= PROGRESS_STFT_STEP_PERCENT or (step > 0 and percent == 100):
+                    progress(PROGRESS_STFT, percent)
+                    reported_percent = percent
 
-    for ch, ax in enumerate(axes):
+    try:
         # noinspection PyPep8Naming
-        f, t, Sxx = spectrogram(audio_data[ch], sample_rate)
-        ax.pcolormesh(t, f, 10 * np.log10(Sxx + 1e-10), shading="gouraud")
-        ax.set(
-            ylabel="Frequency [Hz]",
-            xlabel="Time [s]",
-            title=f"Channel {ch + 1}",
+        f, t, Sxx = engine.finish()
+    except ValueError as exc:
+        raise SpectrogramGenerationError(f"Failed to analyse audio data: {exc}")
+
+    values = list(Sxx)
+    if params.frequency_scale != "linear":
+        try:
+            f, filterbank = _filterbank(params, decoder.sample_rate, engine.nperseg)
+        except ValueError as exc:
+            raise SpectrogramGenerationError(f"Failed to analyse audio data: {exc}")
+        # Sparse product, only the non-zero weights of each band are multiplied
+        values = [filterbank @ channel for channel in values]
+
+    if params.scale == "db":
+        # The values belong to this call only, so they're converted where they are,
+        # memory-mapped STFT output included
+        for channel in values:
+            _power_to_db(channel)
+    return Spectrogram(f, t, values, params.scale)
+
+
+def render_spectrogram(
+    spectrogram: Spectrogram,
+    filename: str,
+    renderer: str = RENDERER_MATPLOTLIB,
+    annotated: bool = True,
+    params: AnalysisParams = DEFAULT_ANALYSIS_PARAMS,
+) -> bytes:
+    """Render a computed spectrogram as PNG bytes, see ``generate_spectrogram``."""
+    _check_renderer(renderer)
+    f, t, values = spectrogram.f, spectrogram.t, spectrogram.values
+
+    if renderer == RENDERER_RASTER:
+        return raster.render_png(
+            f,
+            t,
+            values,
+            filename,
+            annotated=annotated,
+            colormap=params.colormap,
+            channel_size=(params.width, params.height),
         )
 
-    fig.suptitle(filename, fontsize=16)
+    # Matplotlib reads the whole meshes, from memory rather than a memory-mapped file
+    values = [
+        np.array(channel) if isinstance(channel, np.memmap) else channel
+        for channel in values
+    ]
+    # Same pixel size as the raster renderer, figures are drawn at 100 dpi
+    figsize = (params.width / 100, params.height * len(values) / 100)
+    template = get_figure_template(len(values), figsize)
+    return template.render(f, t, values, filename, params.colormap)
+
+
+def _power_to_db(power: np.ndarray) -> None:
+    """Convert float32 power to dB in place, without a temporary array."""
+    np.add(power, 1e-10, out=power)
+    np.log10(power, out=power)
+    np.multiply(power, 10, out=power)
+
+
+def _filterbank(
+    params: AnalysisParams, sample_rate: float, n_fft: int
+) -> Tuple[np.ndarray, csr_array]:
+    """Center frequencies and filterbank of the mel or cqt bands, cached per process."""
+    fmin, fmax = params.band_limits(sample_rate)
+    if params.frequency_scale == "mel":
+        filterbank, f = filterbanks.mel(sample_rate, n_fft, params.n_mels, fmin, fmax)
+    else:
+        filterbank, f = filterbanks.constant_q(
+            sample_rate, n_fft, params.bins_per_octave, fmin, fmax
+        )
+    return f, filterbank
+
+
+def _display_analysis(
+    decoder: AudioDecoder, params: AnalysisParams
+) -> Tuple[AudioDecoder, int, int]:
+    """Decoder, segment length and overlap that analyse only what the image can show.
+
+    Mel and cqt bands below a fraction of the Nyquist frequency are analysed at a rate
+    divided by a whole factor, with the segment shortened by the same factor so it spans
+    the same time and its bins the same frequencies. Linear spectrograms are drawn up to
+    the Nyquist frequency, so they keep the rate of the audio.
+
+    The hop is then a whole multiple of the exact one, leaving about
+    ``FAST_MODE_FRAMES_PER_COLUMN`` frames per pixel column. Past a hop of one segment
+    the overlap turns negative and samples between frames are skipped.
+    """
+    nperseg = min(params.nperseg, decoder.n_samples)
+    noverlap = nperseg // 8 if params.noverlap is None else params.noverlap
+
+    if params.frequency_scale != "linear":
+        _, fmax = params.band_limits(decoder.sample_rate)
+        factor = int(decoder.sample_rate // (2 * fmax * FAST_MODE_BANDWIDTH_MARGIN))
+        if factor > 1:
+            decoder = ResampleDecoder(decoder, decoder.sample_rate / factor)
+            nperseg = max(1, min(round(nperseg / factor), decoder.n_samples))
+            noverlap = min(noverlap // factor, nperseg - 1)
+
+    exact_frames = frame_count(decoder.n_samples, nperseg, noverlap)
+    stride = max(1, exact_frames // (params.width * FAST_MODE_FRAMES_PER_COLUMN))
+    return decoder, nperseg, nperseg - (nperseg - noverlap) * stride
 
-    buf = BytesIO()
-    try:
-        fig.tight_layout()
-        fig.savefig(buf, format="png")
-    finally:
-        plt.close(fig)
 
-    buf.seek(0)
-    return buf.read()
+def _check_renderer(renderer: str) -> None:
+    if renderer not in (RENDERER_MATPLOTLIB, RENDERER_RASTER):
+        raise ValueError(f"Unknown spectrogram renderer {renderer}")
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import zlib
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Dict, Iterator, Sequence
+from uuid import UUID
+
+import numpy as np
+
+from app.services.s3_storage import S3StorageService
+
+# Quantized values span the dB range of the whole spectrogram over this many steps
+_UINT8_STEPS = 255
+
+
+@dataclass(frozen=True)
+class MatrixChunk:
+    channel: int
+    index: int
+    data: bytes
+
+
+def matrix_prefix(audio_id: UUID) -> str:
+    return f"{audio_id}/matrix"
+
+
+def metadata_key(audio_id: UUID) -> str:
+    """Key of the JSON document describing the matrix of an audio and its chunks."""
+    return f"{matrix_prefix(audio_id)}/metadata.json"
+
+
+def chunk_key(audio_id: UUID, channel: int, index: int) -> str:
+    """Key of one chunk, chunk ``index`` holds the frames starting at
+    ``index * chunk_frames`` of every frequency."""
+    return f"{matrix_prefix(audio_id)}/{channel}/{index}.npy"
+
+
+def build_metadata(
+    f: np.ndarray,
+    t: np.ndarray,
+    db: Sequence[np.ndarray],
+    dtype: str,
+    chunk_frames: int,
+    compression: str,
+    unit: str = "dB",
+) -> Dict[str, Any]:
+    """Everything a consumer needs to find the chunks of a time range and turn their
+    values back into ``unit``, dB or power.
+
+    Linear power spans too many decades for float16 or uint8, most of it would decode
+    as 0, so it's always stored as float32.
+    """
+    if unit == "power":
+        dtype = "float32"
+    n_freqs, n_frames = db[0].shape
+    value_min = float(min(channel.min() for channel in db))
+    value_max = float(max(channel.max() for channel in db))
+    # Named after the unit, "db_min" and "db_max" or "power_min" and "power_max"
+    prefix = unit.lower()
+    return {
+        "unit": unit,
+        "dtype": dtype,
+        "shape": [len(db), n_freqs, n_frames],
+        "chunk_frames": chunk_frames,
+        "chunks": -(-n_frames // chunk_frames),
+        "compression": compression,
+        # unit = value * scale + offset, only quantized values aren't in it already
+        "scale": (value_max - value_min) / _UINT8_STEPS if dtype == "uint8" else 1.0,
+        "offset": value_min if dtype == "uint8" else 0.0,
+        "f": f.tolist(),
+        "t_start": float(t[0]) if len(t) else 0.0,
+        # Frames are evenly spaced by the hop length
+        "t_step": float(t[1] - t[0]) if len(t) > 1 else 0.0,
+        f"{prefix}_min": value_min,
+        f"{prefix}_max": value_max,
+    }
+
+
+def iter_chunks(
+    db: Sequence[np.ndarray], metadata: Dict[str, Any]
+) -> Iterator[MatrixChunk]:
+    """Encode the chunks of every channel one at a time, as described by ``metadata``.
+
+    Each chunk is a ``.npy`` file, zlib compressed unless ``compression`` is "none".
+    Uncompressed chunks can be memory-mapped with ``np.load(mmap_mode="r")`` once
+    downloaded, or range-read straight from the store past their header.
+    """
+    chunk_frames = metadata["chunk_frames"]
+    for ch, channel_db in enumerate(db):
+        for index in range(metadata["chunks"]):
+            frames = channel_db[
+                :, slice(index * chunk_frames, (index + 1) * chunk_frames)
+            ]
+            yield MatrixChunk(ch, index, _encode(_quantize(frames, metadata), metadata))
+
+
+def decode_chunk(data: bytes, metadata: Dict[str, Any]) -> np.ndarray:
+    """Values of a stored chunk in the unit of the matrix, as float32."""
+    if metadata["compression"] == "zlib":
+        data = zlib.decompress(data)
+    values = np.load(BytesIO(data))
+    return (
+        values * np.float32(metadata["scale"]) + np.float32(metadata["offset"])
+    ).astype(np.float32, copy=False)
+
+
+def _quantize(frames: np.ndarray, metadata: Dict[str, Any]) -> np.ndarray:
+    if metadata["dtype"] == "uint8":
+        steps = (frames - metadata["offset"]) / (metadata["scale"] or 1.0)
+        return np.rint(np.clip(steps, 0, _UINT8_STEPS)).astype(np.uint8)
+    return np.ascontiguousarray(frames, dtype=metadata["dtype"])
+
+
+def _encode(values: np.ndarray, metadata: Dict[str, Any]) -> bytes:
+    buffer = BytesIO()
+    np.save(buffer, values, allow_pickle=False)
+    if metadata["compression"] == "zlib":
+        return zlib.compress(buffer.getvalue())
+    return buffer.getvalue()
+
+
+async def read_frames(
+    store: S3StorageService, audio_id: UUID, channel: int, start: int, stop: int
+) -> np.ndarray:
+    """Values of frames ``start`` to ``stop`` (exclusive) of one channel, shaped
+    ``(frequencies, frames)``. Only the chunks covering them are downloaded."""
+    metadata = json.loads(await store.retrieve(metadata_key(audio_id)))
+    n_frames = metadata["shape"][2]
+    start, stop = max(start, 0), min(stop, n_frames)
+    if start >= stop:
+        return np.empty((metadata["shape"][1], 0), dtype=np.float32)
+
+    chunk_frames = metadata["chunk_frames"]
+    first, last = start // chunk_frames, (stop - 1) // chunk_frames
+    chunks = await asyncio.gather(
+        *(
+            store.retrieve(chunk_key(audio_id, channel, index))
+            for index in range(first, last + 1)
+        )
+    )
+    frames = np.concatenate([decode_chunk(data, metadata) for data in chunks], axis=1)
+    offset = first * chunk_frames
+    return frames[:, slice(start - offset, stop - offset)]
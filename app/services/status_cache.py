@@ -0,0 +1,134 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable, Mapping, Optional, Sequence
+from uuid import UUID
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import RedisError
+
+from app.config import get_settings
+from app.models.constants import AUDIO_STATUS_DONE
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "audio-status:"
+# Cached for IDs that aren't in the DB, so polling them doesn't reach it either
+_MISSING = "-"
+
+
+class StatusCache:
+    """Audio statuses kept in Redis in front of the DB.
+
+    Readers fill the cache with ``fill`` after a miss and only set keys that don't
+    exist yet, writers overwrite with ``set``, workers with ``set_done``. A reader that loaded "pending" just
+    before a worker finished can't overwrite the "done" that the worker wrote.
+
+    Every key expires, done statuses live longest since they never change again. With
+    a ``volatile-*`` maxmemory policy Redis evicts them under memory pressure.
+
+    The cache is an optimisation only: Redis errors are logged and treated as misses.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl_seconds: int,
+        done_ttl_seconds: int,
+        missing_ttl_seconds: int,
+    ):
+        self._redis = redis
+        self._ttl_seconds = ttl_seconds
+        self._done_ttl_seconds = done_ttl_seconds
+        self._missing_ttl_seconds = missing_ttl_seconds
+
+    async def get_many(self, audio_ids: Sequence[UUID]) -> Dict[UUID, Optional[str]]:
+        """Cached statuses of the IDs that are in the cache, None for known missing
+        audio. IDs not in the cache are left out."""
+        if not audio_ids:
+            return {}
+
+        try:
+            values = await self._redis.mget([_key(audio_id) for audio_id in audio_ids])
+        except RedisError as exc:
+            logger.warning(f"Status cache read failed: {exc!r}")
+            return {}
+
+        cached: Dict[UUID, Optional[str]] = {}
+        for audio_id, value in zip(audio_ids, values):
+            if value is not None:
+                value = value.decode() if isinstance(value, bytes) else value
+                cached[audio_id] = None if value == _MISSING else value
+        return cached
+
+    async def fill(self, statuses: Mapping[UUID, Optional[str]]) -> None:
+        """Cache statuses read from the DB, None for missing audio. Keys that exist
+        already are left alone."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for audio_id, status in statuses.items():
+                pipe.set(
+                    _key(audio_id),
+                    _MISSING if status is None else status,
+                    ex=self._ttl_for(status),
+                    nx=True,
+                )
+            await self._execute(pipe)
+
+    async def set_done(self, audio_ids: Iterable[UUID]) -> None:
+        await self.set(audio_ids, AUDIO_STATUS_DONE)
+
+    async def set(self, audio_ids: Iterable[UUID], status: str) -> None:
+        """Overwrite cached statuses, right after changing them in the DB."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for audio_id in audio_ids:
+                pipe.set(_key(audio_id), status, ex=self._ttl_for(status))
+            await self._execute(pipe)
+
+    def _ttl_for(self, status: Optional[str]) -> int:
+        if status is None:
+            return self._missing_ttl_seconds
+        if status == AUDIO_STATUS_DONE:
+            return self._done_ttl_seconds
+        return self._ttl_seconds
+
+    @staticmethod
+    async def _execute(pipe: Pipeline) -> None:
+        if not len(pipe):
+            return
+        try:
+            await pipe.execute()
+        except RedisError as exc:
+            logger.warning(f"Status cache write failed: {exc!r}")
+
+
+def _key(audio_id: UUID) -> str:
+    return f"{_KEY_PREFIX}{audio_id}"
+
+
+@asynccontextmanager
+async def open_status_cache() -> AsyncIterator[Optional[StatusCache]]:
+    """Yield the status cache configured in settings, or None if it's disabled.
+    The Redis connections are closed on exit.
+
+    Example usage:
+    async with open_status_cache() as status_cache:
+        if status_cache is not None:
+            await status_cache.set_done([audio_id])
+    """
+    settings = get_settings()
+    if not settings.STATUS_CACHE_ENABLED:
+        yield None
+        return
+
+    redis = Redis.from_url(
+        settings.STATUS_CACHE_REDIS_URL or settings.CELERY_BROKER_URL
+    )
+    try:
+        yield StatusCache(
+            redis,
+            ttl_seconds=settings.STATUS_CACHE_TTL_SECONDS,
+            done_ttl_seconds=settings.STATUS_CACHE_DONE_TTL_SECONDS,
+            missing_ttl_seconds=settings.STATUS_CACHE_MISSING_TTL_SECONDS,
+        )
+    finally:
+        await redis.aclose()
@@ -0,0 +1,214 @@
+from tempfile import TemporaryFile
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import scipy.fft
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.services import filterbanks
+from app.services.constants import STFT_MAX_MEMORY_BYTES
+
+# Same defaults scipy.signal.spectrogram uses
+DEFAULT_WINDOW = ("tukey", 0.25)
+DEFAULT_NPERSEG = 256
+
+# Rough upper bound of the temporaries scipy allocates per sample of a segment
+# (detrended copy, complex windowed copy, FFT output, power, dtype casts).
+_WORK_BYTES_PER_SEGMENT_SAMPLE = 32
+# Samples of every channel transformed at once. Kept small so each step of the
+# transform finds the previous one's output still in the CPU cache.
+_TRANSFORM_BATCH_BYTES = 2 * 1024 * 1024
+
+SpectrogramResult = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# Threads each FFT runs on in this process, see set_fft_workers
+_fft_workers = 1
+
+
+def set_fft_workers(workers: int) -> None:
+    """Run the FFTs of every spectrogram computed in this process on ``workers``
+    threads. Workers size it so their processes and renders don't oversubscribe the
+    cores. pocketfft caches its plans per process, so only the threads are set here."""
+    global _fft_workers
+    if workers < 1:
+        raise ValueError("FFT workers must be at least 1")
+    _fft_workers = workers
+
+
+def frame_count(n_samples: int, nperseg: int, noverlap: int) -> int:
+    """Number of segments ``scipy.signal.spectrogram`` produces for ``n_samples``."""
+    if n_samples < nperseg:
+        return 0
+    return (n_samples - nperseg) // (nperseg - noverlap) + 1
+
+
+class StreamingSpectrogram:
+    """Block-by-block equivalent of ``scipy.signal.spectrogram`` for multichannel audio.
+
+    Samples are fed in blocks of any size. Samples that overlap the next segment are
+    carried over between blocks, so the power values are the same as those of a single
+    scipy call over the whole signal. Segments of every channel are transformed together
+    in float32, in batches sized for the CPU cache, instead of one scipy call per channel.
+
+    A negative ``noverlap`` leaves ``-noverlap`` samples out between segments, for
+    previews that don't need every sample analysed.
+
+    Memory use is bounded by ``max_memory_bytes``: the output lives in RAM if it fits in
+    half of it and is memory-mapped to an anonymous temp file otherwise, the other half
+    bounds the number of segments transformed at once.
+
+    Example usage:
+    engine = StreamingSpectrogram(n_channels, n_samples, sample_rate)
+    for block in blocks:
+        engine.feed(block)
+    f, t, Sxx = engine.finish()
+    """
+
+    def __init__(
+        self,
+        n_channels: int,
+        n_samples: int,
+        sample_rate: float,
+        nperseg: int = DEFAULT_NPERSEG,
+        noverlap: Optional[int] = None,
+        max_memory_bytes: int = STFT_MAX_MEMORY_BYTES,
+        window: filterbanks.WindowSpec = DEFAULT_WINDOW,
+    ):
+        if n_channels < 1 or n_samples < 1:
+            raise ValueError("Audio must have at least one channel and one sample")
+
+        # scipy shrinks the segment to the signal length for short signals
+        # and derives the default overlap afterwards, do the same.
+        self.nperseg = min(nperseg, n_samples)
+        self.noverlap = self.nperseg // 8 if noverlap is None else noverlap
+        if self.noverlap >= self.nperseg:
+            raise ValueError("noverlap must be less than nperseg")
+
+        self.step = self.nperseg - self.noverlap
+        # Built once instead of by scipy for every channel of every block
+        self.window = filterbanks.window(window, self.nperseg)
+        self._window = filterbanks.window(window, self.nperseg, "float32")
+        # Power spectral density scaling, as scipy computes it for float32 input
+        self._scale = 1.0 / (sample_rate * float((self._window * self._window).sum()))
+        self.n_channels = n_channels
+        self.n_samples = n_samples
+        self.sample_rate = sample_rate
+
+        self._n_frames = frame_count(n_samples, self.nperseg, self.noverlap)
+        self._n_freqs = self.nperseg // 2 + 1
+        self._frame_pos = 0
+        self._carry: np.ndarray = np.empty((n_channels, 0), dtype=np.float32)
+        # Samples of the next blocks falling between segments, only with a negative overlap
+        self._skip = 0
+
+        work_budget = max_memory_bytes // 2
+        # Every channel of a frame is transformed at once
+        frame_work_bytes = n_channels * self.nperseg * _WORK_BYTES_PER_SEGMENT_SAMPLE
+        self.block_frames = max(1, work_budget // frame_work_bytes)
+        # A hop many times the segment (fast mode's negative overlap) would otherwise
+        # ask for blocks of mostly skipped samples, which are decoded all the same
+        self._max_block_samples = max(1, work_budget // (n_channels * 4))
+        self._batch_frames = max(
+            1,
+            min(
+                self.block_frames,
+                _TRANSFORM_BATCH_BYTES // (n_channels * self.nperseg * 4),
+            ),
+        )
+
+        shape = (n_channels, self._n_freqs, self._n_frames)
+        output_bytes = int(np.prod(shape)) * np.dtype(np.float32).itemsize
+
+        self._sxx: np.ndarray
+        if output_bytes <= max_memory_bytes // 2:
+            self._sxx = np.empty(shape, dtype=np.float32)
+        else:
+            # The mapping keeps the unlinked file alive after the handle is closed
+            with TemporaryFile() as backing:
+                self._sxx = np.memmap(backing, dtype=np.float32, mode="w+", shape=shape)
+
+    @property
+    def progress(self) -> float:
+        """Fraction of the output frames computed so far, between 0 and 1."""
+        return self._frame_pos / self._n_frames if self._n_frames else 1.0
+
+    @property
+    def block_samples(self) -> int:
+        """Block size that keeps one ``feed`` call and the float32 block it's fed
+        within the memory budget."""
+        return min(self.block_frames * self.step, self._max_block_samples)
+
+    def feed(self, block: np.ndarray) -> None:
+        """Consume a ``(n_channels, n)`` block of samples following the previous one."""
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim == 1:
+            block = block[np.newaxis, :]
+        if self._skip:
+            skipped = min(self._skip, block.shape[1])
+            block = block[:, skipped:]
+            self._skip -= skipped
+
+        samples = (
+            np.concatenate((self._carry, block), axis=1)
+            if self._carry.shape[1]
+            else block
+        )
+
+        n_frames = min(
+            frame_count(samples.shape[1], self.nperseg, self.noverlap),
+            self._n_frames - self._frame_pos,
+        )
+
+        if n_frames:
+            # (n_channels, n_frames, nperseg) view of the segments, nothing is copied yet
+            windows = sliding_window_view(samples, self.nperseg, axis=-1)
+            segments = windows[:, slice(0, (n_frames - 1) * self.step + 1, self.step)]
+            for first in range(0, n_frames, self._batch_frames):
+                batch = segments[:, slice(first, first + self._batch_frames)]
+                frames = slice(self._frame_pos, self._frame_pos + batch.shape[1])
+                self._sxx[:, :, frames] = self._power_spectra(batch).transpose(0, 2, 1)
+                self._frame_pos = frames.stop
+
+        # Copy so the carry doesn't keep the whole block alive
+        consumed = n_frames * self.step
+        self._carry = samples[:, consumed:].copy()
+        self._skip += max(0, consumed - samples.shape[1])
+
+    def _power_spectra(self, segments: np.ndarray) -> np.ndarray:
+        """Power spectral density of ``segments`` on their last axis, the same steps
+        ``scipy.signal.spectrogram`` takes, in place after the detrended copy."""
+        detrended = segments - segments.mean(axis=-1, keepdims=True)
+        detrended *= self._window
+        spectra = scipy.fft.rfft(detrended, axis=-1, workers=_fft_workers)
+
+        power = np.multiply(spectra.real, spectra.real)
+        power += spectra.imag * spectra.imag
+        power *= self._scale
+        # One-sided, every bin but DC and, for even lengths, Nyquist has a mirror image
+        power[..., slice(1, None if self.nperseg % 2 else -1)] *= 2
+        return power
+
+    def finish(self) -> SpectrogramResult:
+        """Return ``(f, t, Sxx)`` shaped like scipy's, with channels on the first axis of Sxx.
+
+        If fewer samples than announced were fed, only the complete segments are returned.
+        """
+        if not self._frame_pos:
+            raise ValueError("Not enough samples were fed for a single segment")
+
+        times = np.arange(
+            self.nperseg / 2, self.n_samples - self.nperseg / 2 + 1, self.step
+        ) / float(self.sample_rate)
+
+        return (
+            scipy.fft.rfftfreq(self.nperseg, 1 / self.sample_rate),
+            times[: self._frame_pos],
+            self._sxx[..., : self._frame_pos],
+        )
+
+
+def iter_blocks(audio_data: np.ndarray, block_samples: int) -> Iterable[np.ndarray]:
+    """Split ``(n_channels, n)`` audio into views of at most ``block_samples`` samples."""
+    for start in range(0, audio_data.shape[-1], block_samples):
+        stop = start + block_samples
+        yield audio_data[..., start:stop]
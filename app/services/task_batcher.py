@@ -0,0 +1,50 @@
+import asyncio
+from typing import Callable, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class TaskBatcher(Generic[T]):
+    """Groups items into batches and hands each batch to ``send``.
+
+    A batch is sent as soon as ``max_size`` items are waiting, or ``max_wait`` seconds
+    after its first item arrived, whichever comes first. Must be used from a single
+    event loop. Items that are waiting are lost if the process dies before they're sent,
+    so ``flush`` should be called on shutdown.
+
+    Example usage:
+    batcher = TaskBatcher(lambda ids: celery_app.send_task(name, args=[ids]), 50, 0.5)
+    batcher.add(audio_id)
+    ...
+    batcher.flush()
+    """
+
+    def __init__(
+        self, send: Callable[[List[T]], object], max_size: int, max_wait: float
+    ):
+        self._send = send
+        self._max_size = max_size
+        self._max_wait = max_wait
+        self._pending: List[T] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, item: T) -> None:
+        self._pending.append(item)
+
+        if len(self._pending) >= self._max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self._max_wait, self.flush
+            )
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        self._send(batch)
@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.services import raster
+
+# Reductions used to merge pairs of cells when going one zoom level out.
+# Max keeps short loud events visible, mean is closer to what the ear hears on average.
+_POOLING: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    "max": np.maximum,
+    "mean": lambda a, b: (a + b) / 2,
+}
+
+
+@dataclass(frozen=True)
+class Tile:
+    channel: int
+    zoom: int
+    x: int
+    y: int
+    png: bytes
+
+
+def tiles_prefix(audio_id: UUID) -> str:
+    return f"{audio_id}/tiles"
+
+
+def manifest_key(audio_id: UUID) -> str:
+    """Key of the JSON document describing the pyramid of an audio."""
+    return f"{tiles_prefix(audio_id)}/manifest.json"
+
+
+def tile_key(audio_id: UUID, channel: int, zoom: int, x: int, y: int) -> str:
+    """Key of one tile. ``x`` counts tiles from the start of the audio, ``y`` from the
+    highest frequency, ``zoom`` 0 is the whole spectrogram in a single tile."""
+    return f"{tiles_prefix(audio_id)}/{channel}/{zoom}/{x}/{y}.png"
+
+
+def downsample(matrix: np.ndarray, tile_size: int, pooling: str) -> np.ndarray:
+    """Halve every axis of ``matrix`` that is still longer than a tile by pooling
+    neighbouring pairs. An odd last cell is pooled with itself."""
+    reduce = _POOLING[pooling]
+    for axis in (0, 1):
+        if matrix.shape[axis] <= tile_size:
+            continue
+        if matrix.shape[axis] % 2:
+            pad = [(0, 0), (0, 0)]
+            pad[axis] = (0, 1)
+            matrix = np.pad(matrix, pad, mode="edge")
+
+        even = [slice(None), slice(None)]
+        odd = [slice(None), slice(None)]
+        even[axis] = slice(0, None, 2)
+        odd[axis] = slice(1, None, 2)
+        matrix = reduce(matrix[tuple(even)], matrix[tuple(odd)])
+    return matrix
+
+
+def zoom_levels(shape: Tuple[int, int], tile_size: int) -> int:
+    """Number of zoom levels needed until the whole matrix fits in one tile."""
+    levels = 1
+    for length in shape:
+        axis_levels = 1
+        while length > tile_size:
+            length = (length + 1) // 2
+            axis_levels += 1
+        levels = max(levels, axis_levels)
+    return levels
+
+
+def build_manifest(
+    f: np.ndarray,
+    t: np.ndarray,
+    db: Sequence[np.ndarray],
+    tile_size: int,
+    pooling: str,
+) -> Dict[str, Any]:
+    """Everything a viewer needs to lay out the tiles and label the axes."""
+    n_freqs, n_frames = db[0].shape
+    return {
+        "tile_size": tile_size,
+        "zoom_levels": zoom_levels((n_freqs, n_frames), tile_size),
+        "channels": len(db),
+        "frequencies": n_freqs,
+        "frames": n_frames,
+        "f_min": float(f[0]),
+        "f_max": float(f[-1]),
+        "t_min": float(t[0]) if len(t) else 0.0,
+        "t_max": float(t[-1]) if len(t) else 0.0,
+        "db_min": float(min(channel.min() for channel in db)),
+        "db_max": float(max(channel.max() for channel in db)),
+        "pooling": pooling,
+    }
+
+
+def iter_tile_batches(
+    db: Sequence[np.ndarray],
+    tile_size: int,
+    pooling: str,
+    batch_size: int,
+    colormap: str = "viridis",
+) -> Iterator[List[Tile]]:
+    """Render the pyramid of every channel, most detailed zoom level first, in batches of
+    at most ``batch_size`` tiles.
+
+    Each level is pooled from the previous one, so the STFT output is only read once and
+    at most two levels of one channel are in memory. All tiles share the same colour
+    scale, so neighbours and zoom levels match.
+    """
+    lut = raster.colormap_lut(colormap)
+    vmin = float(min(channel.min() for channel in db))
+    vmax = float(max(channel.max() for channel in db))
+
+    batch: List[Tile] = []
+    for ch, channel_db in enumerate(db):
+        # Row 0 of an image is its top, so the highest frequency goes first
+        level = np.asarray(channel_db, dtype=np.float32)[::-1]
+        zoom = zoom_levels((level.shape[0], level.shape[1]), tile_size) - 1
+
+        while True:
+            n_rows, n_cols = level.shape
+            for y, top in enumerate(range(0, n_rows, tile_size)):
+                for x, left in enumerate(range(0, n_cols, tile_size)):
+                    cells = level[
+                        slice(top, top + tile_size), slice(left, left + tile_size)
+                    ]
+                    png = raster.encode_png(raster.colorize(cells, lut, vmin, vmax))
+                    batch.append(Tile(ch, zoom, x, y, png))
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+
+            if zoom == 0:
+                break
+            level = downsample(level, tile_size, pooling)
+            zoom -= 1
+
+    if batch:
+        yield batch
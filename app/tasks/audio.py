@@ -1,15 +1,42 @@
 import asyncio
+import json
 import logging
+import os
+import shutil
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, replace
+from itertools import islice
 from mimetypes import types_map
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+from typing import IO, Dict, Iterator, List, Optional, Tuple, cast
 from uuid import UUID
 
+import numpy as np
 from botocore.exceptions import ClientError
 
-from app.celery_app import celery_app, get_audio_store, get_spectrogram_store
+from app.celery_app import (celery_app, discard_render_executor,
+                            get_audio_store, get_progress_publisher,
+                            get_render_executor, get_render_slots,
+                            get_spectrogram_store, get_status_cache,
+                            get_worker_runtime)
+from app.config import get_settings
 from app.db import scoped_session
-from app.events import AUDIO_UPLOADED
+from app.events import AUDIO_UPLOADED, AUDIO_UPLOADED_BATCH
 from app.repositories.audio import AudioRepository
-from app.services.spectrogram import generate_spectrogram
+from app.services import spectrogram_matrix
+from app.services.analysis_params import (DEFAULT_ANALYSIS_PARAMS,
+                                          AnalysisParams)
+from app.services.constants import (PROGRESS_DONE, PROGRESS_DOWNLOADED,
+                                    PROGRESS_RENDERED, PROGRESS_STORED,
+                                    RENDER_PARAMS_METADATA_KEY,
+                                    TILE_BATCH_SIZE)
+from app.services.pipeline import run_pipeline
+from app.services.spectrogram import (ProgressCallback, Spectrogram,
+                                      compute_spectrogram,
+                                      generate_spectrogram, render_params_hash,
+                                      render_spectrogram)
+from app.services.tiles import (build_manifest, iter_tile_batches,
+                                manifest_key, tile_key)
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +48,82 @@ logger = logging.getLogger(__name__)
     max_retries=5,
 )
 def handle_audio_uploaded(audio_id: UUID) -> None:
-    asyncio.get_event_loop().run_until_complete(_handle_audio_uploaded_async(audio_id))
+    get_worker_runtime().run(_handle_audio_uploaded_async(audio_id))
+
+
+@celery_app.task(
+    name=AUDIO_UPLOADED_BATCH,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def handle_audio_uploaded_batch(audio_ids: List[UUID]) -> None:
+    get_worker_runtime().run(_handle_audio_uploaded_batch_async(audio_ids))
+
+
+@dataclass(frozen=True)
+class _RenderOptions:
+    renderer: str
+    annotated: bool
+    stft_max_memory_bytes: int
+    params_hash: str
+    tiles: bool = False
+    tile_size: int = 0
+    tile_pooling: str = ""
+    matrix: bool = False
+    matrix_dtype: str = ""
+    matrix_chunk_frames: int = 0
+    matrix_compression: str = ""
+    analysis: AnalysisParams = DEFAULT_ANALYSIS_PARAMS
+
+    @classmethod
+    def from_settings(
+        cls, analysis: AnalysisParams = DEFAULT_ANALYSIS_PARAMS
+    ) -> "_RenderOptions":
+        settings = get_settings()
+        params: Dict[str, object] = dict(
+            renderer=settings.SPECTROGRAM_RENDERER,
+            annotated=settings.SPECTROGRAM_ANNOTATED,
+        )
+        if settings.SPECTROGRAM_TILES_ENABLED:
+            # Extra outputs are only hashed when enabled, so spectrograms rendered
+            # without them stay reusable
+            params["tiles"] = [
+                settings.SPECTROGRAM_TILE_SIZE,
+                settings.SPECTROGRAM_TILE_POOLING,
+            ]
+        if analysis != DEFAULT_ANALYSIS_PARAMS:
+            params["analysis"] = analysis.params_hash()
+        if settings.SPECTROGRAM_MATRIX_ENABLED:
+            params["matrix"] = [
+                settings.SPECTROGRAM_MATRIX_DTYPE,
+                settings.SPECTROGRAM_MATRIX_CHUNK_FRAMES,
+                settings.SPECTROGRAM_MATRIX_COMPRESSION,
+            ]
+
+        return cls(
+            renderer=settings.SPECTROGRAM_RENDERER,
+            annotated=settings.SPECTROGRAM_ANNOTATED,
+            stft_max_memory_bytes=settings.STFT_MAX_MEMORY_BYTES,
+            params_hash=render_params_hash(**params),
+            tiles=settings.SPECTROGRAM_TILES_ENABLED,
+            tile_size=settings.SPECTROGRAM_TILE_SIZE,
+            tile_pooling=settings.SPECTROGRAM_TILE_POOLING,
+            matrix=settings.SPECTROGRAM_MATRIX_ENABLED,
+            matrix_dtype=settings.SPECTROGRAM_MATRIX_DTYPE,
+            matrix_chunk_frames=settings.SPECTROGRAM_MATRIX_CHUNK_FRAMES,
+            matrix_compression=settings.SPECTROGRAM_MATRIX_COMPRESSION,
+            analysis=analysis,
+        )
+
+
+@dataclass
+class _Rendered:
+    image_bytes: bytes
+    # Kept to build tiles and the matrix export from, only when they're enabled
+    spectrogram: Optional[Spectrogram] = None
+    # .npy file holding the spectrogram values, when a render process left them there
+    values_path: Optional[str] = None
 
 
 async def _handle_audio_uploaded_async(audio_id: UUID) -> None:
@@ -39,21 +141,393 @@ async def _handle_audio_uploaded_async(audio_id: UUID) -> None:
 
         logger.info(f"[WORKER] Handling audio ID {audio_id}, filename {filename}")
 
-        try:
-            audio_bytes = await get_audio_store().retrieve(audio_id)
-        except ClientError as exc:
-            if exc.response["Error"]["Code"] == "NoSuchKey":
-                logger.fatal(
-                    f"[WORKER] Audio with ID {audio_id} was not found in store but worker got a task to process it"
-                )
-            raise
-
-        image_bytes = generate_spectrogram(audio_bytes, filename)
+        options = _RenderOptions.from_settings(
+            AnalysisParams.model_validate(audio.params)
+        )
 
-        await get_spectrogram_store().store(audio_id, image_bytes, types_map[".png"])
+        audio_file = await _download_unless_rendered(
+            audio_id, audio.object_key, options
+        )
+        if audio_file is not None:
+            rendered = await _render_off_loop(audio_id, audio_file, filename, options)
+            await _store_spectrogram(audio_id, rendered, options)
 
         await repo.mark_done(audio_id)
+        await _write_through_done([audio_id])
 
         logger.info(
             f"[WORKER] Finished handling audio ID {audio_id}, filename {filename}"
         )
+
+
+async def _handle_audio_uploaded_batch_async(audio_ids: List[UUID]) -> None:
+    """Process many audios in one task: one query to fetch them, one UPDATE to mark
+    them done, and in between a pipeline where the next downloads and the previous
+    uploads run while an audio renders.
+
+    Audios that fail are handed to single-audio tasks, which retry them on their own,
+    so one bad file doesn't make the whole batch retry.
+    """
+    # IDs arrive as strings after going through the broker
+    audio_ids = [UUID(str(audio_id)) for audio_id in audio_ids]
+    settings = get_settings()
+
+    async with scoped_session() as session:
+        repo = AudioRepository(session)
+        # Read before anything commits, which expires the loaded instances
+        audios: Dict[UUID, Tuple[str, UUID, _RenderOptions]] = {
+            audio.id: (
+                audio.filename,
+                audio.object_key,
+                _RenderOptions.from_settings(
+                    AnalysisParams.model_validate(audio.params)
+                ),
+            )
+            for audio in await repo.get_many(audio_ids)
+            if audio.id is not None
+        }
+
+        for audio_id in audio_ids:
+            if audio_id not in audios:
+                logger.warning(f"[WORKER] Audio with ID {audio_id} was not found")
+
+        found_ids = [audio_id for audio_id in audio_ids if audio_id in audios]
+        logger.info(f"[WORKER] Handling batch of {len(found_ids)} audio IDs")
+
+        async def download(audio_id: UUID) -> Optional[SpooledTemporaryFile[bytes]]:
+            _, object_key, options = audios[audio_id]
+            return await _download_unless_rendered(audio_id, object_key, options)
+
+        async def render(
+            audio_id: UUID, audio_file: SpooledTemporaryFile[bytes]
+        ) -> _Rendered:
+            filename, _, options = audios[audio_id]
+            return await _render_off_loop(audio_id, audio_file, filename, options)
+
+        async def upload(audio_id: UUID, rendered: _Rendered) -> None:
+            await _store_spectrogram(audio_id, rendered, audios[audio_id][2])
+
+        results = await run_pipeline(
+            found_ids,
+            download,
+            render,
+            upload,
+            prefetch=settings.WORKER_PIPELINE_PREFETCH,
+            max_uploads=settings.BATCH_IO_CONCURRENCY,
+        )
+
+        done = [audio_id for audio_id in found_ids if results[audio_id] is None]
+        failed = [audio_id for audio_id in found_ids if results[audio_id] is not None]
+        for audio_id in failed:
+            _log_failure(audio_id, cast(BaseException, results[audio_id]))
+
+        await repo.mark_many_done(done)
+        await _write_through_done(done)
+
+    for audio_id in failed:
+        celery_app.send_task(AUDIO_UPLOADED, args=[audio_id])
+
+    logger.info(
+        f"[WORKER] Finished batch, {len(done)} done, {len(failed)} handed to single tasks"
+    )
+
+
+async def _download_unless_rendered(
+    audio_id: UUID, object_key: UUID, options: _RenderOptions
+) -> Optional[SpooledTemporaryFile[bytes]]:
+    """Download the audio file stored under ``object_key``, or return None if the
+    spectrogram of the audio doesn't need rendering."""
+
+    # Uploads are deduplicated by content and params, so a spectrogram stored for this audio
+    # with the same parameters is exactly what we'd render. Happens on retries too.
+    metadata = await get_spectrogram_store().get_metadata(audio_id)
+    if metadata and metadata.get(RENDER_PARAMS_METADATA_KEY) == options.params_hash:
+        logger.info(f"[WORKER] Reusing existing spectrogram for audio ID {audio_id}")
+        return None
+
+    try:
+        # Spooled to a temp file so big objects don't have to fit in memory
+        audio_file = await get_audio_store().download_to_tempfile(object_key)
+    except ClientError as exc:
+        if exc.response["Error"]["Code"] == "NoSuchKey":
+            logger.fatal(
+                f"[WORKER] Audio with ID {audio_id} was not found in store but worker got a task to process it"
+            )
+        raise
+
+    await _publish_progress(audio_id, PROGRESS_DOWNLOADED)
+    return audio_file
+
+
+async def _render_off_loop(
+    audio_id: UUID,
+    audio_file: SpooledTemporaryFile[bytes],
+    filename: str,
+    options: _RenderOptions,
+) -> _Rendered:
+    """Render in the render executor so the event loop keeps S3 transfers going.
+    Closes ``audio_file``.
+
+    Renders of concurrent tasks wait for a render slot on the loop, so they don't read
+    their audio into memory before the executor can take them.
+    """
+    loop = asyncio.get_running_loop()
+    publisher = get_progress_publisher()
+    progress: Optional[ProgressCallback] = None
+
+    with audio_file:
+        async with get_render_slots():
+            if get_settings().WORKER_RENDER_EXECUTOR == "process":
+                return await _render_in_process(audio_file, filename, options)
+
+            if publisher is not None:
+
+                def publish_from_thread(stage: str, percent: Optional[float]) -> None:
+                    # Runs on the render thread, hands the publish to the loop without
+                    # waiting
+                    asyncio.run_coroutine_threadsafe(
+                        publisher.publish(audio_id, stage, percent), loop
+                    )
+
+                progress = publish_from_thread
+
+            return await loop.run_in_executor(
+                get_render_executor(), _render, audio_file, filename, options, progress
+            )
+
+
+async def _render_in_process(
+    audio_file: IO[bytes], filename: str, options: _RenderOptions
+) -> _Rendered:
+    """Render in a process of the render executor, which opens a copy of ``audio_file``
+    on disk by path.
+
+    Open files can't be sent to another process, and neither can a callback publishing
+    on this loop, so there's no progress from inside the render. The spectrogram kept
+    for tiles and the matrix export comes back the same way, memory-mapped from a file
+    the render process wrote, instead of pickled whole. A pool broken by a render
+    process dying, killed for memory for instance, is replaced for the next renders.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_render_executor()
+
+    with NamedTemporaryFile() as audio_copy:
+        await asyncio.to_thread(shutil.copyfileobj, audio_file, audio_copy)
+        audio_copy.flush()
+        try:
+            rendered = await loop.run_in_executor(
+                executor, _render_path, audio_copy.name, filename, options
+            )
+        except BrokenProcessPool:
+            discard_render_executor(executor)
+            raise
+
+    if rendered.spectrogram is not None and rendered.values_path is not None:
+        rendered.spectrogram.values = _load_values(rendered.values_path)
+    return rendered
+
+
+def _render_path(path: str, filename: str, options: _RenderOptions) -> _Rendered:
+    with open(path, "rb") as audio:
+        rendered = _render(audio, filename, options)
+
+    if rendered.spectrogram is None:
+        return rendered
+    return _spill_values(rendered)
+
+
+def _spill_values(rendered: _Rendered) -> _Rendered:
+    """Move the spectrogram values of ``rendered`` to a .npy temp file, which is
+    returned by path. Written channel by channel, memory-mapped values stay on disk."""
+    spectrogram = cast(Spectrogram, rendered.spectrogram)
+    with NamedTemporaryFile(suffix=".npy", delete=False) as spill:
+        path = spill.name
+
+    try:
+        shape = (len(spectrogram.values), *spectrogram.values[0].shape)
+        values = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float32, shape=shape
+        )
+        for ch, channel in enumerate(spectrogram.values):
+            values[ch] = channel
+        values.flush()
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    return _Rendered(
+        rendered.image_bytes, replace(spectrogram, values=[]), values_path=path
+    )
+
+
+def _load_values(path: str) -> List[np.ndarray]:
+    """Memory-map the values ``_spill_values`` wrote and delete their file."""
+    try:
+        return list(np.load(path, mmap_mode="r"))
+    finally:
+        # The mapping keeps the unlinked file alive
+        os.unlink(path)
+
+
+def _render(
+    audio: bytes | IO[bytes],
+    filename: str,
+    options: _RenderOptions,
+    progress: Optional[ProgressCallback] = None,
+) -> _Rendered:
+    if not (options.tiles or options.matrix):
+        return _Rendered(
+            generate_spectrogram(
+                audio,
+                filename,
+                stft_max_memory_bytes=options.stft_max_memory_bytes,
+                renderer=options.renderer,
+                annotated=options.annotated,
+                progress=progress,
+                params=options.analysis,
+            )
+        )
+
+    # The STFT is computed once for the image and the extra outputs
+    spectrogram = compute_spectrogram(
+        audio, options.stft_max_memory_bytes, progress, options.analysis
+    )
+    image_bytes = render_spectrogram(
+        spectrogram, filename, options.renderer, options.annotated, options.analysis
+    )
+    if progress is not None:
+        progress(PROGRESS_RENDERED, None)
+    return _Rendered(image_bytes, spectrogram)
+
+
+async def _store_spectrogram(
+    audio_id: UUID, rendered: _Rendered, options: _RenderOptions
+) -> None:
+    if rendered.spectrogram is not None:
+        if options.tiles:
+            await _store_tiles(audio_id, rendered.spectrogram, options)
+        if options.matrix:
+            await _store_matrix(audio_id, rendered.spectrogram, options)
+
+    # Stored last, its metadata is what tells a retry that everything is in place
+    await get_spectrogram_store().store(
+        audio_id,
+        rendered.image_bytes,
+        types_map[".png"],
+        metadata={RENDER_PARAMS_METADATA_KEY: options.params_hash},
+    )
+    await _publish_progress(audio_id, PROGRESS_STORED)
+
+
+async def _store_tiles(
+    audio_id: UUID, spectrogram: Spectrogram, options: _RenderOptions
+) -> None:
+    batches = iter_tile_batches(
+        spectrogram.values,
+        options.tile_size,
+        options.tile_pooling,
+        TILE_BATCH_SIZE,
+        colormap=options.analysis.colormap,
+    )
+    await _encode_and_upload(
+        [
+            (
+                tile_key(audio_id, tile.channel, tile.zoom, tile.x, tile.y),
+                tile.png,
+                types_map[".png"],
+            )
+            for tile in batch
+        ]
+        for batch in batches
+    )
+
+    manifest = build_manifest(
+        spectrogram.f,
+        spectrogram.t,
+        spectrogram.values,
+        options.tile_size,
+        options.tile_pooling,
+    )
+    await get_spectrogram_store().store(
+        manifest_key(audio_id), json.dumps(manifest).encode(), types_map[".json"]
+    )
+
+
+async def _store_matrix(
+    audio_id: UUID, spectrogram: Spectrogram, options: _RenderOptions
+) -> None:
+    metadata = spectrogram_matrix.build_metadata(
+        spectrogram.f,
+        spectrogram.t,
+        spectrogram.values,
+        options.matrix_dtype,
+        options.matrix_chunk_frames,
+        options.matrix_compression,
+        unit="dB" if spectrogram.scale == "db" else "power",
+    )
+    chunks = spectrogram_matrix.iter_chunks(spectrogram.values, metadata)
+    batch_size = get_settings().BATCH_IO_CONCURRENCY
+    await _encode_and_upload(
+        [
+            (
+                spectrogram_matrix.chunk_key(audio_id, chunk.channel, chunk.index),
+                chunk.data,
+                "application/octet-stream",
+            )
+            for chunk in batch
+        ]
+        for batch in iter(lambda: list(islice(chunks, batch_size)), [])
+    )
+
+    await get_spectrogram_store().store(
+        spectrogram_matrix.metadata_key(audio_id),
+        json.dumps(metadata).encode(),
+        types_map[".json"],
+    )
+
+
+async def _encode_and_upload(batches: Iterator[List[Tuple[str, bytes, str]]]) -> None:
+    """Upload batches of ``(key, data, content type)`` to the spectrogram store. Batches
+    are produced in the render executor, the next one while the previous one uploads."""
+    store = get_spectrogram_store()
+    loop = asyncio.get_running_loop()
+    # A generator can't be sent to another process, the default thread pool runs it then
+    executor = (
+        None
+        if get_settings().WORKER_RENDER_EXECUTOR == "process"
+        else get_render_executor()
+    )
+    upload_slots = asyncio.Semaphore(get_settings().BATCH_IO_CONCURRENCY)
+
+    async def upload(key: str, data: bytes, content_type: str) -> None:
+        async with upload_slots:
+            await store.store(key, data, content_type)
+
+    encoding = loop.run_in_executor(executor, next, batches, None)
+    while (batch := await encoding) is not None:
+        encoding = loop.run_in_executor(executor, next, batches, None)
+        await asyncio.gather(*(upload(*item) for item in batch))
+
+
+async def _write_through_done(audio_ids: List[UUID]) -> None:
+    """Update cached statuses right away so pollers don't wait for them to expire,
+    and tell clients streaming progress events."""
+    status_cache = get_status_cache()
+    if status_cache is not None:
+        await status_cache.set_done(audio_ids)
+
+    for audio_id in audio_ids:
+        await _publish_progress(audio_id, PROGRESS_DONE)
+
+
+async def _publish_progress(audio_id: UUID, stage: str) -> None:
+    publisher = get_progress_publisher()
+    if publisher is not None:
+        await publisher.publish(audio_id, stage)
+
+
+def _log_failure(audio_id: UUID, exc: BaseException) -> None:
+    logger.error(
+        f"[WORKER] Failed to handle audio ID {audio_id} in batch: {exc!r}",
+        exc_info=exc,
+    )
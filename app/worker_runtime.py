@@ -0,0 +1,63 @@
+import asyncio
+import threading
+from typing import Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class WorkerRuntime:
+    """Event loop of a worker process, running in its own thread for the lifetime of
+    the process.
+
+    Celery calls tasks synchronously, ``run`` hands their coroutine to this loop and
+    waits for it. With a thread pool (``--pool threads``) every Celery thread waits on
+    its own task while the loop interleaves all of them, so one process has as many
+    tasks in flight as it has threads. Clients opened on the loop are shared by every
+    task.
+
+    Example usage:
+    runtime = WorkerRuntime()
+    runtime.run(setup())
+    runtime.run(handle(audio_id))
+    runtime.close()
+    """
+
+    def __init__(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="worker-loop", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def run(
+        self, coro: Coroutine[object, object, T], timeout: Optional[float] = None
+    ) -> T:
+        """Run ``coro`` on the loop and wait for its result, from any thread but the
+        loop's own."""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("WorkerRuntime.run would block its own event loop")
+        if self._loop.is_closed():
+            coro.close()
+            raise RuntimeError("WorkerRuntime is closed")
+
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # Celery's time limits and worker shutdown interrupt the waiting thread,
+            # don't leave the task running on the loop without anyone waiting for it
+            future.cancel()
+            raise
+
+    def close(self) -> None:
+        """Stop the loop and its thread. Coroutines still running are abandoned."""
+        if self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,68 @@
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from statistics import median
+
+ROUNDS = 10
+BLOCK_SAMPLES = 65536
+
+
+def decode_whole(path: Path) -> None:
+    """How audio was decoded before the decoder layer, kept as the baseline."""
+    import librosa
+
+    librosa.load(path, sr=None, mono=False)
+
+
+def decode_blocks(path: Path) -> None:
+    from app.services.decoders import open_decoder
+
+    with open(path, "rb") as audio:
+        decoder = open_decoder(audio)
+        for _ in decoder.iter_blocks(BLOCK_SAMPLES):
+            pass
+        decoder.close()
+
+
+def measure(decode, path: Path):
+    decode(path)  # Warm up, imports and codec initialisation
+    runs = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        decode(path)
+        runs.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    decode(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return median(runs), peak
+
+
+def main():
+    root = Path.cwd()
+
+    # Ensure we're in project root
+    if not (root / "pyproject.toml").exists():
+        print(
+            "ERROR: This script must be run from the project root (where pyproject.toml is).",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    sys.path.insert(0, str(root))
+
+    print(f"Median decode latency of {ROUNDS} runs and peak memory of one run")
+    for name in ["mono.wav", "stereo.wav", "mono.mp3", "stereo.mp3"]:
+        path = root / "tests" / "fixtures" / name
+        before, before_peak = measure(decode_whole, path)
+        after, after_peak = measure(decode_blocks, path)
+        print(
+            f"{name:<12}  librosa.load: {before * 1000:6.1f} ms {before_peak / 1024:8.0f} KiB"
+            f"  blocks: {after * 1000:6.1f} ms {after_peak / 1024:8.0f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+from statistics import median
+
+ROUNDS = 10
+
+
+def render_fresh_figure(f, t, db, filename: str) -> bytes:
+    """How the matplotlib renderer worked before figure templates, kept as the baseline."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(len(db), 1, figsize=(10, 4 * len(db)))
+
+    if len(db) == 1:
+        axes = [axes]
+
+    for ch, ax in enumerate(axes):
+        ax.pcolormesh(t, f, db[ch], shading="gouraud")
+        ax.set(ylabel="Frequency [Hz]", xlabel="Time [s]", title=f"Channel {ch + 1}")
+
+    fig.suptitle(filename, fontsize=16)
+
+    buf = BytesIO()
+    try:
+        fig.tight_layout()
+        fig.savefig(buf, format="png")
+    finally:
+        plt.close(fig)
+
+    return buf.getvalue()
+
+
+def main():
+    root = Path.cwd()
+
+    # Ensure we're in project root
+    if not (root / "pyproject.toml").exists():
+        print(
+            "ERROR: This script must be run from the project root (where pyproject.toml is).",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    sys.path.insert(0, str(root))
+    import librosa
+    import numpy as np
+
+    from app.services.figure_templates import get_figure_template
+    from app.services.stft import StreamingSpectrogram, iter_blocks
+
+    print(f"Median render latency of {ROUNDS} runs, decoding and STFT excluded")
+    for name in ["mono.wav", "stereo.wav"]:
+        audio_data, sample_rate = librosa.load(
+            root / "tests" / "fixtures" / name, sr=None, mono=False
+        )
+        audio_data = np.atleast_2d(audio_data)
+
+        engine = StreamingSpectrogram(*audio_data.shape, sample_rate)
+        for block in iter_blocks(audio_data, engine.block_samples):
+            engine.feed(block)
+        f, t, sxx = engine.finish()
+        db = [10 * np.log10(channel + 1e-10) for channel in sxx]
+
+        template = get_figure_template(len(db), (10, 4 * len(db)))
+        renderers = {
+            "fresh figure": lambda: render_fresh_figure(f, t, db, name),
+            "template": lambda: template.render(f, t, db, name),
+        }
+
+        timings = {}
+        for label, render in renderers.items():
+            render()  # Warm up, builds the template and caches its layout
+            runs = []
+            for _ in range(ROUNDS):
+                start = time.perf_counter()
+                render()
+                runs.append(time.perf_counter() - start)
+            timings[label] = median(runs)
+
+        before, after = timings["fresh figure"], timings["template"]
+        print(
+            f"{name:<12}  fresh figure: {before * 1000:6.1f} ms"
+            f"  template: {after * 1000:6.1f} ms  ({(before - after) * 1000:5.1f} ms saved)"
+        )
+
+
+if __name__ == "__main__":
+    main()
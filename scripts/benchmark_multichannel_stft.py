@@ -0,0 +1,86 @@
+import sys
+import time
+from pathlib import Path
+from statistics import median
+
+ROUNDS = 5
+SAMPLE_RATE = 48000
+DURATION_S = 10
+CHANNEL_COUNTS = [1, 2, 8, 16, 32]
+
+
+def per_channel(audio_data):
+    """How channels were analysed before the batched STFT, kept as the baseline: one
+    scipy call and one dB conversion per channel, each allocating its own arrays."""
+    import numpy as np
+    from scipy.signal import spectrogram
+
+    return [
+        10 * np.log10(spectrogram(channel, SAMPLE_RATE)[2] + 1e-10)
+        for channel in audio_data
+    ]
+
+
+def batched(audio_data):
+    import numpy as np
+
+    from app.services.spectrogram import _power_to_db
+    from app.services.stft import StreamingSpectrogram, iter_blocks
+
+    engine = StreamingSpectrogram(*audio_data.shape, SAMPLE_RATE)
+    for block in iter_blocks(audio_data, engine.block_samples):
+        engine.feed(block)
+    _, _, sxx = engine.finish()
+    values = (
+        [np.array(channel) for channel in sxx]
+        if isinstance(sxx, np.memmap)
+        else list(sxx)
+    )
+    for channel in values:
+        _power_to_db(channel)
+    return values
+
+
+def main():
+    root = Path.cwd()
+
+    # Ensure we're in project root
+    if not (root / "pyproject.toml").exists():
+        print(
+            "ERROR: This script must be run from the project root (where pyproject.toml is).",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    sys.path.insert(0, str(root))
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    print(
+        f"Median STFT and dB latency of {ROUNDS} runs over {DURATION_S} s"
+        f" at {SAMPLE_RATE} Hz, decoding and rendering excluded"
+    )
+    for n_channels in CHANNEL_COUNTS:
+        audio_data = rng.standard_normal(
+            (n_channels, DURATION_S * SAMPLE_RATE), dtype=np.float32
+        )
+
+        timings = {}
+        for label, analyse in {"per channel": per_channel, "batched": batched}.items():
+            analyse(audio_data)  # Warm up, builds the window and FFT plans
+            runs = []
+            for _ in range(ROUNDS):
+                start = time.perf_counter()
+                analyse(audio_data)
+                runs.append(time.perf_counter() - start)
+            timings[label] = median(runs)
+
+        before, after = timings["per channel"], timings["batched"]
+        print(
+            f"{n_channels:>2} channels  per channel: {before * 1000:7.1f} ms"
+            f"  batched: {after * 1000:7.1f} ms  ({before / after:4.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import sys
+import time
+from pathlib import Path
+from statistics import median
+
+ROUNDS = 5
+
+
+def main():
+    root = Path.cwd()
+
+    # Ensure we're in project root
+    if not (root / "pyproject.toml").exists():
+        print(
+            "ERROR: This script must be run from the project root (where pyproject.toml is).",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    sys.path.insert(0, str(root))
+    from app.services.spectrogram import generate_spectrogram
+
+    variants = {
+        "matplotlib": dict(renderer="matplotlib"),
+        "raster annotated": dict(renderer="raster", annotated=True),
+        "raster plain": dict(renderer="raster", annotated=False),
+    }
+
+    print(f"Median of {ROUNDS} runs, decoding and STFT included")
+    for audio_path in sorted((root / "tests" / "fixtures").glob("*.*")):
+        audio_bytes = audio_path.read_bytes()
+        timings = {}
+        for name, options in variants.items():
+            # Warm up imports, font and colormap caches
+            generate_spectrogram(audio_bytes, audio_path.name, **options)
+            runs = []
+            for _ in range(ROUNDS):
+                start = time.perf_counter()
+                generate_spectrogram(audio_bytes, audio_path.name, **options)
+                runs.append(time.perf_counter() - start)
+            timings[name] = median(runs)
+
+        baseline = timings["matplotlib"]
+        print(
+            f"{audio_path.name:<12}"
+            + "".join(
+                f"  {name}: {seconds * 1000:7.1f} ms ({baseline / seconds:4.1f}x)"
+                for name, seconds in timings.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
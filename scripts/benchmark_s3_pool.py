@@ -0,0 +1,107 @@
+import asyncio
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from statistics import median
+from uuid import uuid4
+
+# Needs MinIO from docker-compose, or any S3 stand-in, configured like the API
+# through .env
+ROUNDS = 3
+OBJECT_SIZE = 256 * 1024
+CONCURRENCY_LEVELS = [10, 50, 100]
+
+
+@asynccontextmanager
+async def default_client():
+    """How clients were configured before they were tuned from settings, kept as the
+    baseline: botocore's default pool of 10 connections, timeouts and retries."""
+    import aioboto3
+    from aiobotocore.config import AioConfig
+
+    from app.config import get_settings
+    from app.services.s3_storage import _CountingHTTPSession
+
+    settings = get_settings()
+    async with aioboto3.Session().client(
+        service_name="s3",
+        endpoint_url=settings.S3_ENDPOINT,
+        aws_access_key_id=settings.S3_ID,
+        aws_secret_access_key=settings.S3_SECRET,
+        config=AioConfig(http_session_cls=_CountingHTTPSession),
+    ) as client:
+        yield client
+
+
+async def upload_and_download(client, bucket: str, concurrency: int) -> float:
+    """Seconds to upload and then download ``concurrency`` objects, all at once."""
+    keys = [str(uuid4()) for _ in range(concurrency)]
+    data = bytes(OBJECT_SIZE)
+
+    async def roundtrip(key: str) -> None:
+        await client.put_object(Bucket=bucket, Key=key, Body=data)
+        resp = await client.get_object(Bucket=bucket, Key=key)
+        async with resp["Body"] as body:
+            await body.read()
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(roundtrip(key) for key in keys))
+        return time.perf_counter() - start
+    finally:
+        await asyncio.gather(
+            *(client.delete_object(Bucket=bucket, Key=key) for key in keys)
+        )
+
+
+async def run() -> None:
+    from app.pool_stats import PoolStats
+    from app.services import s3_storage
+    from app.services.constants import AUDIO_BUCKET
+
+    print(
+        f"Median time of {ROUNDS} runs to upload and download {OBJECT_SIZE // 1024} KiB"
+        f" objects, all at the same time"
+    )
+    for concurrency in CONCURRENCY_LEVELS:
+        timings = {}
+        for label, open_client in {
+            "defaults": default_client,
+            "settings": s3_storage.open_s3_client,
+        }.items():
+            s3_storage._pool_stats = stats = PoolStats()
+            async with open_client() as client:
+                await upload_and_download(client, AUDIO_BUCKET, concurrency)  # Warm up
+                runs = [
+                    await upload_and_download(client, AUDIO_BUCKET, concurrency)
+                    for _ in range(ROUNDS)
+                ]
+            timings[label] = (median(runs), stats.connects)
+
+        (before, before_connects), (after, after_connects) = timings.values()
+        print(
+            f"{concurrency:>3} objects  defaults: {before * 1000:7.1f} ms"
+            f" ({before_connects:3} connections)"
+            f"  settings: {after * 1000:7.1f} ms ({after_connects:3} connections)"
+            f"  ({before / after:4.2f}x)"
+        )
+
+
+def main():
+    root = Path.cwd()
+
+    # Ensure we're in project root
+    if not (root / "pyproject.toml").exists():
+        print(
+            "ERROR: This script must be run from the project root (where pyproject.toml is).",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    sys.path.insert(0, str(root))
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Needs Postgres from docker-compose, configured like the API through .env
+QUERIES = 5000
+CONCURRENCY_LEVELS = [10, 50, 200, 500]
+
+
+def percentile(latencies: List[float], pct: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def measure(url: str, options: Dict[str, Any], concurrency: int) -> str:
+    """Run ``QUERIES`` short sessions, ``concurrency`` at a time, like API requests
+    looking up one audio each."""
+    from sqlalchemy import event, text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    engine = create_async_engine(url, **options)
+    connects = 0
+
+    def count_connect(*_) -> None:
+        nonlocal connects
+        connects += 1
+
+    event.listen(engine.sync_engine.pool, "connect", count_connect)
+
+    latencies: List[float] = []
+    errors = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def query() -> None:
+        nonlocal errors
+        async with slots:
+            start = time.perf_counter()
+            try:
+                async with AsyncSession(engine) as session:
+                    await session.exec(text("SELECT pg_sleep(0.001)"))  # type: ignore[call-overload]
+            except Exception:
+                # Connection limits reached or pool timeouts
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(query() for _ in range(QUERIES)))
+    finally:
+        await engine.dispose()
+
+    return (
+        f"p50: {percentile(latencies, 50) * 1000:7.2f} ms"
+        f"  p99: {percentile(latencies, 99) * 1000:7.2f} ms"
+        f"  connections: {connects:4}  errors: {errors}"
+    )
+
+
+async def run() -> None:
+    from app.config import get_settings
+    from app.db import engine_options
+
+    settings = get_settings()
+    configurations = {
+        "SQLAlchemy defaults": {},
+        "API settings": engine_options(settings, "api"),
+    }
+
+    print(f"Latency of {QUERIES} sessions running a 1 ms query")
+    for concurrency in CONCURRENCY_LEVELS:
+        for label, options in configurations.items():
+            result = await measure(settings.DATABASE_URL, options, concurrency)
+            print(f"{concurrency:>3} at a time  {label:<20} {result}")
+
+
+def main():
+    root = Path.cwd()
+
+    # Ensure we're in project root
+    if not (root / "pyproject.toml").exists():
+        print(
+            "ERROR: This script must be run from the project root (where pyproject.toml is).",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    sys.path.insert(0, str(root))
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+# Needs Postgres and Redis from docker-compose, configured like the API through .env
+N_AUDIOS = 200
+REQUESTS = 5000
+CONCURRENCY = 50
+
+
+def percentile(latencies: List[float], pct: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run() -> None:
+    import httpx
+    from sqlalchemy import delete, event
+    from sqlmodel import col
+
+    from app import db
+    from app.config import get_settings
+    from app.main import app
+    from app.models.audio import Audio
+    from app.repositories.audio import AudioRepository
+    from app.services.status_cache import open_status_cache
+
+    db.init(get_settings())
+    async with db.scoped_session() as session:
+        repo = AudioRepository(session)
+        audio_ids = [
+            (await repo.create(Audio(filename=f"{i}.wav", content_type="audio/wav"))).id
+            for i in range(N_AUDIOS)
+        ]
+
+    db_statements = 0
+
+    def count_statement(*_) -> None:
+        nonlocal db_statements
+        db_statements += 1
+
+    event.listen(db.get_engine().sync_engine, "before_cursor_execute", count_statement)
+
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with (
+            open_status_cache() as status_cache,
+            httpx.AsyncClient(transport=transport, base_url="http://test") as client,
+        ):
+            if status_cache is None:
+                print(
+                    "ERROR: the status cache is disabled in settings", file=sys.stderr
+                )
+                sys.exit(1)
+
+            print(
+                f"GET /audio/{{id}} latency, {REQUESTS} requests for {N_AUDIOS} audios,"
+                f" {CONCURRENCY} at a time"
+            )
+            for label, cache in [("uncached", None), ("cached", status_cache)]:
+                app.state.status_cache = cache
+                # Warm up, fills the cache in the cached run
+                for audio_id in audio_ids:
+                    await client.get(f"/audio/{audio_id}")
+
+                db_statements = 0
+                latencies: List[float] = []
+                slots = asyncio.Semaphore(CONCURRENCY)
+
+                async def poll() -> None:
+                    async with slots:
+                        start = time.perf_counter()
+                        response = await client.get(
+                            f"/audio/{random.choice(audio_ids)}"
+                        )
+                        latencies.append(time.perf_counter() - start)
+                        response.raise_for_status()
+
+                await asyncio.gather(*(poll() for _ in range(REQUESTS)))
+
+                print(
+                    f"{label:<9}  p50: {percentile(latencies, 50) * 1000:6.2f} ms"
+                    f"  p99: {percentile(latencies, 99) * 1000:6.2f} ms"
+                    f"  DB statements: {db_statements}"
+                )
+    finally:
+        async with db.scoped_session() as session:
+            await session.exec(
+                delete(Audio).where(col(Audio.id).in_(audio_ids))  # type: ignore[call-overload]
+            )
+            await session.commit()
+        await db.destroy_engine()
+
+
+def main():
+    root = Path.cwd()
+
+    # Ensure we're in project root
+    if not (root / "pyproject.toml").exists():
+        print(
+            "ERROR: This script must be run from the project root (where pyproject.toml is).",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    sys.path.insert(0, str(root))
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import pytest
+from pydantic import ValidationError
+
+from app.models.constants import DEFAULT_PARAMS_HASH
+from app.services.analysis_params import (DEFAULT_ANALYSIS_PARAMS,
+                                          AnalysisParams)
+
+
+def test_default_params_hash_matches_model_constant():
+    assert DEFAULT_ANALYSIS_PARAMS.params_hash() == DEFAULT_PARAMS_HASH
+
+
+def test_params_hash_ignores_field_order():
+    first = AnalysisParams.model_validate_json('{"nperseg": 512, "mono": true}')
+    second = AnalysisParams.model_validate_json('{"mono": true, "nperseg": 512}')
+
+    assert first.params_hash() == second.params_hash() != DEFAULT_PARAMS_HASH
+
+
+def test_explicit_defaults_hash_like_defaults():
+    assert AnalysisParams(nperseg=256).params_hash() == DEFAULT_PARAMS_HASH
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"nperseg": 8},
+        {"nperseg": 256, "noverlap": 256},
+        {"window": "kaiser"},
+        {"colormap": "not a colormap"},
+        {"width": 10_000},
+        {"fmin": 500, "fmax": 100},
+        {"frequency_scale": "cqt", "fmin": 0},
+        {"unknown": 1},
+    ],
+)
+def test_invalid_params_are_rejected(params: dict):
+    with pytest.raises(ValidationError):
+        AnalysisParams.model_validate(params)
+
+
+def test_tukey_window_keeps_scipy_default_shape():
+    assert AnalysisParams().scipy_window == ("tukey", 0.25)
+    assert AnalysisParams(window="hann").scipy_window == "hann"
+
+
+def test_hash_ignores_parameters_left_at_default():
+    # So parameters added later don't change the hash of existing audio
+    assert AnalysisParams(n_mels=128, fmin=None).params_hash() == DEFAULT_PARAMS_HASH
+
+
+def test_band_limits_defaults_and_nyquist_cap():
+    assert AnalysisParams(frequency_scale="mel").band_limits(16000) == (0.0, 8000)
+    assert AnalysisParams(frequency_scale="cqt", fmax=20000).band_limits(16000) == (
+        32.703,
+        8000,
+    )
@@ -1,13 +1,18 @@
 import mimetypes
 from datetime import datetime
+from typing import Generator, List
 from uuid import UUID, uuid4
 
 import pytest
 import pytest_asyncio
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app import db
 from app.models.audio import Audio
-from app.models.constants import AUDIO_STATUS_DONE, AUDIO_STATUS_PENDING
+from app.models.constants import (AUDIO_STATUS_DONE, AUDIO_STATUS_PENDING,
+                                  AUDIO_STATUS_UPLOADING, DEFAULT_PARAMS_HASH)
 from app.repositories.audio import AudioRepository
 
 
@@ -24,6 +29,7 @@ async def created_audio(repo: AudioRepository) -> Audio:
             content_type=mimetypes.types_map[".wav"],
             data=b"Hand in Hand, nie mehr allein",
             status=AUDIO_STATUS_PENDING,
+            content_hash="c0ffee",
         )
     )
 
@@ -40,14 +46,18 @@ def _ensure_id(audio: Audio) -> UUID:
 
 
 @pytest.mark.asyncio
-async def test_create_adds_audio_and_assigns_id(
-    repo: AudioRepository, created_audio: Audio
-):
-    saved = await repo.create(created_audio)
+async def test_create_adds_audio_and_assigns_id(repo: AudioRepository):
+    audio = Audio(
+        filename="test.wav",
+        content_type=mimetypes.types_map[".wav"],
+        content_hash="c0ffee",
+    )
+
+    saved = await repo.create(audio)
 
     exclude_fields = {"id", "created_at"}
 
-    expected = created_audio.model_dump(exclude=exclude_fields)
+    expected = audio.model_dump(exclude=exclude_fields)
     actual = saved.model_dump(exclude=exclude_fields)
 
     assert actual == expected
@@ -104,3 +114,200 @@ async def test_mark_done_idempotent(repo: AudioRepository, created_audio: Audio)
     assert created_audio.model_dump(exclude={"status"}) == updated.model_dump(
         exclude={"status"}
     )
+
+
+@pytest.mark.asyncio
+async def test_get_by_content_hash_returns_audio(
+    repo: AudioRepository, created_audio: Audio
+):
+    fetched = await repo.get_by_content_hash("c0ffee", DEFAULT_PARAMS_HASH)
+
+    assert fetched is not None
+    assert fetched.id == created_audio.id
+
+
+@pytest.mark.asyncio
+async def test_get_by_content_hash_returns_none_if_missing(
+    repo: AudioRepository, created_audio: Audio
+):
+    assert await repo.get_by_content_hash("decaf", DEFAULT_PARAMS_HASH) is None
+    assert await repo.get_by_content_hash("c0ffee", "other params") is None
+
+
+@pytest.mark.asyncio
+async def test_get_object_key_by_content_hash(
+    repo: AudioRepository, created_audio: Audio
+):
+    created_audio_id = _ensure_id(created_audio)
+
+    assert await repo.get_object_key_by_content_hash("c0ffee") == created_audio_id
+    assert await repo.get_object_key_by_content_hash("decaf") is None
+
+
+@pytest.mark.asyncio
+async def test_get_object_key_by_content_hash_follows_shared_object(
+    repo: AudioRepository,
+):
+    object_id = uuid4()
+    await repo.create(
+        Audio(
+            filename="test.wav",
+            content_type=mimetypes.types_map[".wav"],
+            content_hash="c0ffee",
+            object_id=object_id,
+        )
+    )
+
+    assert await repo.get_object_key_by_content_hash("c0ffee") == object_id
+
+
+@pytest.mark.asyncio
+async def test_same_content_with_other_params_is_another_audio(
+    repo: AudioRepository, created_audio: Audio
+):
+    created_audio_id = _ensure_id(created_audio)
+
+    other = await repo.create(
+        Audio(
+            filename="copy.wav",
+            content_type=mimetypes.types_map[".wav"],
+            content_hash="c0ffee",
+            params={"nperseg": 1024},
+            params_hash="other params",
+            object_id=created_audio_id,
+        )
+    )
+
+    assert other.id != created_audio_id
+    assert other.params == {"nperseg": 1024}
+    assert other.object_key == created_audio_id
+
+
+@pytest.mark.asyncio
+async def test_create_rejects_duplicate_content_hash(
+    repo: AudioRepository, created_audio: Audio
+):
+    created_audio_id = _ensure_id(created_audio)
+
+    with pytest.raises(IntegrityError):
+        await repo.create(
+            Audio(
+                filename="copy.wav",
+                content_type=mimetypes.types_map[".wav"],
+                content_hash="c0ffee",
+            )
+        )
+
+    # Session is still usable after the failed insert
+    assert await repo.get_by_id(created_audio_id) is not None
+
+
+@pytest_asyncio.fixture
+async def more_audio_ids(repo: AudioRepository) -> list[UUID]:
+    # IDs are read right after each create, the next commit expires the instance
+    return [
+        _ensure_id(
+            await repo.create(
+                Audio(filename=f"{i}.wav", content_type=mimetypes.types_map[".wav"])
+            )
+        )
+        for i in range(3)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_many_returns_existing_audio(
+    repo: AudioRepository, more_audio_ids: list[UUID]
+):
+    wanted_ids = {more_audio_ids[0], more_audio_ids[2]}
+
+    fetched = await repo.get_many([*wanted_ids, uuid4()])
+
+    assert {audio.id for audio in fetched} == wanted_ids
+
+
+@pytest.mark.asyncio
+async def test_get_many_without_ids(repo: AudioRepository):
+    assert await repo.get_many([]) == []
+
+
+@pytest.mark.asyncio
+async def test_mark_many_done(repo: AudioRepository, more_audio_ids: list[UUID]):
+    ids = more_audio_ids
+
+    await repo.mark_many_done([ids[0], ids[1], uuid4()])
+
+    statuses = {audio.id: audio.status for audio in await repo.get_many(ids)}
+    assert statuses == {
+        ids[0]: AUDIO_STATUS_DONE,
+        ids[1]: AUDIO_STATUS_DONE,
+        ids[2]: AUDIO_STATUS_PENDING,
+    }
+
+
+@pytest.mark.asyncio
+async def test_complete_upload_only_completes_uploading_audio(repo: AudioRepository):
+    audio = await repo.create(
+        Audio(filename="test.wav", content_type="", status=AUDIO_STATUS_UPLOADING)
+    )
+    audio_id = _ensure_id(audio)
+
+    assert await repo.complete_upload(audio_id, "audio/x-wav")
+    # Completed already
+    assert not await repo.complete_upload(audio_id, "audio/mpeg")
+
+    completed = await repo.get_by_id(audio_id)
+    assert completed is not None
+    assert (completed.status, completed.content_type) == (
+        AUDIO_STATUS_PENDING,
+        "audio/x-wav",
+    )
+
+
+@pytest.fixture
+def statements() -> Generator[List[str], None, None]:
+    """SQL statements sent to the database, one per round trip."""
+    executed: List[str] = []
+
+    def record(conn, cursor, statement, *_) -> None:
+        executed.append(statement)
+
+    engine = db.get_engine().sync_engine
+    event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.mark.asyncio
+async def test_create_is_one_round_trip(repo: AudioRepository, statements: List[str]):
+    saved = await repo.create(
+        Audio(filename="test.wav", content_type=mimetypes.types_map[".wav"])
+    )
+
+    assert len(statements) == 1
+    assert statements[0].startswith("INSERT")
+    assert "RETURNING" in statements[0]
+    # Readable without reloading it
+    assert saved.status == AUDIO_STATUS_PENDING
+    assert len(statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_many_is_one_round_trip(
+    repo: AudioRepository, more_audio_ids: list[UUID], statements: List[str]
+):
+    await repo.get_many(more_audio_ids)
+
+    assert len(statements) == 1
+    assert statements[0].startswith("SELECT")
+
+
+@pytest.mark.asyncio
+async def test_mark_done_is_one_round_trip(
+    repo: AudioRepository, more_audio_ids: list[UUID], statements: List[str]
+):
+    await repo.mark_done(more_audio_ids[0])
+    await repo.mark_many_done(more_audio_ids)
+
+    assert len(statements) == 2
+    assert all(statement.startswith("UPDATE") for statement in statements)
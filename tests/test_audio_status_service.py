@@ -0,0 +1,78 @@
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+
+import pytest
+
+from app.models.audio import Audio
+from app.models.constants import AUDIO_STATUS_DONE, AUDIO_STATUS_PENDING
+from app.services.audio_status import AudioStatusService
+
+
+@pytest.fixture
+def audio() -> Audio:
+    return Audio(
+        id=uuid4(),
+        filename="test.wav",
+        content_type="audio/wav",
+        status=AUDIO_STATUS_PENDING,
+    )
+
+
+@pytest.fixture
+def mock_repo(audio: Audio) -> MagicMock:
+    repo = MagicMock()
+    repo.get_many = AsyncMock(return_value=[audio])
+    return repo
+
+
+@pytest.fixture
+def mock_cache() -> MagicMock:
+    cache = MagicMock()
+    cache.get_many = AsyncMock(return_value={})
+    cache.fill = AsyncMock()
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_do_not_reach_db(mock_repo: MagicMock, mock_cache: MagicMock):
+    done_id, missing_id = uuid4(), uuid4()
+    mock_cache.get_many.return_value = {done_id: AUDIO_STATUS_DONE, missing_id: None}
+
+    statuses = await AudioStatusService(mock_repo, mock_cache).get_statuses(
+        [done_id, missing_id]
+    )
+
+    assert statuses == {done_id: AUDIO_STATUS_DONE, missing_id: None}
+    mock_repo.get_many.assert_not_called()
+    mock_cache.fill.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_misses_are_loaded_once_and_cached(
+    mock_repo: MagicMock, mock_cache: MagicMock, audio: Audio
+):
+    cached_id, missing_id = uuid4(), uuid4()
+    mock_cache.get_many.return_value = {cached_id: AUDIO_STATUS_DONE}
+
+    statuses = await AudioStatusService(mock_repo, mock_cache).get_statuses(
+        [cached_id, audio.id, missing_id, audio.id]  # type: ignore[list-item]
+    )
+
+    assert statuses == {
+        cached_id: AUDIO_STATUS_DONE,
+        audio.id: AUDIO_STATUS_PENDING,
+        missing_id: None,
+    }
+    mock_repo.get_many.assert_awaited_once_with([audio.id, missing_id])
+    mock_cache.fill.assert_awaited_once_with(
+        {audio.id: AUDIO_STATUS_PENDING, missing_id: None}
+    )
+
+
+@pytest.mark.asyncio
+async def test_without_cache_reads_db(mock_repo: MagicMock, audio: Audio):
+    statuses = await AudioStatusService(mock_repo, None).get_statuses(
+        [audio.id]  # type: ignore[list-item]
+    )
+
+    assert statuses == {audio.id: AUDIO_STATUS_PENDING}
@@ -1,22 +1,32 @@
+import hashlib
 import mimetypes
 from io import BytesIO
-from typing import Generator, Optional
+from typing import Generator, Optional, cast
 from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import UUID, uuid4
 
 import pytest
+from botocore.exceptions import ClientError
 from fastapi import UploadFile
+from sqlalchemy.exc import IntegrityError
 
 from app.exceptions import InvalidAudioFile
 from app.models.audio import Audio
-from app.models.constants import AUDIO_STATUS_PENDING
+from app.models.constants import (AUDIO_STATUS_PENDING, AUDIO_STATUS_UPLOADING,
+                                  DEFAULT_PARAMS_HASH)
+from app.services.analysis_params import AnalysisParams
 from app.services.audio_upload import AudioUploadService
-from app.services.constants import FILE_HEADER_READ_SIZE
+from app.services.constants import (FILE_HEADER_READ_SIZE,
+                                    UPLOAD_READ_CHUNK_SIZE)
+from app.services.s3_storage import PresignedUpload
 
 
 @pytest.fixture
 def mock_repo() -> Generator[MagicMock, None, None]:
     repo = MagicMock()
     repo.create = AsyncMock(side_effect=lambda audio_obj: audio_obj)
+    repo.get_by_content_hash = AsyncMock(return_value=None)
+    repo.get_object_key_by_content_hash = AsyncMock(return_value=None)
     with patch("app.services.audio_upload.AudioRepository", return_value=repo):
         yield repo
 
@@ -25,6 +35,14 @@ def mock_repo() -> Generator[MagicMock, None, None]:
 def mock_audio_store() -> MagicMock:
     store = MagicMock()
     store.store = AsyncMock()
+    store.streamed_bytes = bytearray()
+
+    async def consume_stream(_object_uuid, chunks, _content_type=""):
+        async for chunk in chunks:
+            store.streamed_bytes.extend(chunk)
+
+    store.store_stream = AsyncMock(side_effect=consume_stream)
+    store.delete = AsyncMock()
     return store
 
 
@@ -60,8 +78,9 @@ async def test_accepts_supported_audio_formats(
 
     upload_file = make_upload_file(ext, fake_audio_bytes)
 
-    audio: Audio = await service.handle_upload(upload_file)
+    audio, created = await service.handle_upload(upload_file)
 
+    assert created
     assert isinstance(audio, Audio)
     assert audio.filename == f"test{ext}"
     assert audio.content_type == mimetypes.types_map[ext]
@@ -69,6 +88,25 @@ async def test_accepts_supported_audio_formats(
     mock_repo.create.assert_awaited_once_with(audio)
 
 
+@pytest.mark.asyncio
+async def test_upload_is_streamed_to_store_in_chunks(
+    service: AudioUploadService, mock_audio_store: MagicMock
+):
+    fake_audio_bytes = make_fake_audio_bytes(b"ID3") + b"\x01" * (
+        UPLOAD_READ_CHUNK_SIZE * 2 + 1
+    )
+    upload_file = make_upload_file(".mp3", fake_audio_bytes)
+
+    audio, _ = await service.handle_upload(upload_file)
+
+    mock_audio_store.store.assert_not_called()
+    mock_audio_store.store_stream.assert_awaited_once()
+    args = mock_audio_store.store_stream.await_args.args
+    assert args[0] == audio.id
+    assert args[2] == mimetypes.types_map[".mp3"]
+    assert mock_audio_store.streamed_bytes == fake_audio_bytes
+
+
 @pytest.mark.parametrize(
     "ext,header",
     [
@@ -118,7 +156,207 @@ async def test_filenames_are_sanitized(
         filename=f"../path/to/{audio_filename}", file=BytesIO(fake_audio_bytes)
     )
 
-    audio: Audio = await service.handle_upload(upload_file)
+    audio, _ = await service.handle_upload(upload_file)
 
     assert audio.filename == audio_filename
     mock_repo.create.assert_awaited_once_with(audio)
+
+
+@pytest.mark.asyncio
+async def test_upload_stores_content_hash(
+    service: AudioUploadService, mock_repo: MagicMock
+):
+    fake_audio_bytes = make_fake_audio_bytes(b"ID3")
+
+    audio, _ = await service.handle_upload(make_upload_file(".mp3", fake_audio_bytes))
+
+    assert audio.content_hash == hashlib.sha256(fake_audio_bytes).hexdigest()
+    mock_repo.get_by_content_hash.assert_awaited_once_with(
+        audio.content_hash, DEFAULT_PARAMS_HASH
+    )
+
+
+@pytest.mark.asyncio
+async def test_duplicate_upload_returns_existing_audio_without_storing(
+    service: AudioUploadService, mock_repo: MagicMock, mock_audio_store: MagicMock
+):
+    existing = Audio(id=uuid4(), filename="first.mp3", content_type="audio/mpeg")
+    mock_repo.get_by_content_hash.return_value = existing
+
+    audio, created = await service.handle_upload(
+        make_upload_file(".mp3", make_fake_audio_bytes(b"ID3"))
+    )
+
+    assert audio is existing and not created
+    mock_repo.create.assert_not_called()
+    mock_audio_store.store_stream.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_upload_keeps_first_and_deletes_own_object(
+    service: AudioUploadService, mock_repo: MagicMock, mock_audio_store: MagicMock
+):
+    existing = Audio(id=uuid4(), filename="first.mp3", content_type="audio/mpeg")
+    # Not there when checked, but inserted by another request before our insert
+    mock_repo.get_by_content_hash.side_effect = [None, existing]
+    mock_repo.create.side_effect = IntegrityError("INSERT", {}, Exception("unique"))
+
+    audio, created = await service.handle_upload(
+        make_upload_file(".mp3", make_fake_audio_bytes(b"ID3"))
+    )
+
+    assert audio is existing and not created
+    stored_uuid = mock_audio_store.store_stream.await_args.args[0]
+    mock_audio_store.delete.assert_awaited_once_with(stored_uuid)
+
+
+@pytest.mark.asyncio
+async def test_upload_with_params_stores_them_with_their_hash(
+    service: AudioUploadService, mock_repo: MagicMock
+):
+    params = AnalysisParams(nperseg=1024, colormap="magma")
+
+    audio, _ = await service.handle_upload(
+        make_upload_file(".mp3", make_fake_audio_bytes(b"ID3")), params
+    )
+
+    assert audio.params == {"nperseg": 1024, "colormap": "magma"}
+    assert audio.params_hash == params.params_hash() != DEFAULT_PARAMS_HASH
+    mock_repo.get_by_content_hash.assert_awaited_once_with(
+        audio.content_hash, audio.params_hash
+    )
+
+
+@pytest.mark.asyncio
+async def test_known_content_with_new_params_shares_stored_file(
+    service: AudioUploadService, mock_repo: MagicMock, mock_audio_store: MagicMock
+):
+    object_id = uuid4()
+    mock_repo.get_object_key_by_content_hash.return_value = object_id
+
+    audio, created = await service.handle_upload(
+        make_upload_file(".mp3", make_fake_audio_bytes(b"ID3")),
+        AnalysisParams(scale="power"),
+    )
+
+    assert created
+    assert audio.object_key == object_id
+    mock_repo.create.assert_awaited_once_with(audio)
+    mock_audio_store.store_stream.assert_not_called()
+
+
+def make_uploading_audio() -> Audio:
+    return Audio(filename="test.wav", content_type="", status=AUDIO_STATUS_UPLOADING)
+
+
+@pytest.mark.asyncio
+async def test_direct_upload_creates_uploading_audio(
+    service: AudioUploadService, mock_repo: MagicMock, mock_audio_store: MagicMock
+):
+    presigned = PresignedUpload(url="https://s3/put")
+    mock_audio_store.presign_upload = AsyncMock(return_value=presigned)
+    params = AnalysisParams(scale="power")
+
+    audio, upload = await service.start_direct_upload(
+        "../../test.wav", 1000, params, expires_in=60
+    )
+
+    assert upload is presigned
+    assert (audio.filename, audio.status) == ("test.wav", AUDIO_STATUS_UPLOADING)
+    assert audio.params_hash == params.params_hash()
+    assert audio.content_hash is None
+    mock_audio_store.presign_upload.assert_awaited_once_with(audio.id, 1000, 60)
+    mock_repo.create.assert_awaited_once_with(audio)
+
+
+@pytest.mark.parametrize(
+    "header, content_type",
+    [(b"ID3", "audio/mpeg"), (b"RIFF\x00\x00\x00\x00WAVE", "audio/x-wav")],
+)
+@pytest.mark.asyncio
+async def test_complete_direct_upload_checks_only_the_header(
+    service: AudioUploadService,
+    mock_repo: MagicMock,
+    mock_audio_store: MagicMock,
+    header: bytes,
+    content_type: str,
+):
+    audio = make_uploading_audio()
+    mock_repo.get_by_id = AsyncMock(return_value=audio)
+    mock_repo.complete_upload = AsyncMock(return_value=True)
+    mock_audio_store.retrieve_range = AsyncMock(
+        return_value=make_fake_audio_bytes(header)[:FILE_HEADER_READ_SIZE]
+    )
+
+    completed = await service.complete_direct_upload(cast(UUID, audio.id))
+
+    assert completed is audio
+    assert (audio.status, audio.content_type) == (AUDIO_STATUS_PENDING, content_type)
+    mock_audio_store.retrieve_range.assert_awaited_once_with(
+        audio.id, 0, FILE_HEADER_READ_SIZE - 1
+    )
+    mock_repo.complete_upload.assert_awaited_once_with(audio.id, content_type)
+
+
+@pytest.mark.asyncio
+async def test_complete_direct_upload_puts_parts_together_first(
+    service: AudioUploadService, mock_repo: MagicMock, mock_audio_store: MagicMock
+):
+    audio = make_uploading_audio()
+    mock_repo.get_by_id = AsyncMock(return_value=audio)
+    mock_repo.complete_upload = AsyncMock(return_value=True)
+    mock_audio_store.complete_multipart_upload = AsyncMock()
+    mock_audio_store.retrieve_range = AsyncMock(return_value=b"ID3")
+
+    await service.complete_direct_upload(
+        cast(UUID, audio.id), "upload-1", [(1, "etag-1")]
+    )
+
+    mock_audio_store.complete_multipart_upload.assert_awaited_once_with(
+        audio.id, "upload-1", [(1, "etag-1")]
+    )
+
+
+@pytest.mark.asyncio
+async def test_complete_direct_upload_deletes_unsupported_files(
+    service: AudioUploadService, mock_repo: MagicMock, mock_audio_store: MagicMock
+):
+    audio = make_uploading_audio()
+    mock_repo.get_by_id = AsyncMock(return_value=audio)
+    mock_repo.complete_upload = AsyncMock()
+    mock_audio_store.retrieve_range = AsyncMock(return_value=b"%PDF-1.7")
+
+    with pytest.raises(InvalidAudioFile):
+        await service.complete_direct_upload(cast(UUID, audio.id))
+
+    mock_audio_store.delete.assert_awaited_once_with(audio.id)
+    mock_repo.complete_upload.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_complete_direct_upload_of_missing_file(
+    service: AudioUploadService, mock_repo: MagicMock, mock_audio_store: MagicMock
+):
+    audio = make_uploading_audio()
+    mock_repo.get_by_id = AsyncMock(return_value=audio)
+    mock_audio_store.retrieve_range = AsyncMock(
+        side_effect=ClientError(
+            {"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}, "GetObject"
+        )
+    )
+
+    with pytest.raises(InvalidAudioFile, match="wasn't uploaded"):
+        await service.complete_direct_upload(cast(UUID, audio.id))
+
+
+@pytest.mark.asyncio
+async def test_complete_direct_upload_returns_completed_audio_as_is(
+    service: AudioUploadService, mock_repo: MagicMock, mock_audio_store: MagicMock
+):
+    audio = Audio(filename="test.wav", content_type="audio/x-wav")
+    mock_repo.get_by_id = AsyncMock(side_effect=[audio, None])
+    mock_audio_store.retrieve_range = AsyncMock()
+
+    assert await service.complete_direct_upload(cast(UUID, audio.id)) is audio
+    assert await service.complete_direct_upload(uuid4()) is None
+    mock_audio_store.retrieve_range.assert_not_awaited()
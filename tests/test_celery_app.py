@@ -0,0 +1,80 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app import celery_app
+from app.services import stft
+from tests.utils import make_settings
+
+
+@pytest.mark.parametrize(
+    "concurrency, render_workers, threads",
+    [(None, 1, 8), (4, 1, 2), (2, 2, 2), (3, 1, 2), (16, 1, 1)],
+)
+def test_render_threads_split_the_cores(concurrency, render_workers, threads):
+    settings = make_settings(WORKER_RENDER_WORKERS=render_workers)
+
+    with patch("app.celery_app.os.sched_getaffinity", return_value=set(range(8))):
+        assert celery_app.render_threads(settings, concurrency) == threads
+
+
+def test_render_threads_setting_wins():
+    settings = make_settings(WORKER_FFT_THREADS=3)
+
+    assert celery_app.render_threads(settings, 16) == 3
+
+
+def test_limit_compute_threads():
+    with patch("app.celery_app.threadpool_limits") as mock_limits:
+        try:
+            celery_app.limit_compute_threads(3)
+
+            mock_limits.assert_called_once_with(limits=3)
+            assert stft._fft_workers == 3
+        finally:
+            stft.set_fft_workers(1)
+
+
+@pytest.mark.parametrize(
+    "pool_cls, processes, process_concurrency, opens_resources",
+    [("prefork", 4, 1, False), ("threads", 1, 4, True), ("solo", 1, 1, False)],
+)
+def test_init_worker_records_processes(
+    pool_cls, processes, process_concurrency, opens_resources
+):
+    worker = MagicMock(pool_cls=pool_cls, concurrency=4)
+
+    with patch("app.celery_app._init_resources") as init_resources:
+        try:
+            celery_app._init_worker(sender=worker)
+
+            assert celery_app._worker_processes == processes
+            assert celery_app._process_concurrency == process_concurrency
+            assert init_resources.called == opens_resources
+        finally:
+            celery_app._worker_processes = None
+            celery_app._process_concurrency = 1
+
+
+def test_discarded_render_executor_is_replaced():
+    settings = make_settings(WORKER_RENDER_EXECUTOR="process")
+
+    with (
+        patch("app.celery_app.get_settings", return_value=settings),
+        patch("app.celery_app._render_executor", None),
+        patch(
+            "app.celery_app.ProcessPoolExecutor",
+            side_effect=lambda *_, **__: MagicMock(),
+        ) as pool_cls,
+    ):
+        executor = celery_app.get_render_executor()
+        assert celery_app.get_render_executor() is executor
+
+        celery_app.discard_render_executor(executor)
+
+        executor.shutdown.assert_called_once_with(wait=False)
+        assert celery_app.get_render_executor() is not executor
+
+    # Render processes don't inherit the worker's loop and connections
+    mp_context = pool_cls.call_args.kwargs["mp_context"]
+    assert mp_context.get_start_method() == "forkserver"
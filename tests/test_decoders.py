@@ -0,0 +1,159 @@
+from io import BytesIO
+from pathlib import Path
+
+import librosa
+import numpy as np
+import pytest
+import soundfile
+
+from app.services.decoders import (DownmixDecoder, LibrosaDecoder,
+                                   PcmWavDecoder, ResampleDecoder,
+                                   SoundfileDecoder, open_decoder,
+                                   read_wav_layout)
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+def read_all(decoder, block_samples=4096) -> np.ndarray:
+    return np.concatenate(list(decoder.iter_blocks(block_samples)), axis=1)
+
+
+@pytest.mark.parametrize(
+    "name, decoder_type",
+    [
+        ("mono.wav", PcmWavDecoder),
+        ("stereo.wav", PcmWavDecoder),
+        ("mono.mp3", SoundfileDecoder),
+        ("stereo.mp3", SoundfileDecoder),
+    ],
+)
+def test_native_decoder_matches_librosa_load(name, decoder_type):
+    expected, sample_rate = librosa.load(FIXTURES_DIR / name, sr=None, mono=False)
+    expected = np.atleast_2d(expected)
+
+    with open(FIXTURES_DIR / name, "rb") as audio:
+        decoder = open_decoder(audio)
+        assert isinstance(decoder, decoder_type)
+        assert decoder.sample_rate == sample_rate
+        assert decoder.n_channels == expected.shape[0]
+        decoded = read_all(decoder)
+        decoder.close()
+
+    assert decoded.dtype == np.float32
+    # mpg123 rounds differently depending on how much is read at once
+    np.testing.assert_allclose(decoded, expected, rtol=0, atol=1e-6)
+
+
+def test_blocks_are_at_most_block_samples_and_restart_from_the_beginning():
+    with open(FIXTURES_DIR / "stereo.wav", "rb") as audio:
+        decoder = open_decoder(audio)
+        blocks = list(decoder.iter_blocks(1000))
+        again = read_all(decoder, 1000)
+        decoder.close()
+
+    assert all(block.shape[0] == 2 and block.shape[1] <= 1000 for block in blocks)
+    assert sum(block.shape[1] for block in blocks) == decoder.n_samples
+    np.testing.assert_array_equal(np.concatenate(blocks, axis=1), again)
+
+
+def test_mono_averages_the_channels():
+    with open(FIXTURES_DIR / "stereo.wav", "rb") as audio:
+        stereo = read_all(open_decoder(audio))
+        decoder = open_decoder(audio, mono=True)
+        assert isinstance(decoder, DownmixDecoder)
+        assert decoder.n_channels == 1
+        mono = read_all(decoder)
+
+    np.testing.assert_allclose(mono, stereo.mean(axis=0, keepdims=True), rtol=1e-6)
+
+
+def test_resampling_matches_librosa_load():
+    expected, _ = librosa.load(FIXTURES_DIR / "stereo.wav", sr=16000, mono=False)
+
+    with open(FIXTURES_DIR / "stereo.wav", "rb") as audio:
+        decoder = open_decoder(audio, sample_rate=16000)
+        assert isinstance(decoder, ResampleDecoder)
+        assert decoder.sample_rate == 16000
+        resampled = read_all(decoder, 1000)
+
+    # Streaming resamples in chunks, the filter is the same up to rounding
+    assert abs(resampled.shape[1] - expected.shape[1]) <= 1
+    n = min(resampled.shape[1], expected.shape[1])
+    np.testing.assert_allclose(resampled[:, :n], expected[:, :n], atol=1e-4)
+
+
+def test_same_sample_rate_does_not_resample():
+    with open(FIXTURES_DIR / "mono.wav", "rb") as audio:
+        sample_rate = open_decoder(audio).sample_rate
+        assert isinstance(open_decoder(audio, sample_rate), PcmWavDecoder)
+
+
+def write_wav(subtype: str, n_channels: int = 2) -> BytesIO:
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-1, 1, (5000, n_channels))
+    wav = BytesIO()
+    soundfile.write(wav, samples, 8000, subtype=subtype, format="WAV")
+    wav.seek(0)
+    return wav
+
+
+@pytest.mark.parametrize("subtype", ["PCM_16", "PCM_24", "PCM_32", "FLOAT", "DOUBLE"])
+def test_mapped_wav_matches_libsndfile(subtype):
+    wav = write_wav(subtype)
+    expected = read_all(SoundfileDecoder(wav), 1000)
+
+    decoder = open_decoder(wav)
+    assert isinstance(decoder, PcmWavDecoder)
+    np.testing.assert_array_equal(read_all(decoder, 1000), expected)
+    decoder.close()
+
+
+def test_mapped_wav_from_a_file_on_disk(tmp_path):
+    path = tmp_path / "audio.wav"
+    path.write_bytes(write_wav("PCM_24", n_channels=3).getvalue())
+
+    with open(path, "rb") as audio:
+        expected = read_all(SoundfileDecoder(audio))
+        decoder = open_decoder(audio)
+        blocks = decoder.iter_blocks(1000)
+        np.testing.assert_array_equal(next(blocks), expected[:, :1000])
+        # Closing with a block pending releases the mapping
+        decoder.close()
+        with pytest.raises(ValueError):
+            next(blocks)
+
+
+def test_wav_layout():
+    layout = read_wav_layout(write_wav("PCM_24"))
+
+    assert layout is not None
+    assert (layout.sample_rate, layout.n_channels, layout.bits) == (8000, 2, 24)
+    assert (layout.data_offset, layout.n_samples) == (44, 5000)
+
+
+@pytest.mark.parametrize(
+    "audio",
+    [write_wav("PCM_U8"), BytesIO(b"RIFF\x00\x00\x00\x00WAVE"), BytesIO(b"ID3")],
+)
+def test_other_formats_are_not_mapped(audio):
+    assert read_wav_layout(audio) is None
+
+
+def test_falls_back_to_librosa_when_libsndfile_fails(mocker):
+    mocker.patch(
+        "app.services.decoders.SoundfileDecoder",
+        side_effect=soundfile.LibsndfileError(0, "unsupported"),
+    )
+
+    with open(FIXTURES_DIR / "mono.mp3", "rb") as audio:
+        decoder = open_decoder(audio)
+        assert isinstance(decoder, LibrosaDecoder)
+        decoded = read_all(decoder)
+
+    expected, _ = librosa.load(FIXTURES_DIR / "mono.mp3", sr=None, mono=False)
+    np.testing.assert_array_equal(decoded[0], expected)
+
+
+def test_unreadable_audio_raises_value_error():
+    with pytest.raises(ValueError):
+        open_decoder(BytesIO(b"definitely not audio"))
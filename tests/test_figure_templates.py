@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from matplotlib.figure import Figure
+
+from app.services.figure_templates import FigureTemplate, get_figure_template
+
+
+def make_db(n_frames: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.normal(-60, 10, (129, n_frames)).astype(np.float32)
+
+
+@pytest.fixture
+def short_input() -> tuple[np.ndarray, np.ndarray, list[np.ndarray]]:
+    return np.linspace(0, 11025, 129), np.linspace(0.005, 1.5, 50), [make_db(50, 1)]
+
+
+@pytest.fixture
+def long_input() -> tuple[np.ndarray, np.ndarray, list[np.ndarray]]:
+    return np.linspace(0, 22050, 129), np.linspace(0.005, 30, 300), [make_db(300, 2)]
+
+
+def test_get_figure_template_is_cached_per_key():
+    template = get_figure_template(1, (10, 4))
+
+    assert get_figure_template(1, (10, 4)) is template
+    assert get_figure_template(2, (10, 8)) is not template
+    assert get_figure_template(1, (5, 2)) is not template
+
+
+def test_least_recently_used_templates_are_dropped():
+    with (
+        patch("app.services.figure_templates._templates", OrderedDict()) as templates,
+        patch("app.services.figure_templates._MAX_CACHED_TEMPLATES", 2),
+    ):
+        first = get_figure_template(1, (10, 4))
+        get_figure_template(1, (5, 2))
+        assert get_figure_template(1, (10, 4)) is first
+
+        get_figure_template(1, (4, 2))
+
+        assert list(templates) == [(1, (10, 4)), (1, (4, 2))]
+        assert get_figure_template(1, (10, 4)) is first
+
+
+def test_output_does_not_depend_on_previous_renders(short_input, long_input):
+    expected = FigureTemplate(1, (10, 4)).render(*short_input, "short.wav")
+
+    template = FigureTemplate(1, (10, 4))
+    template.render(*long_input, "long.wav")
+
+    assert template.render(*short_input, "short.wav") == expected
+
+
+def test_layout_is_recomputed_only_when_ticks_change(short_input, long_input):
+    template = FigureTemplate(1, (10, 4))
+    original_tight_layout = Figure.tight_layout
+
+    with patch.object(Figure, "tight_layout", autospec=True) as tight_layout:
+        tight_layout.side_effect = original_tight_layout
+
+        template.render(*short_input, "short.wav")
+        template.render(*short_input, "other title.wav")
+        assert tight_layout.call_count == 1
+
+        template.render(*long_input, "long.wav")
+        assert tight_layout.call_count == 2
+
+
+def test_render_removes_meshes(short_input):
+    template = FigureTemplate(1, (10, 4))
+
+    template.render(*short_input, "short.wav")
+
+    assert not any(ax.collections for ax in template._axes)
@@ -0,0 +1,61 @@
+import librosa
+import numpy as np
+import pytest
+from scipy.signal import get_window
+
+from app.services import filterbanks
+from app.services.constants import FILTERBANK_CACHE_SIZE
+
+
+def test_window_is_cached_and_read_only():
+    window = filterbanks.window(("tukey", 0.25), 256)
+
+    assert filterbanks.window(("tukey", 0.25), 256) is window
+    np.testing.assert_array_equal(window, get_window(("tukey", 0.25), 256))
+    with pytest.raises(ValueError):
+        window[0] = 1.0
+
+
+def test_mel_matches_librosa_and_is_cached():
+    filterbank, centers = filterbanks.mel(22050, 1024, 64, 0.0, 11025.0)
+
+    expected = librosa.filters.mel(sr=22050, n_fft=1024, n_mels=64, fmax=11025.0)
+    np.testing.assert_allclose(filterbank.toarray(), expected, rtol=1e-6)
+    assert len(centers) == 64
+    assert filterbanks.mel(22050, 1024, 64, 0.0, 11025.0)[0] is filterbank
+
+
+def test_cache_is_bounded():
+    assert filterbanks.mel.cache_info().maxsize == FILTERBANK_CACHE_SIZE
+    assert filterbanks.constant_q.cache_info().maxsize == FILTERBANK_CACHE_SIZE
+
+
+def test_constant_q_bands_are_geometric_and_normalised():
+    filterbank, centers = filterbanks.constant_q(22050, 2048, 12, 32.703, 8000.0)
+
+    # C1 up to just below B8, 12 bands per octave
+    assert len(centers) == int(np.floor(12 * np.log2(8000 / 32.703))) + 1
+    np.testing.assert_allclose(centers[12::12] / centers[:-12:12], 2.0)
+    weights = filterbank.toarray()
+    assert weights.shape == (len(centers), 1025)
+    np.testing.assert_allclose(weights.sum(axis=1), 1.0, rtol=1e-5)
+
+
+def test_constant_q_narrow_bands_interpolate_nearest_bins():
+    # Bins are ~86 Hz apart, far wider than the lowest bands
+    filterbank, centers = filterbanks.constant_q(22050, 256, 12, 100.0, 1000.0)
+
+    first = filterbank.toarray()[0]
+    assert np.count_nonzero(first) == 2
+    bin_freqs = np.linspace(0, 11025, 129)
+    # Weighted average of the two bins is the band's center
+    assert first @ bin_freqs == pytest.approx(centers[0], rel=1e-5)
+
+
+def test_window_is_cached_per_dtype():
+    window = filterbanks.window("hann", 512, "float32")
+
+    assert window.dtype == np.float32
+    assert filterbanks.window("hann", 512, "float32") is window
+    assert filterbanks.window("hann", 512) is not window
+    np.testing.assert_array_equal(window, get_window("hann", 512).astype(np.float32))
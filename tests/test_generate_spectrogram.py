@@ -2,12 +2,23 @@ import os
 import tempfile
 from io import BytesIO
 from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from unittest.mock import MagicMock, patch
 
+import numpy as np
 import pytest
+import soundfile
 from PIL import Image, ImageChops, ImageOps
 
 from app.exceptions import SpectrogramGenerationError
-from app.services.spectrogram import generate_spectrogram
+from app.services.analysis_params import AnalysisParams
+from app.services.constants import (FAST_MODE_FRAMES_PER_COLUMN,
+                                    PROGRESS_DECODED, PROGRESS_RENDERED,
+                                    PROGRESS_STFT, STFT_MAX_MEMORY_BYTES)
+from app.services.spectrogram import (_display_analysis, compute_spectrogram,
+                                      generate_spectrogram, render_spectrogram,
+                                      warm_up)
+from app.services.stft import StreamingSpectrogram
 
 FIXTURES_DIR = Path(__file__).parent / "fixtures"
 EXPECTED_OUTPUTS_DIR = FIXTURES_DIR / "expected_outputs"
@@ -78,6 +89,158 @@ def test_generate_spectrogram_matches_expected(input_filename: str):
             )
 
 
+@pytest.mark.parametrize("annotated", [True, False])
+@pytest.mark.parametrize(
+    "input_filename", ["mono.wav", "stereo.wav", "mono.mp3", "stereo.mp3"]
+)
+def test_raster_renderer_matches_matplotlib_size(input_filename: str, annotated: bool):
+    audio_bytes = (FIXTURES_DIR / input_filename).read_bytes()
+    expected_img_path = EXPECTED_OUTPUTS_DIR / f"{input_filename}_spectrogram.png"
+
+    output_bytes = generate_spectrogram(
+        audio_bytes, input_filename, renderer="raster", annotated=annotated
+    )
+
+    assert Image.open(BytesIO(output_bytes)).size == Image.open(expected_img_path).size
+
+
+def test_generate_spectrogram_rejects_unknown_renderer():
+    with pytest.raises(ValueError):
+        generate_spectrogram(b"", "fake.mp3", renderer="ascii-art")
+
+
+def test_generate_spectrogram_accepts_file_object():
+    input_filename = "stereo.mp3"
+    audio_bytes = (FIXTURES_DIR / input_filename).read_bytes()
+
+    with SpooledTemporaryFile(max_size=1024) as audio_file:
+        audio_file.write(audio_bytes)
+        audio_file.seek(0)
+
+        from_file = generate_spectrogram(audio_file, input_filename)
+
+    assert from_file == generate_spectrogram(audio_bytes, input_filename)
+
+
+def test_generate_spectrogram_reports_progress():
+    input_filename = "stereo.wav"
+    audio_bytes = (FIXTURES_DIR / input_filename).read_bytes()
+    events: list[tuple[str, float | None]] = []
+
+    # A small memory budget splits the STFT in many blocks
+    output_bytes = generate_spectrogram(
+        audio_bytes,
+        input_filename,
+        stft_max_memory_bytes=1024 * 1024,
+        renderer="raster",
+        progress=lambda stage, percent: events.append((stage, percent)),
+    )
+
+    stages = [stage for stage, _ in events]
+    assert stages[0] == PROGRESS_DECODED
+    assert stages[-1] == PROGRESS_RENDERED
+    assert set(stages[1:-1]) == {PROGRESS_STFT}
+
+    percents = [percent for _, percent in events[1:-1]]
+    assert len(percents) > 1
+    assert percents == sorted(percents)
+    assert percents[-1] == 100
+
+    # Reporting doesn't change the result
+    assert output_bytes == generate_spectrogram(
+        audio_bytes,
+        input_filename,
+        stft_max_memory_bytes=1024 * 1024,
+        renderer="raster",
+    )
+
+
+def test_compute_spectrogram_applies_analysis_params():
+    audio_bytes = (FIXTURES_DIR / "stereo.wav").read_bytes()
+
+    default = compute_spectrogram(audio_bytes)
+    custom = compute_spectrogram(
+        audio_bytes,
+        params=AnalysisParams(mono=True, nperseg=512, noverlap=256, scale="power"),
+    )
+
+    assert len(default.values) == 2
+    assert default.values[0].shape[0] == 129
+    assert len(custom.values) == 1
+    assert custom.values[0].shape[0] == 257
+    # Hop of 512 - 256 samples instead of 256 - 256 // 8
+    assert custom.t[1] - custom.t[0] == pytest.approx(
+        (default.t[1] - default.t[0]) * 256 / 224
+    )
+    assert custom.scale == "power"
+    assert custom.values[0].min() >= 0
+
+
+@pytest.mark.parametrize(
+    "params, n_bands",
+    [
+        (AnalysisParams(nperseg=1024, frequency_scale="mel", n_mels=40), 40),
+        (
+            AnalysisParams(
+                nperseg=1024, frequency_scale="cqt", fmin=110.0, fmax=3520.0
+            ),
+            61,
+        ),
+    ],
+)
+def test_compute_spectrogram_band_scales(params: AnalysisParams, n_bands: int):
+    audio_bytes = (FIXTURES_DIR / "mono.wav").read_bytes()
+
+    spectrogram = compute_spectrogram(audio_bytes, params=params)
+
+    assert spectrogram.values[0].shape[0] == n_bands
+    assert len(spectrogram.f) == n_bands
+    assert (spectrogram.f[1:] > spectrogram.f[:-1]).all()
+    assert spectrogram.f[0] >= (params.fmin or 0)
+
+
+def test_compute_spectrogram_rejects_bands_above_nyquist():
+    audio_bytes = (FIXTURES_DIR / "mono.wav").read_bytes()
+
+    with pytest.raises(SpectrogramGenerationError):
+        compute_spectrogram(
+            audio_bytes, params=AnalysisParams(frequency_scale="mel", fmin=1e6)
+        )
+
+
+@pytest.mark.parametrize("renderer", ["raster", "matplotlib"])
+def test_generate_spectrogram_output_size_and_colormap(renderer: str):
+    audio_bytes = (FIXTURES_DIR / "stereo.wav").read_bytes()
+    params = AnalysisParams(width=320, height=160, colormap="magma")
+
+    output_bytes = generate_spectrogram(
+        audio_bytes, "stereo.wav", renderer=renderer, params=params
+    )
+
+    image = Image.open(BytesIO(output_bytes))
+    assert image.size == (320, 2 * 160)
+    assert output_bytes != generate_spectrogram(
+        audio_bytes,
+        "stereo.wav",
+        renderer=renderer,
+        params=params.model_copy(update={"colormap": "viridis"}),
+    )
+
+
+@pytest.mark.parametrize("renderer", ["raster", "matplotlib"])
+@pytest.mark.parametrize("size", [{"width": 64}, {"height": 64}])
+def test_generate_spectrogram_at_the_smallest_sizes(renderer: str, size: dict):
+    audio_bytes = (FIXTURES_DIR / "stereo.wav").read_bytes()
+    params = AnalysisParams(**size)
+
+    output_bytes = generate_spectrogram(
+        audio_bytes, "stereo.wav", renderer=renderer, params=params
+    )
+
+    image = Image.open(BytesIO(output_bytes))
+    assert image.size == (params.width, 2 * params.height)
+
+
 @pytest.mark.parametrize(
     "bad_bytes",
     [
@@ -96,3 +259,103 @@ def test_generate_spectrogram_matches_expected(input_filename: str):
 def test_generate_spectrogram_invalid_input(bad_bytes):
     with pytest.raises(SpectrogramGenerationError):
         generate_spectrogram(bad_bytes, "fake.mp3")
+
+
+@pytest.fixture(scope="module")
+def long_tones() -> bytes:
+    """A minute of two tones at 16 kHz, the second one gliding, long enough for fast
+    mode to skip most frames of a narrow image."""
+    sample_rate = 16000
+    t = np.arange(60 * sample_rate) / sample_rate
+    tones = 0.5 * np.sin(2 * np.pi * 300 * t) + 0.3 * np.sin(
+        2 * np.pi * 700 * t * (1 + t / 120)
+    )
+    wav = BytesIO()
+    soundfile.write(
+        wav, np.stack([tones, tones / 2], axis=1), sample_rate, format="WAV"
+    )
+    return wav.getvalue()
+
+
+def test_fast_mode_keeps_every_nth_frame_of_linear_spectrograms(long_tones: bytes):
+    exact = compute_spectrogram(long_tones, params=AnalysisParams(width=64))
+    fast = compute_spectrogram(long_tones, params=AnalysisParams(width=64, mode="fast"))
+
+    # About FAST_MODE_FRAMES_PER_COLUMN frames per column, all of them exact ones
+    stride = len(exact.t) // (64 * FAST_MODE_FRAMES_PER_COLUMN)
+    assert len(fast.t) == len(exact.t[::stride])
+    np.testing.assert_array_equal(fast.f, exact.f)
+    np.testing.assert_allclose(fast.t, exact.t[::stride])
+    for fast_channel, exact_channel in zip(fast.values, exact.values):
+        np.testing.assert_allclose(fast_channel, exact_channel[:, ::stride], atol=1e-3)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        AnalysisParams(width=64, nperseg=1024, frequency_scale="mel", fmax=1000.0),
+        AnalysisParams(
+            width=64, nperseg=2048, frequency_scale="cqt", fmin=110.0, fmax=1000.0
+        ),
+    ],
+)
+def test_fast_mode_resampled_bands_are_close_to_exact(
+    long_tones: bytes, params: AnalysisParams
+):
+    """The accuracy given up for speed: bands below 1 kHz are analysed at a seventh of
+    the sample rate, and end up within about a dB of the exact ones."""
+    exact = compute_spectrogram(long_tones, params=params)
+    fast = compute_spectrogram(
+        long_tones, params=params.model_copy(update={"mode": "fast"})
+    )
+
+    np.testing.assert_allclose(fast.f, exact.f)
+    assert len(fast.t) < len(exact.t) / 3
+    nearest = np.abs(exact.t[:, np.newaxis] - fast.t).argmin(axis=0)
+    exact_db, fast_db = exact.values[0][:, nearest], fast.values[0]
+
+    # The loudest band of every frame is the same, and loud cells are close
+    np.testing.assert_array_equal(fast_db.argmax(axis=0), exact_db.argmax(axis=0))
+    loud = exact_db > exact_db.max() - 40
+    assert np.median(np.abs(fast_db - exact_db)[loud]) < 1.5
+
+
+def test_compute_spectrogram_db_values_are_converted_in_the_mapping():
+    audio_bytes = (FIXTURES_DIR / "stereo.wav").read_bytes()
+
+    in_memory = compute_spectrogram(audio_bytes)
+    # Small enough for the STFT output to be memory-mapped
+    mapped = compute_spectrogram(audio_bytes, stft_max_memory_bytes=64 * 1024)
+
+    for channel, mapped_channel in zip(in_memory.values, mapped.values):
+        assert channel.dtype == mapped_channel.dtype == np.float32
+        assert isinstance(mapped_channel, np.memmap)
+        np.testing.assert_array_equal(channel, mapped_channel)
+
+    for renderer in ["raster", "matplotlib"]:
+        assert render_spectrogram(mapped, "stereo.wav", renderer) == (
+            render_spectrogram(in_memory, "stereo.wav", renderer)
+        )
+
+
+@pytest.mark.parametrize("renderer", ["raster", "matplotlib"])
+def test_warm_up_renders_silence(renderer: str):
+    with patch(
+        "app.services.spectrogram.generate_spectrogram", wraps=generate_spectrogram
+    ) as generate:
+        warm_up(renderer)
+
+    assert generate.call_args.kwargs["renderer"] == renderer
+
+
+def test_fast_mode_decodes_long_files_in_bounded_blocks():
+    # 2 h at 96 kHz over 8 channels, about 22 GB of float32 samples
+    decoder = MagicMock(n_channels=8, n_samples=2 * 3600 * 96000, sample_rate=96000)
+
+    decoder, nperseg, noverlap = _display_analysis(decoder, AnalysisParams(mode="fast"))
+    engine = StreamingSpectrogram(
+        decoder.n_channels, decoder.n_samples, decoder.sample_rate, nperseg, noverlap
+    )
+
+    assert noverlap < -nperseg
+    assert engine.block_samples * 8 * 4 <= STFT_MAX_MEMORY_BYTES // 2
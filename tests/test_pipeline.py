@@ -0,0 +1,133 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import pytest
+
+from app.services.pipeline import run_pipeline
+
+STAGE_SECONDS = 0.05
+
+
+@pytest.mark.asyncio
+async def test_every_key_goes_through_all_stages():
+    uploaded: List[tuple[int, str]] = []
+
+    async def download(key: int) -> Optional[int]:
+        return key * 10
+
+    async def render(key: int, downloaded: int) -> str:
+        return f"rendered {downloaded}"
+
+    async def upload(key: int, rendered: str) -> None:
+        uploaded.append((key, rendered))
+
+    results = await run_pipeline(
+        range(5), download, render, upload, prefetch=2, max_uploads=2
+    )
+
+    assert results == {key: None for key in range(5)}
+    assert sorted(uploaded) == [(key, f"rendered {key * 10}") for key in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_failures_only_affect_their_key():
+    download_error = RuntimeError("download")
+    render_error = RuntimeError("render")
+    upload_error = RuntimeError("upload")
+
+    async def download(key: int) -> Optional[int]:
+        if key == 1:
+            raise download_error
+        # Nothing to render, still done
+        return None if key == 4 else key
+
+    async def render(key: int, downloaded: int) -> int:
+        if key == 2:
+            raise render_error
+        return downloaded
+
+    async def upload(key: int, rendered: int) -> None:
+        if key == 3:
+            raise upload_error
+
+    results = await run_pipeline(
+        range(5), download, render, upload, prefetch=1, max_uploads=1
+    )
+
+    assert results == {
+        0: None,
+        1: download_error,
+        2: render_error,
+        3: upload_error,
+        4: None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_prefetch_limits_downloads_in_flight():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def download(key: int) -> Optional[int]:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return key
+
+    async def render(key: int, downloaded: int) -> int:
+        await asyncio.sleep(0.005)
+        return downloaded
+
+    async def upload(key: int, rendered: int) -> None:
+        pass
+
+    await run_pipeline(range(10), download, render, upload, prefetch=3, max_uploads=1)
+
+    # The one the render stage waits for plus the prefetched ones
+    assert max_in_flight == 3 + 1
+
+
+@pytest.mark.asyncio
+async def test_stages_overlap():
+    """Time-bound stages: sequential handling takes the sum of the stages per key,
+    the pipeline gets close to the slowest stage per key."""
+    n_keys = 8
+    executor = ThreadPoolExecutor(1)
+
+    async def download(key: int) -> Optional[int]:
+        await asyncio.sleep(STAGE_SECONDS)
+        return key
+
+    async def render(key: int, downloaded: int) -> int:
+        # Blocking, like real rendering, so it has to run off the event loop
+        await asyncio.get_running_loop().run_in_executor(
+            executor, time.sleep, STAGE_SECONDS
+        )
+        return downloaded
+
+    async def upload(key: int, rendered: int) -> None:
+        await asyncio.sleep(STAGE_SECONDS)
+
+    start = time.perf_counter()
+    await run_pipeline(
+        range(n_keys), download, render, upload, prefetch=2, max_uploads=2
+    )
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+
+    sequential = 3 * STAGE_SECONDS * n_keys
+    assert elapsed < sequential / 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("prefetch,max_uploads", [(0, 1), (1, 0)])
+async def test_rejects_empty_stages(prefetch: int, max_uploads: int):
+    async def stage(*_) -> None:
+        pass
+
+    with pytest.raises(ValueError):
+        await run_pipeline([1], stage, stage, stage, prefetch, max_uploads)
@@ -0,0 +1,54 @@
+from unittest.mock import patch
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from sqlalchemy import text
+
+from app import db
+from app.db import scoped_session
+from app.pool_stats import PoolStats
+from app.services import s3_storage
+
+
+def test_hit_rate():
+    assert PoolStats().hit_rate is None
+    assert PoolStats(checkouts=4, connects=1).hit_rate == 0.75
+    assert str(PoolStats(checkouts=4, connects=1)) == (
+        "4 checkouts, 1 new connections, hit rate 75.0%"
+    )
+
+
+@pytest.mark.asyncio
+async def test_db_sessions_reuse_pooled_connections():
+    await db.warm_up(1)
+    stats = db.get_pool_stats()
+    connects = stats.connects
+
+    for _ in range(3):
+        async with scoped_session() as session:
+            await session.exec(text("SELECT 1"))  # type: ignore[call-overload]
+
+    # The warmed connection served every session
+    assert stats.connects == connects
+    assert stats.checkouts >= 4
+
+
+@pytest.mark.asyncio
+async def test_s3_requests_reuse_keep_alive_connections():
+    async def ok(_: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_get("/", ok)
+
+    with patch("app.services.s3_storage._pool_stats", PoolStats()) as stats:
+        async with TestServer(app) as server:
+            connector = s3_storage._CountingHTTPSession()._create_connector(None)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                for _ in range(3):
+                    async with session.get(server.make_url("/")) as resp:
+                        await resp.read()
+
+    assert (stats.checkouts, stats.connects) == (3, 1)
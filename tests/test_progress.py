@@ -0,0 +1,144 @@
+import asyncio
+import json
+from typing import Any, Dict, Optional
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from app.services.constants import PROGRESS_DONE, PROGRESS_STFT
+from app.services.progress import ProgressEvent, ProgressHub, ProgressPublisher
+
+
+class FakePubSub:
+    """Hands out messages put on ``messages`` like a Redis pub/sub connection."""
+
+    def __init__(self) -> None:
+        self.messages: asyncio.Queue[Dict[str, Any]] = asyncio.Queue()
+        self.subscribe = AsyncMock()
+        self.unsubscribe = AsyncMock()
+        self.aclose = AsyncMock()
+
+    async def get_message(
+        self, ignore_subscribe_messages: bool, timeout: float
+    ) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def send(self, event: ProgressEvent) -> None:
+        self.messages.put_nowait(
+            {
+                "type": "message",
+                "channel": f"audio-progress:{event.audio_id}".encode(),
+                "data": event.model_dump_json().encode(),
+            }
+        )
+
+
+@pytest.fixture
+def pubsub() -> FakePubSub:
+    return FakePubSub()
+
+
+@pytest.fixture
+def hub(pubsub: FakePubSub) -> ProgressHub:
+    redis = MagicMock()
+    redis.pubsub.return_value = pubsub
+    return ProgressHub(redis)
+
+
+@pytest.mark.asyncio
+async def test_publish_sends_event_to_audio_channel():
+    redis = MagicMock()
+    redis.publish = AsyncMock()
+    audio_id = uuid4()
+
+    await ProgressPublisher(redis).publish(audio_id, PROGRESS_STFT, 40.0)
+
+    channel, data = redis.publish.await_args.args
+    assert channel == f"audio-progress:{audio_id}"
+    assert json.loads(data) == {
+        "audio_id": str(audio_id),
+        "stage": PROGRESS_STFT,
+        "percent": 40.0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_publish_errors_are_not_raised():
+    redis = MagicMock()
+    redis.publish = AsyncMock(side_effect=ConnectionError("down"))
+
+    await ProgressPublisher(redis).publish(uuid4(), PROGRESS_DONE)
+
+
+@pytest.mark.asyncio
+async def test_hub_fans_out_events_to_subscribers_of_the_audio(
+    hub: ProgressHub, pubsub: FakePubSub
+):
+    audio_id, other_id = uuid4(), uuid4()
+    event = ProgressEvent(audio_id=audio_id, stage=PROGRESS_DONE)
+
+    async with (
+        hub.subscribe(audio_id) as first,
+        hub.subscribe(audio_id) as second,
+        hub.subscribe(other_id) as other,
+    ):
+        # One Redis subscription per audio, however many clients wait on it
+        assert [c.args for c in pubsub.subscribe.await_args_list] == [
+            (f"audio-progress:{audio_id}",),
+            (f"audio-progress:{other_id}",),
+        ]
+
+        pubsub.send(event)
+
+        assert await asyncio.wait_for(first.get(), 1) == event
+        assert await asyncio.wait_for(second.get(), 1) == event
+        assert other.empty()
+
+    assert sorted(c.args for c in pubsub.unsubscribe.await_args_list) == sorted(
+        [(f"audio-progress:{audio_id}",), (f"audio-progress:{other_id}",)]
+    )
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_hub_keeps_subscription_while_clients_remain(
+    hub: ProgressHub, pubsub: FakePubSub
+):
+    audio_id = uuid4()
+
+    async with hub.subscribe(audio_id):
+        async with hub.subscribe(audio_id):
+            pass
+        pubsub.unsubscribe.assert_not_awaited()
+
+    pubsub.unsubscribe.assert_awaited_once_with(f"audio-progress:{audio_id}")
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_loses_oldest_events(
+    hub: ProgressHub, pubsub: FakePubSub
+):
+    audio_id = uuid4()
+    events = [
+        ProgressEvent(audio_id=audio_id, stage=PROGRESS_STFT, percent=i)
+        for i in range(100)
+    ]
+
+    async with hub.subscribe(audio_id) as queue:
+        for event in events:
+            pubsub.send(event)
+        while not pubsub.messages.empty():
+            await asyncio.sleep(0.01)
+
+        received = [queue.get_nowait() for _ in range(queue.qsize())]
+
+    assert 0 < len(received) < len(events)
+    newest = slice(len(events) - len(received), None)
+    assert received == events[newest]
+    await hub.close()
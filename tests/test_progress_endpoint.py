@@ -0,0 +1,146 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Generator, List, cast
+from unittest.mock import AsyncMock, Mock
+from uuid import UUID, uuid4
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect
+
+from app.api.routes import (get_audio_status_service, get_progress_hub,
+                            stream_audio_progress)
+from app.main import app
+from app.models.constants import AUDIO_STATUS_DONE, AUDIO_STATUS_PENDING
+from app.services.constants import (PROGRESS_DONE, PROGRESS_DOWNLOADED,
+                                    PROGRESS_STFT)
+from app.services.progress import ProgressEvent, ProgressHub
+
+client = TestClient(app)
+
+
+class FakeHub:
+    """Subscribers get ``events`` right away, as if the worker published them."""
+
+    def __init__(self) -> None:
+        self.events: List[ProgressEvent] = []
+        self.active = 0
+
+    @asynccontextmanager
+    async def subscribe(
+        self, audio_id: UUID
+    ) -> AsyncIterator["asyncio.Queue[ProgressEvent]"]:
+        queue: asyncio.Queue[ProgressEvent] = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        self.active += 1
+        try:
+            yield queue
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def hub() -> FakeHub:
+    return FakeHub()
+
+
+@pytest.fixture
+def mock_status_service() -> Mock:
+    service = Mock()
+    service.get_statuses = AsyncMock()
+    return service
+
+
+@pytest.fixture(autouse=True)
+def overrides(hub: FakeHub, mock_status_service: Mock) -> Generator[None, None, None]:
+    app.dependency_overrides[get_progress_hub] = lambda: hub
+    app.dependency_overrides[get_audio_status_service] = lambda: mock_status_service
+    yield
+    app.dependency_overrides.clear()
+
+
+def parse_events(body: str) -> List[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_streams_events_until_done(hub: FakeHub, mock_status_service: Mock):
+    audio_id = uuid4()
+    mock_status_service.get_statuses.return_value = {audio_id: AUDIO_STATUS_PENDING}
+    hub.events = [
+        ProgressEvent(audio_id=audio_id, stage=PROGRESS_DOWNLOADED),
+        ProgressEvent(audio_id=audio_id, stage=PROGRESS_STFT, percent=50.0),
+        ProgressEvent(audio_id=audio_id, stage=PROGRESS_DONE),
+    ]
+
+    response = client.get(f"/audio/{audio_id}/events")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert [stage for stage, _ in parse_events(response.text)] == [
+        PROGRESS_DOWNLOADED,
+        PROGRESS_STFT,
+        PROGRESS_DONE,
+    ]
+    assert parse_events(response.text)[1][1]["percent"] == 50.0
+    assert hub.active == 0
+
+
+def test_done_audio_gets_done_event_only(hub: FakeHub, mock_status_service: Mock):
+    audio_id = uuid4()
+    mock_status_service.get_statuses.return_value = {audio_id: AUDIO_STATUS_DONE}
+
+    response = client.get(f"/audio/{audio_id}/events")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert parse_events(response.text) == [
+        (
+            PROGRESS_DONE,
+            {"audio_id": str(audio_id), "stage": PROGRESS_DONE, "percent": None},
+        )
+    ]
+    assert hub.active == 0
+
+
+def test_missing_audio(hub: FakeHub, mock_status_service: Mock):
+    audio_id = uuid4()
+    mock_status_service.get_statuses.return_value = {audio_id: None}
+
+    response = client.get(f"/audio/{audio_id}/events")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert hub.active == 0
+
+
+def test_progress_events_disabled():
+    app.dependency_overrides[get_progress_hub] = lambda: None
+
+    response = client.get(f"/audio/{uuid4()}/events")
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+@pytest.mark.asyncio
+async def test_subscription_is_closed_when_the_response_fails_to_start(
+    hub: FakeHub, mock_status_service: Mock
+):
+    audio_id = uuid4()
+    mock_status_service.get_statuses.return_value = {audio_id: AUDIO_STATUS_PENDING}
+    response = await stream_audio_progress(
+        audio_id, mock_status_service, cast(ProgressHub, hub)
+    )
+    assert hub.active == 1
+
+    # The client is gone before the headers are sent, the generator never starts
+    send = AsyncMock(side_effect=OSError("Connection reset"))
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(ClientDisconnect):
+        await response(scope, AsyncMock(), send)
+
+    assert hub.active == 0
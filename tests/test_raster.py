@@ -0,0 +1,78 @@
+from io import BytesIO
+from typing import Tuple
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services.raster import (CHANNEL_HEIGHT_PX, CHANNEL_WIDTH_PX, colorize,
+                                 colormap_lut, encode_png, render_png,
+                                 resample)
+
+
+def test_encode_png_roundtrips_through_pillow():
+    rng = np.random.default_rng(42)
+    rgb = rng.integers(0, 256, size=(17, 31, 3), dtype=np.uint8)
+
+    decoded = Image.open(BytesIO(encode_png(rgb)))
+
+    assert decoded.mode == "RGB"
+    np.testing.assert_array_equal(np.asarray(decoded), rgb)
+
+
+def test_resample_keeps_corners_and_puts_high_frequencies_on_top():
+    matrix = np.array([[0.0, 1.0], [2.0, 3.0]], dtype=np.float32)
+
+    resampled = resample(matrix, 4, 8)
+
+    assert resampled.shape == (4, 8)
+    # Row 0 of the matrix is the lowest frequency and ends up at the bottom
+    assert resampled[-1, 0] < resampled[-1, -1] < resampled[0, -1]
+    assert resampled.min() >= matrix.min()
+    assert resampled.max() <= matrix.max()
+
+
+def test_colorize_spans_whole_colormap():
+    lut = colormap_lut()
+    db = np.array([[-100.0, -50.0, 0.0]], dtype=np.float32)
+
+    rgb = colorize(db, lut)
+
+    np.testing.assert_array_equal(rgb[0, 0], lut[0])
+    np.testing.assert_array_equal(rgb[0, -1], lut[-1])
+
+
+def test_colorize_constant_input():
+    rgb = colorize(np.full((2, 2), -3.0, dtype=np.float32), colormap_lut())
+
+    assert (rgb == colormap_lut()[0]).all()
+
+
+@pytest.mark.parametrize("annotated", [True, False])
+@pytest.mark.parametrize("n_channels", [1, 2, 3])
+def test_render_png_size(annotated: bool, n_channels: int):
+    rng = np.random.default_rng(7)
+    f = np.linspace(0, 11025, 129)
+    t = np.linspace(0.005, 1.5, 300)
+    db = [rng.normal(-60, 10, (129, 300)).astype(np.float32)] * n_channels
+
+    image = Image.open(BytesIO(render_png(f, t, db, "test.wav", annotated=annotated)))
+
+    assert image.size == (CHANNEL_WIDTH_PX, CHANNEL_HEIGHT_PX * n_channels)
+
+
+@pytest.mark.parametrize("n_channels", [1, 3])
+@pytest.mark.parametrize("channel_size", [(64, 400), (1000, 64), (64, 64)])
+def test_render_png_annotated_at_small_sizes(
+    n_channels: int, channel_size: Tuple[int, int]
+):
+    f = np.linspace(0, 11025, 129)
+    t = np.linspace(0.005, 1.5, 300)
+    db = [np.zeros((129, 300), dtype=np.float32)] * n_channels
+
+    image = Image.open(
+        BytesIO(render_png(f, t, db, "test.wav", channel_size=channel_size))
+    )
+
+    width, channel_height = channel_size
+    assert image.size == (width, channel_height * n_channels)
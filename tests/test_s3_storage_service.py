@@ -1,12 +1,22 @@
-from typing import Iterator
+import inspect
+import socket
+from io import BytesIO
+from typing import AsyncIterator, Iterator
 from unittest.mock import AsyncMock, patch
 from uuid import uuid4
 
+import aiohttp
 import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from botocore.awsrequest import AWSPreparedRequest
 from botocore.exceptions import ClientError
 
-from app.services.s3_storage import S3StorageService
-from tests.utils import MockAsyncContextManager
+from app.pool_stats import PoolStats
+from app.services.s3_storage import (PresignedUpload, S3StorageService,
+                                     _CountingHTTPSession, open_s3_stores,
+                                     s3_client_config)
+from tests.utils import MockAsyncContextManager, make_settings
 
 
 @pytest.fixture
@@ -79,6 +89,127 @@ async def test_store_success(
     )
 
 
+@pytest.mark.asyncio
+async def test_store_with_metadata(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    uuid = uuid4()
+    data = b"Engel"
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        await service.store(uuid, data, "image/png", metadata={"render-params": "abc"})
+
+    mock_s3_client.put_object.assert_awaited_once_with(
+        Bucket=bucket_name,
+        Key=str(uuid),
+        Body=data,
+        ContentType="image/png",
+        Metadata={"render-params": "abc"},
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_metadata(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    uuid = uuid4()
+    mock_s3_client.head_object.return_value = {"Metadata": {"render-params": "abc"}}
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        assert await service.get_metadata(uuid) == {"render-params": "abc"}
+
+    mock_s3_client.head_object.assert_awaited_once_with(
+        Bucket=bucket_name, Key=str(uuid)
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_metadata_of_missing_object_returns_none(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    mock_s3_client.head_object.side_effect = ClientError(
+        {"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject"
+    )
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        assert await service.get_metadata(uuid4()) is None
+
+
+@pytest.mark.asyncio
+async def test_delete(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    uuid = uuid4()
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        await service.delete(uuid)
+
+    mock_s3_client.delete_object.assert_awaited_once_with(
+        Bucket=bucket_name, Key=str(uuid)
+    )
+
+
+async def _aiter_chunks(*chunks: bytes) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_store_stream_uploads_parts_and_completes(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    uuid = uuid4()
+    upload_id = "upload-id"
+    mock_s3_client.create_multipart_upload.return_value = {"UploadId": upload_id}
+    mock_s3_client.upload_part.side_effect = [{"ETag": "etag-1"}, {"ETag": "etag-2"}]
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        await service.store_stream(
+            uuid, _aiter_chunks(b"Mein", b" Herz", b" brennt"), "audio/wav", part_size=8
+        )
+
+    mock_s3_client.create_multipart_upload.assert_awaited_once_with(
+        Bucket=bucket_name, Key=str(uuid), ContentType="audio/wav"
+    )
+    assert [c.kwargs["Body"] for c in mock_s3_client.upload_part.await_args_list] == [
+        b"Mein Her",
+        b"z brennt",
+    ]
+    mock_s3_client.complete_multipart_upload.assert_awaited_once_with(
+        Bucket=bucket_name,
+        Key=str(uuid),
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": [
+                {"ETag": "etag-1", "PartNumber": 1},
+                {"ETag": "etag-2", "PartNumber": 2},
+            ]
+        },
+    )
+    mock_s3_client.abort_multipart_upload.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_store_stream_aborts_on_failure(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    uuid = uuid4()
+    upload_id = "upload-id"
+    mock_s3_client.create_multipart_upload.return_value = {"UploadId": upload_id}
+    mock_s3_client.upload_part.side_effect = ClientError(
+        {"Error": {"Code": "500", "Message": "Internal Error"}}, "UploadPart"
+    )
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        with pytest.raises(ClientError):
+            await service.store_stream(uuid, _aiter_chunks(b"Sonne"))
+
+    mock_s3_client.complete_multipart_upload.assert_not_called()
+    mock_s3_client.abort_multipart_upload.assert_awaited_once_with(
+        Bucket=bucket_name, Key=str(uuid), UploadId=upload_id
+    )
+
+
 @pytest.mark.asyncio
 async def test_retrieve_success(
     patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
@@ -103,6 +234,71 @@ async def test_retrieve_success(
     )
 
 
+def _mock_streaming_body(data: bytes) -> AsyncMock:
+    """Body whose ``read(n)`` returns successive slices of ``data``, like a real stream."""
+    stream = BytesIO(data)
+
+    mock_body = AsyncMock()
+    mock_body.read.side_effect = lambda n=-1: stream.read(n)
+    mock_body.__aenter__.return_value = mock_body
+    return mock_body
+
+
+@pytest.mark.asyncio
+async def test_retrieve_chunks_yields_object_in_chunks(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    uuid = uuid4()
+    data = b"Ich will, ich will"
+
+    mock_s3_client.get_object.return_value = {"Body": _mock_streaming_body(data)}
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        chunks = [chunk async for chunk in service.retrieve_chunks(uuid, chunk_size=5)]
+
+    assert chunks == [b"Ich w", b"ill, ", b"ich w", b"ill"]
+    mock_s3_client.get_object.assert_awaited_once_with(
+        Bucket=bucket_name, Key=str(uuid)
+    )
+
+
+@pytest.mark.asyncio
+async def test_retrieve_range_requests_byte_range(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    uuid = uuid4()
+
+    mock_s3_client.get_object.return_value = {"Body": _mock_streaming_body(b"RIFF")}
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        result = await service.retrieve_range(uuid, 0, 3)
+
+    assert result == b"RIFF"
+    mock_s3_client.get_object.assert_awaited_once_with(
+        Bucket=bucket_name, Key=str(uuid), Range="bytes=0-3"
+    )
+
+
+@pytest.mark.parametrize("spool_max_size", [1024, 4])
+@pytest.mark.asyncio
+async def test_download_to_tempfile(
+    patch_s3_client: None,
+    mock_s3_client: AsyncMock,
+    bucket_name: str,
+    spool_max_size: int,
+):
+    uuid = uuid4()
+    data = b"Keine Lust, keine Lust"
+
+    mock_s3_client.get_object.return_value = {"Body": _mock_streaming_body(data)}
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        with await service.download_to_tempfile(
+            uuid, chunk_size=3, spool_max_size=spool_max_size
+        ) as tmp:
+            assert tmp.read() == data
+
+
 @pytest.mark.asyncio
 async def test_retrieve_inexistent_uuid_raises_404(
     patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
@@ -121,3 +317,159 @@ async def test_retrieve_inexistent_uuid_raises_404(
     mock_s3_client.get_object.assert_awaited_once_with(
         Bucket=bucket_name, Key=str(uuid)
     )
+
+
+@pytest.mark.asyncio
+async def test_stores_share_one_client(mock_s3_client: AsyncMock):
+    with patch(
+        "app.services.s3_storage.aioboto3.Session.client",
+        return_value=MockAsyncContextManager(mock_s3_client),
+    ) as client:
+        async with open_s3_stores("audio", "spectrograms") as stores:
+            assert stores["audio"]._client is stores["spectrograms"]._client
+
+    client.assert_called_once()
+    assert mock_s3_client.head_bucket.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_bucket_check_can_be_skipped(
+    patch_s3_client: None, mock_s3_client: AsyncMock
+):
+    settings = make_settings(S3_CHECK_BUCKETS=False)
+
+    with patch("app.services.s3_storage.get_settings", return_value=settings):
+        async with open_s3_stores("audio", "spectrograms"):
+            pass
+
+    mock_s3_client.head_bucket.assert_not_awaited()
+
+
+def test_client_config_from_settings():
+    settings = make_settings(S3_MAX_POOL_CONNECTIONS=64, S3_RETRY_MODE="standard")
+
+    config = s3_client_config(settings)
+
+    assert config.max_pool_connections == 64
+    assert (config.connect_timeout, config.read_timeout) == (5.0, 60.0)
+    assert config.retries == {"max_attempts": 5, "mode": "standard"}
+    assert config.tcp_keepalive is True
+    assert config.connector_args == {"keepalive_timeout": 12.0}
+
+
+@pytest.mark.asyncio
+async def test_http_session_applies_socket_options():
+    async def ok(_: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_get("/", ok)
+    http_session = _CountingHTTPSession(
+        socket_options=[(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    )
+    sockets = []
+
+    def open_socket(addr_info):
+        sockets.append(_CountingHTTPSession._open_socket(http_session, addr_info))
+        return sockets[-1]
+
+    with patch.object(http_session, "_open_socket", open_socket):
+        async with TestServer(app) as server:
+            connector = http_session._create_connector(None)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                async with session.get(server.make_url("/")) as resp:
+                    assert await resp.text() == "ok"
+                assert sockets[0].getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+
+
+@pytest.mark.asyncio
+async def test_http_session_relies_on_aiobotocore_internals():
+    """Goes through aiobotocore's own request path, so an aiobotocore or aiohttp
+    upgrade that renames what ``_CountingHTTPSession`` overrides fails here instead of
+    silently dropping the pool stats and socket options."""
+
+    async def ok(_: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_get("/", ok)
+    assert "socket_factory" in inspect.signature(aiohttp.TCPConnector).parameters
+
+    with patch("app.services.s3_storage._pool_stats", PoolStats()) as stats:
+        async with TestServer(app) as server:
+            async with _CountingHTTPSession(
+                socket_options=[(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+            ) as http_session:
+                with patch.object(
+                    http_session, "_open_socket", wraps=http_session._open_socket
+                ) as open_socket:
+                    for _ in range(2):
+                        request = AWSPreparedRequest(
+                            "GET", str(server.make_url("/")), {}, None, False
+                        )
+                        response = await http_session.send(request)
+                        assert await response.content == b"ok"
+
+    assert (stats.checkouts, stats.connects) == (2, 1)
+    open_socket.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_presign_upload_of_small_files_is_one_put(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    uuid = uuid4()
+    mock_s3_client.generate_presigned_url.return_value = "https://s3/put"
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        upload = await service.presign_upload(uuid, 1000, expires_in=60)
+
+    assert upload == PresignedUpload(url="https://s3/put")
+    mock_s3_client.generate_presigned_url.assert_awaited_once_with(
+        "put_object", Params={"Bucket": bucket_name, "Key": str(uuid)}, ExpiresIn=60
+    )
+    mock_s3_client.create_multipart_upload.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_presign_upload_of_big_files_has_a_url_per_part(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    uuid = uuid4()
+    mock_s3_client.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+    mock_s3_client.generate_presigned_url.side_effect = (
+        lambda _, Params, ExpiresIn: f"https://s3/part/{Params['PartNumber']}"
+    )
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        upload = await service.presign_upload(
+            uuid, 25, part_size=10, multipart_threshold=20
+        )
+
+    assert upload == PresignedUpload(
+        multipart_upload_id="upload-1",
+        part_size=10,
+        part_urls=["https://s3/part/1", "https://s3/part/2", "https://s3/part/3"],
+    )
+    mock_s3_client.create_multipart_upload.assert_awaited_once_with(
+        Bucket=bucket_name, Key=str(uuid)
+    )
+
+
+@pytest.mark.asyncio
+async def test_complete_multipart_upload_orders_parts(
+    patch_s3_client: None, mock_s3_client: AsyncMock, bucket_name: str
+):
+    uuid = uuid4()
+
+    async with S3StorageService.for_bucket(bucket_name) as service:
+        await service.complete_multipart_upload(uuid, "upload-1", [(2, "b"), (1, "a")])
+
+    mock_s3_client.complete_multipart_upload.assert_awaited_once_with(
+        Bucket=bucket_name,
+        Key=str(uuid),
+        UploadId="upload-1",
+        MultipartUpload={
+            "Parts": [{"ETag": "a", "PartNumber": 1}, {"ETag": "b", "PartNumber": 2}]
+        },
+    )
@@ -0,0 +1,130 @@
+import json
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Tuple
+from unittest.mock import AsyncMock, Mock
+from uuid import UUID, uuid4
+
+import numpy as np
+import pytest
+
+from app.services.analysis_params import AnalysisParams
+from app.services.spectrogram import compute_spectrogram
+from app.services.spectrogram_matrix import (build_metadata, chunk_key,
+                                             decode_chunk, iter_chunks,
+                                             metadata_key, read_frames)
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture
+def spectrogram():
+    rng = np.random.default_rng(7)
+    f = np.linspace(0, 4000, 5)
+    t = np.arange(10) * 0.25 + 0.125
+    db = [rng.uniform(-100, 0, (5, 10)), rng.uniform(-60, 20, (5, 10))]
+    return f, t, db
+
+
+def encode(spectrogram, dtype: str) -> Tuple[UUID, Dict[str, bytes]]:
+    f, t, db = spectrogram
+    audio_id = uuid4()
+    metadata = build_metadata(f, t, db, dtype, 4, "zlib")
+    objects = {metadata_key(audio_id): json.dumps(metadata).encode()}
+    for chunk in iter_chunks(db, metadata):
+        objects[chunk_key(audio_id, chunk.channel, chunk.index)] = chunk.data
+    return audio_id, objects
+
+
+def test_metadata_describes_axes_and_chunks(spectrogram):
+    f, t, db = spectrogram
+
+    metadata = build_metadata(f, t, db, "float16", 4, "zlib")
+
+    assert metadata["shape"] == [2, 5, 10]
+    assert metadata["chunks"] == 3
+    assert metadata["f"] == f.tolist()
+    assert metadata["t_start"] == 0.125
+    assert metadata["t_step"] == 0.25
+    assert metadata["db_min"] == min(channel.min() for channel in db)
+
+
+@pytest.mark.parametrize(
+    "dtype, tolerance", [("float16", 0.05), ("uint8", 120 / 255 / 2 + 1e-4)]
+)
+def test_chunks_roundtrip_within_quantization_error(spectrogram, dtype, tolerance):
+    f, t, db = spectrogram
+    metadata = build_metadata(f, t, db, dtype, 4, "zlib")
+
+    chunks = list(iter_chunks(db, metadata))
+
+    assert [(c.channel, c.index) for c in chunks] == [
+        (ch, i) for ch in range(2) for i in range(3)
+    ]
+    for chunk in chunks:
+        decoded = decode_chunk(chunk.data, metadata)
+        expected = db[chunk.channel][:, slice(chunk.index * 4, chunk.index * 4 + 4)]
+        assert decoded.dtype == np.float32
+        np.testing.assert_allclose(decoded, expected, atol=tolerance)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "uint8"])
+def test_power_roundtrips_as_float32(dtype):
+    audio_bytes = (FIXTURES_DIR / "stereo.wav").read_bytes()
+    spectrogram = compute_spectrogram(audio_bytes, params=AnalysisParams(scale="power"))
+    metadata = build_metadata(
+        spectrogram.f,
+        spectrogram.t,
+        spectrogram.values,
+        dtype,
+        1024,
+        "zlib",
+        unit="power",
+    )
+
+    assert metadata["dtype"] == "float32"
+    assert "db_min" not in metadata
+    assert metadata["power_max"] == max(channel.max() for channel in spectrogram.values)
+    for chunk in iter_chunks(spectrogram.values, metadata):
+        expected = spectrogram.values[chunk.channel][
+            :, slice(chunk.index * 1024, (chunk.index + 1) * 1024)
+        ]
+        np.testing.assert_array_equal(decode_chunk(chunk.data, metadata), expected)
+
+
+def test_uncompressed_chunks_are_plain_npy(spectrogram):
+    f, t, db = spectrogram
+    metadata = build_metadata(f, t, db, "float16", 4, "none")
+
+    chunk = next(iter_chunks(db, metadata))
+
+    values = np.load(BytesIO(chunk.data))
+    assert values.dtype == np.float16
+    assert values.shape == (5, 4)
+
+
+@pytest.mark.asyncio
+async def test_read_frames_only_downloads_covering_chunks(spectrogram):
+    audio_id, objects = encode(spectrogram, "float16")
+    store = Mock()
+    store.retrieve = AsyncMock(side_effect=lambda key: objects[key])
+
+    frames = await read_frames(store, audio_id, channel=1, start=5, stop=9)
+
+    np.testing.assert_allclose(frames, spectrogram[2][1][:, 5:9], atol=0.05)
+    assert [c.args[0] for c in store.retrieve.await_args_list] == [
+        f"{audio_id}/matrix/metadata.json",
+        f"{audio_id}/matrix/1/1.npy",
+        f"{audio_id}/matrix/1/2.npy",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_read_frames_out_of_range_is_empty(spectrogram):
+    audio_id, objects = encode(spectrogram, "uint8")
+    store = Mock()
+    store.retrieve = AsyncMock(side_effect=lambda key: objects[key])
+
+    frames = await read_frames(store, audio_id, channel=0, start=10, stop=20)
+
+    assert frames.shape == (5, 0)
@@ -0,0 +1,121 @@
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from app.models.constants import AUDIO_STATUS_DONE, AUDIO_STATUS_PENDING
+from app.services.status_cache import StatusCache
+from tests.utils import MockAsyncContextManager
+
+TTL = 60
+DONE_TTL = 3600
+MISSING_TTL = 5
+
+
+@pytest.fixture
+def pipe() -> MagicMock:
+    pipe = MagicMock()
+    pipe.__len__.side_effect = lambda: pipe.set.call_count
+    pipe.execute = AsyncMock()
+    return pipe
+
+
+@pytest.fixture
+def redis(pipe: MagicMock) -> MagicMock:
+    redis = MagicMock()
+    redis.mget = AsyncMock()
+    redis.pipeline.return_value = MockAsyncContextManager(pipe)
+    return redis
+
+
+@pytest.fixture
+def cache(redis: MagicMock) -> StatusCache:
+    return StatusCache(
+        redis,
+        ttl_seconds=TTL,
+        done_ttl_seconds=DONE_TTL,
+        missing_ttl_seconds=MISSING_TTL,
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_many_returns_hits_only(cache: StatusCache, redis: MagicMock):
+    done_id, missing_id, uncached_id = uuid4(), uuid4(), uuid4()
+    redis.mget.return_value = [b"done", b"-", None]
+
+    cached = await cache.get_many([done_id, missing_id, uncached_id])
+
+    redis.mget.assert_awaited_once_with(
+        [
+            f"audio-status:{done_id}",
+            f"audio-status:{missing_id}",
+            f"audio-status:{uncached_id}",
+        ]
+    )
+    assert cached == {done_id: AUDIO_STATUS_DONE, missing_id: None}
+
+
+@pytest.mark.asyncio
+async def test_get_many_treats_redis_errors_as_misses(
+    cache: StatusCache, redis: MagicMock
+):
+    redis.mget.side_effect = ConnectionError("down")
+
+    assert await cache.get_many([uuid4()]) == {}
+
+
+@pytest.mark.asyncio
+async def test_fill_does_not_overwrite(cache: StatusCache, pipe: MagicMock):
+    pending_id, done_id, missing_id = uuid4(), uuid4(), uuid4()
+
+    await cache.fill(
+        {pending_id: AUDIO_STATUS_PENDING, done_id: AUDIO_STATUS_DONE, missing_id: None}
+    )
+
+    assert [c.args + (c.kwargs,) for c in pipe.set.call_args_list] == [
+        (f"audio-status:{pending_id}", AUDIO_STATUS_PENDING, {"ex": TTL, "nx": True}),
+        (f"audio-status:{done_id}", AUDIO_STATUS_DONE, {"ex": DONE_TTL, "nx": True}),
+        (f"audio-status:{missing_id}", "-", {"ex": MISSING_TTL, "nx": True}),
+    ]
+    pipe.execute.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_set_done_overwrites(cache: StatusCache, pipe: MagicMock):
+    audio_id = uuid4()
+
+    await cache.set_done([audio_id])
+
+    pipe.set.assert_called_once_with(
+        f"audio-status:{audio_id}", AUDIO_STATUS_DONE, ex=DONE_TTL
+    )
+    pipe.execute.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_set_overwrites_with_the_ttl_of_the_status(
+    cache: StatusCache, pipe: MagicMock
+):
+    audio_id = uuid4()
+
+    await cache.set([audio_id], AUDIO_STATUS_PENDING)
+
+    pipe.set.assert_called_once_with(
+        f"audio-status:{audio_id}", AUDIO_STATUS_PENDING, ex=TTL
+    )
+
+
+@pytest.mark.asyncio
+async def test_writes_skip_redis_when_empty(cache: StatusCache, pipe: MagicMock):
+    await cache.set_done([])
+    await cache.fill({})
+
+    pipe.execute.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_write_errors_are_not_raised(cache: StatusCache, pipe: MagicMock):
+    pipe.execute.side_effect = ConnectionError("down")
+
+    await cache.set_done([uuid4()])
@@ -0,0 +1,79 @@
+from typing import Generator
+from unittest.mock import AsyncMock, Mock
+from uuid import uuid4
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from app.api.routes import get_audio_status_service
+from app.main import app
+from app.models.constants import AUDIO_STATUS_DONE, AUDIO_STATUS_PENDING
+from app.services.constants import STATUS_BATCH_MAX_IDS
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def mock_status_service() -> Generator[Mock, None, None]:
+    service = Mock()
+    service.get_statuses = AsyncMock()
+    app.dependency_overrides[get_audio_status_service] = lambda: service
+    yield service
+    app.dependency_overrides.clear()
+
+
+def test_get_audio_status(mock_status_service: Mock):
+    audio_id = uuid4()
+    mock_status_service.get_statuses.return_value = {audio_id: AUDIO_STATUS_DONE}
+
+    response = client.get(f"/audio/{audio_id}")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"audio_id": str(audio_id), "status": AUDIO_STATUS_DONE}
+    mock_status_service.get_statuses.assert_awaited_once_with([audio_id])
+
+
+def test_get_missing_audio_status(mock_status_service: Mock):
+    audio_id = uuid4()
+    mock_status_service.get_statuses.return_value = {audio_id: None}
+
+    response = client.get(f"/audio/{audio_id}")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_get_audio_statuses(mock_status_service: Mock):
+    done_id, pending_id, missing_id = uuid4(), uuid4(), uuid4()
+    mock_status_service.get_statuses.return_value = {
+        done_id: AUDIO_STATUS_DONE,
+        pending_id: AUDIO_STATUS_PENDING,
+        missing_id: None,
+    }
+
+    response = client.post(
+        "/audio/status",
+        json={"audio_ids": [str(done_id), str(pending_id), str(missing_id)]},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "statuses": [
+            {"audio_id": str(done_id), "status": AUDIO_STATUS_DONE},
+            {"audio_id": str(pending_id), "status": AUDIO_STATUS_PENDING},
+        ],
+        "missing": [str(missing_id)],
+    }
+    mock_status_service.get_statuses.assert_awaited_once_with(
+        [done_id, pending_id, missing_id]
+    )
+
+
+@pytest.mark.parametrize("n_ids", [0, STATUS_BATCH_MAX_IDS + 1])
+def test_get_audio_statuses_limits_batch_size(mock_status_service: Mock, n_ids: int):
+    response = client.post(
+        "/audio/status", json={"audio_ids": [str(uuid4()) for _ in range(n_ids)]}
+    )
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    mock_status_service.get_statuses.assert_not_called()
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+from scipy.signal import spectrogram
+
+from app.services.constants import STFT_MAX_MEMORY_BYTES
+from app.services.stft import (StreamingSpectrogram, iter_blocks,
+                               set_fft_workers)
+
+
+@pytest.fixture
+def audio_data() -> np.ndarray:
+    rng = np.random.default_rng(1234)
+    return rng.standard_normal((2, 10_000)).astype(np.float32)
+
+
+def run_engine(
+    audio_data: np.ndarray, block_samples: int, **kwargs
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    engine = StreamingSpectrogram(
+        audio_data.shape[0], audio_data.shape[1], 22050, **kwargs
+    )
+    for block in iter_blocks(audio_data, block_samples):
+        engine.feed(block)
+    return engine.finish()
+
+
+@pytest.mark.parametrize("block_samples", [1, 100, 255, 256, 257, 4096, 10_000])
+@pytest.mark.parametrize("max_memory_bytes", [1, 256 * 1024 * 1024])
+def test_matches_scipy_spectrogram(
+    audio_data: np.ndarray, block_samples: int, max_memory_bytes: int
+):
+    """Arbitrary block sizes and memory budgets (the tiny one forces one segment per
+    transform and a memory-mapped output) must not change the result."""
+    f, t, sxx = run_engine(audio_data, block_samples, max_memory_bytes=max_memory_bytes)
+
+    for ch in range(audio_data.shape[0]):
+        expected_f, expected_t, expected_sxx = spectrogram(audio_data[ch], 22050)
+
+        np.testing.assert_array_equal(f, expected_f)
+        np.testing.assert_array_equal(t, expected_t)
+        assert sxx[ch].dtype == expected_sxx.dtype
+        np.testing.assert_allclose(sxx[ch], expected_sxx, rtol=1e-6)
+
+
+def test_output_is_memory_mapped_above_memory_ceiling(audio_data: np.ndarray):
+    _, _, sxx = run_engine(audio_data, 1000, max_memory_bytes=1024)
+
+    assert isinstance(sxx, np.memmap)
+
+
+def test_short_signal_shrinks_segment_like_scipy():
+    audio_data = np.linspace(-1, 1, 100, dtype=np.float32)[np.newaxis, :]
+
+    f, t, sxx = run_engine(audio_data, 10)
+
+    with pytest.warns(UserWarning):
+        expected_f, expected_t, expected_sxx = spectrogram(audio_data[0], 22050)
+
+    np.testing.assert_array_equal(f, expected_f)
+    np.testing.assert_array_equal(t, expected_t)
+    np.testing.assert_allclose(sxx[0], expected_sxx, rtol=1e-6)
+
+
+def test_returns_only_complete_segments_if_input_ends_early(audio_data: np.ndarray):
+    engine = StreamingSpectrogram(2, audio_data.shape[1] * 2, 22050)
+    engine.feed(audio_data)
+
+    _, t, sxx = engine.finish()
+
+    _, expected_t, expected_sxx = spectrogram(audio_data[0], 22050)
+    np.testing.assert_array_equal(t, expected_t)
+    np.testing.assert_allclose(sxx[0], expected_sxx, rtol=1e-6)
+
+
+@pytest.mark.parametrize("n_channels,n_samples", [(0, 100), (1, 0)])
+def test_rejects_empty_audio(n_channels: int, n_samples: int):
+    with pytest.raises(ValueError):
+        StreamingSpectrogram(n_channels, n_samples, 22050)
+
+
+@pytest.mark.parametrize("block_samples", [1, 100, 700, 4096])
+def test_negative_overlap_skips_samples_like_scipy(
+    audio_data: np.ndarray, block_samples: int
+):
+    f, t, sxx = run_engine(audio_data, block_samples, noverlap=-444)
+
+    expected_f, expected_t, expected_sxx = spectrogram(
+        audio_data[0], 22050, noverlap=-444
+    )
+    np.testing.assert_array_equal(f, expected_f)
+    np.testing.assert_array_equal(t, expected_t)
+    np.testing.assert_allclose(sxx[0], expected_sxx, rtol=1e-6)
+
+
+def test_blocks_stay_within_the_memory_budget_with_a_long_hop():
+    # A 2 h, 96 kHz, 8-channel file in fast mode hops 345408 samples per 256
+    engine = StreamingSpectrogram(8, 2 * 3600 * 96000, 96000, noverlap=-345152)
+
+    assert engine.block_samples * 8 * 4 <= STFT_MAX_MEMORY_BYTES // 2
+
+
+def test_fft_workers_do_not_change_the_result(audio_data: np.ndarray):
+    expected = run_engine(audio_data, 4096)[2]
+
+    set_fft_workers(4)
+    try:
+        np.testing.assert_array_equal(run_engine(audio_data, 4096)[2], expected)
+    finally:
+        set_fft_workers(1)
+
+    with pytest.raises(ValueError):
+        set_fft_workers(0)
@@ -0,0 +1,56 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from app.services.task_batcher import TaskBatcher
+
+
+@pytest.mark.asyncio
+async def test_sends_batch_when_full():
+    send = Mock()
+    batcher: TaskBatcher[int] = TaskBatcher(send, max_size=3, max_wait=60)
+
+    for item in range(7):
+        batcher.add(item)
+
+    assert send.call_args_list == [(([0, 1, 2],),), (([3, 4, 5],),)]
+
+
+@pytest.mark.asyncio
+async def test_sends_partial_batch_after_max_wait():
+    send = Mock()
+    batcher: TaskBatcher[int] = TaskBatcher(send, max_size=10, max_wait=0.01)
+
+    batcher.add(1)
+    batcher.add(2)
+    send.assert_not_called()
+
+    await asyncio.sleep(0.05)
+
+    send.assert_called_once_with([1, 2])
+
+
+@pytest.mark.asyncio
+async def test_full_batch_cancels_timer():
+    send = Mock()
+    batcher: TaskBatcher[int] = TaskBatcher(send, max_size=2, max_wait=0.01)
+
+    batcher.add(1)
+    batcher.add(2)
+    await asyncio.sleep(0.05)
+
+    send.assert_called_once_with([1, 2])
+
+
+@pytest.mark.asyncio
+async def test_flush():
+    send = Mock()
+    batcher: TaskBatcher[int] = TaskBatcher(send, max_size=10, max_wait=60)
+
+    batcher.flush()
+    send.assert_not_called()
+
+    batcher.add(1)
+    batcher.flush()
+    send.assert_called_once_with([1])
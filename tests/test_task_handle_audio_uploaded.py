@@ -1,14 +1,60 @@
+import asyncio
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import replace
+from io import BytesIO
 from mimetypes import types_map
+from multiprocessing import get_context
+from pathlib import Path
 from typing import Generator, cast
 from unittest.mock import AsyncMock, MagicMock, patch
 from uuid import UUID, uuid4
 
+import numpy as np
 import pytest
 from botocore.exceptions import ClientError
 
+from app.config import get_settings
 from app.models.audio import Audio
 from app.models.constants import AUDIO_STATUS_PENDING
-from app.tasks.audio import _handle_audio_uploaded_async
+from app.services.analysis_params import (DEFAULT_ANALYSIS_PARAMS,
+                                          AnalysisParams)
+from app.services.constants import (PROGRESS_DONE, PROGRESS_DOWNLOADED,
+                                    PROGRESS_STFT, PROGRESS_STORED,
+                                    RENDER_PARAMS_METADATA_KEY)
+from app.services.spectrogram import (Spectrogram, compute_spectrogram,
+                                      render_params_hash)
+from app.services.tiles import iter_tile_batches
+from app.tasks.audio import (_handle_audio_uploaded_async, _load_values,
+                             _render_path, _RenderOptions, _store_tiles)
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+def expected_render_options() -> dict:
+    settings = get_settings()
+    return dict(
+        stft_max_memory_bytes=settings.STFT_MAX_MEMORY_BYTES,
+        renderer=settings.SPECTROGRAM_RENDERER,
+        annotated=settings.SPECTROGRAM_ANNOTATED,
+        # No progress publisher outside of a worker
+        progress=None,
+        params=DEFAULT_ANALYSIS_PARAMS,
+    )
+
+
+def expected_metadata() -> dict:
+    settings = get_settings()
+    return {
+        RENDER_PARAMS_METADATA_KEY: render_params_hash(
+            renderer=settings.SPECTROGRAM_RENDERER,
+            annotated=settings.SPECTROGRAM_ANNOTATED,
+        )
+    }
 
 
 @pytest.fixture
@@ -36,11 +82,14 @@ def patch_audio_and_spectrogram_store():
 
     audio_store = MagicMock()
     audio_store.store = AsyncMock()
-    audio_store.retrieve = AsyncMock(return_value=expected_data)
-    audio_store._expected_data = expected_data
+    audio_store._expected_data = BytesIO(expected_data)
+    audio_store.download_to_tempfile = AsyncMock(
+        return_value=audio_store._expected_data
+    )
 
     spectrogram_store = MagicMock()
     spectrogram_store.store = AsyncMock()
+    spectrogram_store.get_metadata = AsyncMock(return_value=None)
 
     with (
         patch("app.tasks.audio.get_audio_store", return_value=audio_store),
@@ -69,16 +118,59 @@ async def test_worker_handles_valid_audio(
     audio_store, spectrogram_store = patch_audio_and_spectrogram_store
 
     mock_repo.get_by_id.assert_awaited_once_with(fake_audio.id)
-    audio_store.retrieve.assert_awaited_once_with(fake_audio.id)
+    audio_store.download_to_tempfile.assert_awaited_once_with(fake_audio.id)
 
     patch_generate_spectrogram.assert_called_once_with(
-        audio_store._expected_data, fake_audio.filename
+        audio_store._expected_data, fake_audio.filename, **expected_render_options()
     )
 
     spectrogram_store.store.assert_called_once_with(
-        fake_audio.id, patch_generate_spectrogram.return_value, types_map[".png"]
+        fake_audio.id,
+        patch_generate_spectrogram.return_value,
+        types_map[".png"],
+        metadata=expected_metadata(),
     )
     mock_repo.mark_done.assert_awaited_once_with(fake_audio.id)
+    # Temp file is closed once the spectrogram is generated
+    assert audio_store._expected_data.closed
+
+
+@pytest.mark.asyncio
+async def test_worker_reuses_spectrogram_rendered_with_same_params(
+    patch_generate_spectrogram: MagicMock,
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    audio_store, spectrogram_store = patch_audio_and_spectrogram_store
+    spectrogram_store.get_metadata.return_value = expected_metadata()
+
+    await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
+
+    spectrogram_store.get_metadata.assert_awaited_once_with(fake_audio.id)
+    audio_store.download_to_tempfile.assert_not_called()
+    patch_generate_spectrogram.assert_not_called()
+    spectrogram_store.store.assert_not_called()
+    mock_repo.mark_done.assert_awaited_once_with(fake_audio.id)
+
+
+@pytest.mark.asyncio
+async def test_worker_rerenders_spectrogram_rendered_with_other_params(
+    patch_generate_spectrogram: MagicMock,
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    _, spectrogram_store = patch_audio_and_spectrogram_store
+    spectrogram_store.get_metadata.return_value = {
+        RENDER_PARAMS_METADATA_KEY: "something else"
+    }
+
+    await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
+
+    patch_generate_spectrogram.assert_called_once()
+    spectrogram_store.store.assert_awaited_once()
+    mock_repo.mark_done.assert_awaited_once_with(fake_audio.id)
 
 
 @pytest.mark.asyncio
@@ -95,7 +187,7 @@ async def test_worker_handles_missing_audio_from_db(
     await _handle_audio_uploaded_async(inexistent_audio_id)
 
     patch_generate_spectrogram.assert_not_called()
-    audio_store.retrieve.assert_not_called()
+    audio_store.download_to_tempfile.assert_not_called()
     spectrogram_store.store.assert_not_called()
     mock_repo.get_by_id.assert_awaited_once_with(inexistent_audio_id)
     mock_repo.mark_done.assert_not_called()
@@ -111,8 +203,8 @@ async def test_worker_doesnt_raise_on_audio_missing_from_store(
 
     audio_store, spectrogram_store = patch_audio_and_spectrogram_store
 
-    audio_store.retrieve.return_value = None
-    audio_store.retrieve.side_effect = ClientError(
+    audio_store.download_to_tempfile.return_value = None
+    audio_store.download_to_tempfile.side_effect = ClientError(
         {
             "Error": {
                 "Code": "NoSuchKey",
@@ -127,11 +219,11 @@ async def test_worker_doesnt_raise_on_audio_missing_from_store(
 
     assert (
         exc.value.response["Error"]["Code"]
-        == audio_store.retrieve.side_effect.response["Error"]["Code"]
+        == audio_store.download_to_tempfile.side_effect.response["Error"]["Code"]
     )
     mock_repo.get_by_id.assert_awaited_once_with(fake_audio.id)
     patch_generate_spectrogram.assert_not_called()
-    audio_store.retrieve.assert_called_once_with(fake_audio.id)
+    audio_store.download_to_tempfile.assert_called_once_with(fake_audio.id)
     spectrogram_store.store.assert_not_called()
     mock_repo.mark_done.assert_not_called()
 
@@ -151,10 +243,13 @@ async def test_worker_raises_if_mark_done_fails(
         await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
 
     patch_generate_spectrogram.assert_called_once_with(
-        audio_store._expected_data, fake_audio.filename
+        audio_store._expected_data, fake_audio.filename, **expected_render_options()
     )
     spectrogram_store.store.assert_called_once_with(
-        fake_audio.id, patch_generate_spectrogram.return_value, types_map[".png"]
+        fake_audio.id,
+        patch_generate_spectrogram.return_value,
+        types_map[".png"],
+        metadata=expected_metadata(),
     )
 
     mock_repo.mark_done.assert_awaited_once_with(fake_audio.id)
@@ -175,7 +270,294 @@ async def test_worker_raises_if_spectrogram_generation_fails(
         await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
 
     patch_generate_spectrogram.assert_called_once_with(
-        audio_store._expected_data, fake_audio.filename
+        audio_store._expected_data, fake_audio.filename, **expected_render_options()
     )
     spectrogram_store.store.assert_not_called()
     mock_repo.mark_done.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_worker_writes_done_status_through_to_cache(
+    patch_generate_spectrogram: MagicMock,
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    status_cache = MagicMock()
+    status_cache.set_done = AsyncMock()
+
+    with patch("app.tasks.audio.get_status_cache", return_value=status_cache):
+        await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
+
+    mock_repo.mark_done.assert_awaited_once_with(fake_audio.id)
+    status_cache.set_done.assert_awaited_once_with([fake_audio.id])
+
+
+@pytest.mark.asyncio
+async def test_worker_publishes_progress(
+    patch_generate_spectrogram: MagicMock,
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    publisher = MagicMock()
+    publisher.publish = AsyncMock()
+
+    def render(audio_file, filename, progress, **_):
+        progress(PROGRESS_STFT, 100.0)
+        return b"png"
+
+    patch_generate_spectrogram.side_effect = render
+
+    with patch("app.tasks.audio.get_progress_publisher", return_value=publisher):
+        await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
+
+    # The render thread's publish is handed to the loop, let it run
+    await asyncio.sleep(0)
+
+    assert {c.args for c in publisher.publish.await_args_list} == {
+        (fake_audio.id, PROGRESS_DOWNLOADED),
+        (fake_audio.id, PROGRESS_STFT, 100.0),
+        (fake_audio.id, PROGRESS_STORED),
+        (fake_audio.id, PROGRESS_DONE),
+    }
+    assert publisher.publish.await_args_list[-1].args == (fake_audio.id, PROGRESS_DONE)
+
+
+@pytest.mark.asyncio
+async def test_worker_stores_tiles_before_spectrogram(
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    settings = get_settings().model_copy(
+        update=dict(SPECTROGRAM_TILES_ENABLED=True, SPECTROGRAM_TILE_SIZE=4)
+    )
+    _, spectrogram_store = patch_audio_and_spectrogram_store
+    spectrogram = Spectrogram(
+        f=np.linspace(0, 100, 4), t=np.linspace(0, 1, 8), values=[np.zeros((4, 8))]
+    )
+
+    with (
+        patch("app.tasks.audio.get_settings", return_value=settings),
+        patch("app.tasks.audio.compute_spectrogram", return_value=spectrogram),
+        patch("app.tasks.audio.render_spectrogram", return_value=b"png"),
+    ):
+        await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
+
+    keys = [c.args[0] for c in spectrogram_store.store.await_args_list]
+    # 2 tiles at zoom 1, 1 at zoom 0, then the manifest, then the spectrogram
+    assert sorted(keys[:3]) == [
+        f"{fake_audio.id}/tiles/0/0/0/0.png",
+        f"{fake_audio.id}/tiles/0/1/0/0.png",
+        f"{fake_audio.id}/tiles/0/1/1/0.png",
+    ]
+    assert keys[3:] == [f"{fake_audio.id}/tiles/manifest.json", fake_audio.id]
+    # Tiles are part of the render params, a spectrogram without them is rendered again
+    metadata = spectrogram_store.store.await_args_list[-1].kwargs["metadata"]
+    assert metadata != expected_metadata()
+
+
+@pytest.mark.asyncio
+async def test_worker_renders_tiles_with_the_requested_colormap(
+    patch_audio_and_spectrogram_store: MagicMock,
+):
+    options = replace(
+        _RenderOptions.from_settings(AnalysisParams(colormap="magma")),
+        tiles=True,
+        tile_size=4,
+        tile_pooling="max",
+    )
+    spectrogram = Spectrogram(
+        f=np.linspace(0, 100, 4), t=np.linspace(0, 1, 8), values=[np.zeros((4, 8))]
+    )
+
+    with patch(
+        "app.tasks.audio.iter_tile_batches", wraps=iter_tile_batches
+    ) as tile_batches:
+        await _store_tiles(uuid4(), spectrogram, options)
+
+    assert tile_batches.call_args.kwargs["colormap"] == "magma"
+
+
+@pytest.mark.asyncio
+async def test_worker_stores_matrix_before_spectrogram(
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    settings = get_settings().model_copy(
+        update=dict(SPECTROGRAM_MATRIX_ENABLED=True, SPECTROGRAM_MATRIX_CHUNK_FRAMES=4)
+    )
+    _, spectrogram_store = patch_audio_and_spectrogram_store
+    spectrogram = Spectrogram(
+        f=np.linspace(0, 100, 4), t=np.linspace(0, 1, 6), values=[np.zeros((4, 6))]
+    )
+
+    with (
+        patch("app.tasks.audio.get_settings", return_value=settings),
+        patch("app.tasks.audio.compute_spectrogram", return_value=spectrogram),
+        patch("app.tasks.audio.render_spectrogram", return_value=b"png"),
+    ):
+        await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
+
+    keys = [c.args[0] for c in spectrogram_store.store.await_args_list]
+    assert keys == [
+        f"{fake_audio.id}/matrix/0/0.npy",
+        f"{fake_audio.id}/matrix/0/1.npy",
+        f"{fake_audio.id}/matrix/metadata.json",
+        fake_audio.id,
+    ]
+    # No tiles unless they're enabled too
+    assert not any("/tiles/" in str(key) for key in keys)
+
+
+@pytest.mark.asyncio
+async def test_worker_uses_audio_params_and_shared_file(
+    patch_generate_spectrogram: MagicMock,
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    audio_store, spectrogram_store = patch_audio_and_spectrogram_store
+    fake_audio.params = {"nperseg": 1024, "scale": "power"}
+    fake_audio.object_id = uuid4()
+
+    await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
+
+    audio_store.download_to_tempfile.assert_awaited_once_with(fake_audio.object_id)
+    assert patch_generate_spectrogram.call_args.kwargs["params"] == AnalysisParams(
+        nperseg=1024, scale="power"
+    )
+    # Stored under the audio's own ID, with a hash that tells it from the defaults
+    stored = spectrogram_store.store.await_args
+    assert stored.args[0] == fake_audio.id
+    assert stored.kwargs["metadata"] != expected_metadata()
+
+
+@pytest.mark.asyncio
+async def test_worker_renders_wait_for_a_render_slot(
+    patch_generate_spectrogram: MagicMock,
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    lock = threading.Lock()
+    running, most_running = 0, 0
+
+    def render(*_, **__):
+        nonlocal running, most_running
+        with lock:
+            running += 1
+            most_running = max(most_running, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return b"png"
+
+    patch_generate_spectrogram.side_effect = render
+
+    with (
+        ThreadPoolExecutor(2) as executor,
+        patch("app.tasks.audio.get_render_executor", return_value=executor),
+        patch("app.tasks.audio.get_render_slots", return_value=asyncio.Semaphore(1)),
+    ):
+        await asyncio.gather(
+            *(_handle_audio_uploaded_async(cast(UUID, fake_audio.id)) for _ in range(3))
+        )
+
+    # The executor could run two at once, the slot lets one through at a time
+    assert patch_generate_spectrogram.call_count == 3
+    assert most_running == 1
+
+
+@pytest.mark.asyncio
+async def test_worker_renders_in_a_process_from_a_file_on_disk(
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    settings = get_settings().model_copy(update=dict(WORKER_RENDER_EXECUTOR="process"))
+    audio_store, spectrogram_store = patch_audio_and_spectrogram_store
+    audio_file = (FIXTURES_DIR / "mono.wav").open("rb")
+    audio_store.download_to_tempfile.return_value = audio_file
+
+    with (
+        ProcessPoolExecutor(1, mp_context=get_context("forkserver")) as executor,
+        patch("app.tasks.audio.get_settings", return_value=settings),
+        patch("app.tasks.audio.get_render_executor", return_value=executor),
+    ):
+        await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
+
+    image_bytes = spectrogram_store.store.await_args.args[1]
+    assert image_bytes.startswith(b"\x89PNG")
+    assert audio_file.closed
+
+
+@pytest.mark.asyncio
+async def test_worker_maps_the_spectrogram_a_render_process_wrote(
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    settings = get_settings().model_copy(
+        update=dict(WORKER_RENDER_EXECUTOR="process", SPECTROGRAM_MATRIX_ENABLED=True)
+    )
+    audio_store, spectrogram_store = patch_audio_and_spectrogram_store
+    audio_store.download_to_tempfile.return_value = (FIXTURES_DIR / "mono.wav").open(
+        "rb"
+    )
+
+    with (
+        ProcessPoolExecutor(1, mp_context=get_context("forkserver")) as executor,
+        patch("app.tasks.audio.get_settings", return_value=settings),
+        patch("app.tasks.audio.get_render_executor", return_value=executor),
+        patch("app.tasks.audio._load_values", wraps=_load_values) as load_values,
+    ):
+        await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
+
+    (values_path,) = load_values.call_args.args
+    assert not os.path.exists(values_path)
+    keys = [c.args[0] for c in spectrogram_store.store.await_args_list]
+    assert f"{fake_audio.id}/matrix/0/0.npy" in keys
+
+
+def test_render_process_returns_the_spectrogram_by_path():
+    options = replace(_RenderOptions.from_settings(), matrix=True)
+    path = str(FIXTURES_DIR / "stereo.wav")
+
+    rendered = _render_path(path, "stereo.wav", options)
+
+    assert rendered.spectrogram is not None and rendered.values_path is not None
+    # Only the image and the axes are pickled back to the worker
+    assert rendered.spectrogram.values == []
+    assert len(pickle.dumps(rendered)) < len(rendered.image_bytes) + 64 * 1024
+
+    values = _load_values(rendered.values_path)
+    assert not os.path.exists(rendered.values_path)
+    expected = compute_spectrogram((FIXTURES_DIR / "stereo.wav").read_bytes())
+    for channel, expected_channel in zip(values, expected.values, strict=True):
+        assert isinstance(channel, np.memmap)
+        np.testing.assert_array_equal(channel, expected_channel)
+
+
+@pytest.mark.asyncio
+async def test_worker_discards_a_broken_render_process_pool(
+    patch_audio_and_spectrogram_store: MagicMock,
+    mock_repo: MagicMock,
+    fake_audio: Audio,
+):
+    settings = get_settings().model_copy(update=dict(WORKER_RENDER_EXECUTOR="process"))
+    executor = MagicMock()
+    executor.submit.side_effect = BrokenProcessPool()
+
+    with (
+        patch("app.tasks.audio.get_settings", return_value=settings),
+        patch("app.tasks.audio.get_render_executor", return_value=executor),
+        patch("app.tasks.audio.discard_render_executor") as discard,
+        pytest.raises(BrokenProcessPool),
+    ):
+        await _handle_audio_uploaded_async(cast(UUID, fake_audio.id))
+
+    discard.assert_called_once_with(executor)
+    mock_repo.mark_done.assert_not_awaited()
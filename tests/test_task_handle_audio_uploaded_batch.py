@@ -0,0 +1,171 @@
+from io import BytesIO
+from typing import Generator
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import UUID, uuid4
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.events import AUDIO_UPLOADED
+from app.models.audio import Audio
+from app.models.constants import AUDIO_STATUS_PENDING
+from app.services.constants import RENDER_PARAMS_METADATA_KEY
+from app.tasks.audio import _handle_audio_uploaded_batch_async, _RenderOptions
+
+
+@pytest.fixture
+def fake_audios() -> list[Audio]:
+    return [
+        Audio(
+            id=uuid4(),
+            filename=f"test{i}.wav",
+            content_type="audio/wav",
+            status=AUDIO_STATUS_PENDING,
+        )
+        for i in range(3)
+    ]
+
+
+@pytest.fixture
+def audio_ids(fake_audios: list[Audio]) -> list[UUID]:
+    return [audio.id for audio in fake_audios if audio.id is not None]
+
+
+@pytest.fixture
+def mock_repo(fake_audios: list[Audio]) -> Generator[MagicMock, None, None]:
+    repo = MagicMock()
+    repo.get_many = AsyncMock(return_value=fake_audios)
+    repo.mark_many_done = AsyncMock(return_value=None)
+    with patch("app.tasks.audio.AudioRepository", return_value=repo):
+        yield repo
+
+
+@pytest.fixture
+def stores() -> Generator[tuple[MagicMock, MagicMock], None, None]:
+    audio_store = MagicMock()
+    audio_store.download_to_tempfile = AsyncMock(
+        side_effect=lambda audio_id: BytesIO(str(audio_id).encode())
+    )
+
+    spectrogram_store = MagicMock()
+    spectrogram_store.store = AsyncMock()
+    spectrogram_store.get_metadata = AsyncMock(return_value=None)
+
+    with (
+        patch("app.tasks.audio.get_audio_store", return_value=audio_store),
+        patch("app.tasks.audio.get_spectrogram_store", return_value=spectrogram_store),
+    ):
+        yield audio_store, spectrogram_store
+
+
+@pytest.fixture
+def patch_generate_spectrogram() -> Generator[MagicMock, None, None]:
+    with patch(
+        "app.tasks.audio.generate_spectrogram",
+        side_effect=lambda audio_file, filename, **_: filename.encode(),
+    ) as patched:
+        yield patched
+
+
+@pytest.fixture
+def mock_send_task() -> Generator[MagicMock, None, None]:
+    with patch("app.tasks.audio.celery_app.send_task") as mock_send:
+        yield mock_send
+
+
+@pytest.mark.asyncio
+async def test_batch_processes_all_audio(
+    mock_repo: MagicMock,
+    stores: tuple[MagicMock, MagicMock],
+    patch_generate_spectrogram: MagicMock,
+    mock_send_task: MagicMock,
+    fake_audios: list[Audio],
+    audio_ids: list[UUID],
+):
+    audio_store, spectrogram_store = stores
+    status_cache = MagicMock()
+    status_cache.set_done = AsyncMock()
+
+    with patch("app.tasks.audio.get_status_cache", return_value=status_cache):
+        # IDs come in as strings from the broker
+        await _handle_audio_uploaded_batch_async([str(i) for i in audio_ids])  # type: ignore[misc]
+
+    mock_repo.get_many.assert_awaited_once_with(audio_ids)
+    assert audio_store.download_to_tempfile.await_count == len(audio_ids)
+    assert [c.args[1] for c in patch_generate_spectrogram.call_args_list] == [
+        audio.filename for audio in fake_audios
+    ]
+    assert {c.args[0] for c in spectrogram_store.store.await_args_list} == set(
+        audio_ids
+    )
+    mock_repo.mark_many_done.assert_awaited_once()
+    assert sorted(mock_repo.mark_many_done.await_args.args[0]) == sorted(audio_ids)
+    status_cache.set_done.assert_awaited_once_with(
+        mock_repo.mark_many_done.await_args.args[0]
+    )
+    mock_send_task.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_batch_skips_missing_and_already_rendered_audio(
+    mock_repo: MagicMock,
+    stores: tuple[MagicMock, MagicMock],
+    patch_generate_spectrogram: MagicMock,
+    mock_send_task: MagicMock,
+    fake_audios: list[Audio],
+    audio_ids: list[UUID],
+):
+    audio_store, spectrogram_store = stores
+    rendered_id, *other_ids = audio_ids
+    missing_id = uuid4()
+
+    params_hash = _RenderOptions.from_settings().params_hash
+    spectrogram_store.get_metadata.side_effect = lambda audio_id: (
+        {RENDER_PARAMS_METADATA_KEY: params_hash} if audio_id == rendered_id else None
+    )
+
+    await _handle_audio_uploaded_batch_async([*audio_ids, missing_id])
+
+    downloaded = {c.args[0] for c in audio_store.download_to_tempfile.await_args_list}
+    assert downloaded == set(other_ids)
+    assert patch_generate_spectrogram.call_count == len(other_ids)
+    assert sorted(mock_repo.mark_many_done.await_args.args[0]) == sorted(audio_ids)
+    mock_send_task.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_batch_hands_failed_audio_to_single_tasks(
+    mock_repo: MagicMock,
+    stores: tuple[MagicMock, MagicMock],
+    patch_generate_spectrogram: MagicMock,
+    mock_send_task: MagicMock,
+    fake_audios: list[Audio],
+    audio_ids: list[UUID],
+):
+    audio_store, spectrogram_store = stores
+    download_fails, render_fails, succeeds = audio_ids
+
+    original_download = audio_store.download_to_tempfile.side_effect
+
+    def download(audio_id: UUID):
+        if audio_id == download_fails:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return original_download(audio_id)
+
+    def render(audio_file, filename: str, **_):
+        if filename == fake_audios[1].filename:
+            raise RuntimeError("OH NO")
+        return b"png"
+
+    audio_store.download_to_tempfile.side_effect = download
+    patch_generate_spectrogram.side_effect = render
+
+    await _handle_audio_uploaded_batch_async(audio_ids)
+
+    spectrogram_store.store.assert_awaited_once()
+    assert spectrogram_store.store.await_args.args[0] == succeeds
+    mock_repo.mark_many_done.assert_awaited_once_with([succeeds])
+    assert mock_send_task.call_args_list == [
+        ((AUDIO_UPLOADED,), {"args": [download_fails]}),
+        ((AUDIO_UPLOADED,), {"args": [render_fails]}),
+    ]
@@ -0,0 +1,110 @@
+from io import BytesIO
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services.tiles import (build_manifest, downsample, iter_tile_batches,
+                                manifest_key, tile_key, zoom_levels)
+
+
+def tile_image(png: bytes) -> np.ndarray:
+    return np.asarray(Image.open(BytesIO(png)).convert("RGB"))
+
+
+def test_keys_are_grouped_under_the_audio():
+    audio_id = uuid4()
+
+    assert manifest_key(audio_id) == f"{audio_id}/tiles/manifest.json"
+    assert tile_key(audio_id, 1, 2, 3, 4) == f"{audio_id}/tiles/1/2/3/4.png"
+
+
+def test_downsample_max_pools_odd_length_with_itself():
+    matrix = np.array([[1.0, 5.0, 2.0, 0.0, 7.0]])
+
+    pooled = downsample(matrix, tile_size=2, pooling="max")
+
+    np.testing.assert_array_equal(pooled, [[5.0, 2.0, 7.0]])
+
+
+def test_downsample_mean():
+    matrix = np.array([[1.0, 5.0, 2.0, 0.0]])
+
+    pooled = downsample(matrix, tile_size=2, pooling="mean")
+
+    np.testing.assert_array_equal(pooled, [[3.0, 1.0]])
+
+
+def test_downsample_leaves_axes_that_fit_in_a_tile():
+    matrix = np.zeros((3, 10))
+
+    assert downsample(matrix, tile_size=4, pooling="max").shape == (3, 5)
+
+
+@pytest.mark.parametrize(
+    "shape, expected",
+    [((4, 4), 1), ((4, 5), 2), ((4, 8), 2), ((4, 9), 3), ((17, 2), 4)],
+)
+def test_zoom_levels(shape, expected):
+    assert zoom_levels(shape, tile_size=4) == expected
+
+
+def test_pyramid_covers_every_level():
+    db = [np.random.default_rng(0).uniform(-80, 0, (6, 20))]
+
+    tiles = [tile for batch in iter_tile_batches(db, 4, "max", 100) for tile in batch]
+
+    # 6x20 -> 3x10 -> 3x5 -> 3x3
+    per_level = {zoom: 0 for zoom in range(4)}
+    for tile in tiles:
+        per_level[tile.zoom] += 1
+    assert per_level == {3: 2 * 5, 2: 1 * 3, 1: 1 * 2, 0: 1}
+    # Partial tiles at the edges are cropped, not padded
+    edge = next(t for t in tiles if (t.zoom, t.x, t.y) == (3, 4, 1))
+    assert tile_image(edge.png).shape == (2, 4, 3)
+
+
+def test_pyramid_puts_highest_frequency_on_top_with_shared_colour_scale():
+    low = np.full((2, 2), -80.0)
+    high = np.full((2, 2), 0.0)
+    db = [np.vstack([low, high]), np.vstack([low, low])]
+
+    tiles = [tile for batch in iter_tile_batches(db, 2, "max", 100) for tile in batch]
+    by_key = {(t.channel, t.zoom, t.y): tile_image(t.png) for t in tiles}
+
+    # Loud rows are drawn in the top tile, and both channels map -80 dB to one colour
+    assert not np.array_equal(by_key[(0, 1, 0)], by_key[(0, 1, 1)])
+    np.testing.assert_array_equal(by_key[(0, 1, 1)], by_key[(1, 1, 0)])
+
+
+def test_tiles_come_in_batches():
+    db = [np.zeros((4, 40))]
+
+    batches = list(iter_tile_batches(db, 4, "mean", 4))
+
+    # 10 + 5 + 3 + 2 + 1 tiles
+    assert [len(batch) for batch in batches] == [4, 4, 4, 4, 4, 1]
+
+
+def test_manifest_describes_the_pyramid():
+    f = np.linspace(0, 8000, 6)
+    t = np.linspace(0.5, 9.5, 20)
+    db = [np.full((6, 20), -10.0), np.full((6, 20), -70.0)]
+
+    manifest = build_manifest(f, t, db, tile_size=4, pooling="max")
+
+    assert manifest == {
+        "tile_size": 4,
+        "zoom_levels": 4,
+        "channels": 2,
+        "frequencies": 6,
+        "frames": 20,
+        "f_min": 0.0,
+        "f_max": 8000.0,
+        "t_min": 0.5,
+        "t_max": 9.5,
+        "db_min": -70.0,
+        "db_max": -10.0,
+        "pooling": "max",
+    }
@@ -0,0 +1,67 @@
+from typing import Generator
+from unittest.mock import AsyncMock, Mock
+from uuid import uuid4
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from app.api.routes import get_spectrogram_store
+from app.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def mock_spectrogram_store() -> Generator[Mock, None, None]:
+    store = Mock()
+    store.retrieve = AsyncMock()
+    app.dependency_overrides[get_spectrogram_store] = lambda: store
+    yield store
+    app.dependency_overrides.clear()
+
+
+def test_get_tile_manifest(mock_spectrogram_store: Mock):
+    audio_id = uuid4()
+    mock_spectrogram_store.retrieve.return_value = b'{"tile_size": 256}'
+
+    response = client.get(f"/audio/{audio_id}/tiles")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {"tile_size": 256}
+    mock_spectrogram_store.retrieve.assert_awaited_once_with(
+        f"{audio_id}/tiles/manifest.json"
+    )
+
+
+def test_get_tile(mock_spectrogram_store: Mock):
+    audio_id = uuid4()
+    mock_spectrogram_store.retrieve.return_value = b"png bytes"
+
+    response = client.get(f"/audio/{audio_id}/tiles/1/3/7/0.png")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "image/png"
+    assert response.content == b"png bytes"
+    mock_spectrogram_store.retrieve.assert_awaited_once_with(
+        f"{audio_id}/tiles/1/3/7/0.png"
+    )
+
+
+@pytest.mark.parametrize(
+    "path, detail",
+    [("tiles", "Tiles not found"), ("tiles/0/0/0/0.png", "Tile not found")],
+)
+def test_missing_tiles_are_not_found(
+    mock_spectrogram_store: Mock, path: str, detail: str
+):
+    mock_spectrogram_store.retrieve.side_effect = ClientError(
+        {"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}, "GetObject"
+    )
+
+    response = client.get(f"/audio/{uuid4()}/{path}")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": detail}
@@ -10,11 +10,17 @@ from fastapi import status
 from fastapi.testclient import TestClient
 from httpx import Response
 
-from app.api.routes import get_audio_upload_service
-from app.api.schemas import UploadResponse
+from app.api.routes import (get_audio_upload_service, get_status_cache,
+                            get_task_batcher)
+from app.api.schemas import DirectUploadResponse, UploadResponse
+from app.config import get_settings
 from app.events import AUDIO_UPLOADED
 from app.exceptions import InvalidAudioFile
 from app.main import app
+from app.models.constants import AUDIO_STATUS_DONE, AUDIO_STATUS_PENDING
+from app.services.analysis_params import (DEFAULT_ANALYSIS_PARAMS,
+                                          AnalysisParams)
+from app.services.s3_storage import PresignedUpload
 
 client = TestClient(app)
 
@@ -70,7 +76,7 @@ def test_valid_audio_upload(
     upload_fake_mp3: UploadFakeMP3,
 ):
     test_audio_id = uuid4()
-    mock_upload_service.handle_upload.return_value = Mock(id=test_audio_id)
+    mock_upload_service.handle_upload.return_value = (Mock(id=test_audio_id), True)
 
     response = upload_fake_mp3()
 
@@ -83,6 +89,44 @@ def test_valid_audio_upload(
     )
 
 
+@pytest.mark.parametrize("audio_status", [AUDIO_STATUS_PENDING, AUDIO_STATUS_DONE])
+def test_duplicate_upload_is_not_processed_again(
+    mock_send_task: Mock,
+    mock_upload_service: Mock,
+    upload_fake_mp3: UploadFakeMP3,
+    audio_status: str,
+):
+    test_audio_id = uuid4()
+    # Whatever its status, the upload that created it queued it already
+    mock_upload_service.handle_upload.return_value = (
+        Mock(id=test_audio_id, status=audio_status),
+        False,
+    )
+
+    response = upload_fake_mp3()
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert UploadResponse(**response.json()).audio_id == test_audio_id
+    mock_send_task.assert_not_called()
+
+
+def test_upload_is_batched_when_batching_enabled(
+    mock_send_task: Mock,
+    mock_upload_service: Mock,
+    upload_fake_mp3: UploadFakeMP3,
+):
+    test_audio_id = uuid4()
+    mock_upload_service.handle_upload.return_value = (Mock(id=test_audio_id), True)
+    task_batcher = Mock()
+    app.dependency_overrides[get_task_batcher] = lambda: task_batcher
+
+    response = upload_fake_mp3()
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    task_batcher.add.assert_called_once_with(test_audio_id)
+    mock_send_task.assert_not_called()
+
+
 def test_invalid_audio_upload(
     mock_send_task: Mock,
     mock_upload_service: Mock,
@@ -100,3 +144,127 @@ def test_missing_audio_file_returns_422(
     response = upload_fake_mp3(files={})
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
     mock_send_task.assert_not_called()
+
+
+def test_upload_forwards_analysis_params(
+    mock_send_task: Mock, mock_upload_service: Mock
+):
+    mock_upload_service.handle_upload.return_value = (Mock(id=uuid4()), True)
+
+    response = client.post(
+        "/upload",
+        files={
+            "audio_file": ("test.mp3", BytesIO(b"ID3"), mimetypes.types_map[".mp3"])
+        },
+        data={"params": '{"nperseg": 1024, "colormap": "magma"}'},
+    )
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    params = mock_upload_service.handle_upload.await_args.args[1]
+    assert params == AnalysisParams(nperseg=1024, colormap="magma")
+
+
+def test_upload_without_params_uses_defaults(
+    mock_send_task: Mock,
+    mock_upload_service: Mock,
+    upload_fake_mp3: UploadFakeMP3,
+):
+    mock_upload_service.handle_upload.return_value = (Mock(id=uuid4()), True)
+
+    upload_fake_mp3()
+
+    params = mock_upload_service.handle_upload.await_args.args[1]
+    assert params == DEFAULT_ANALYSIS_PARAMS
+
+
+@pytest.mark.parametrize(
+    "params", ['{"nperseg": 256, "noverlap": 300}', '{"scale": "loud"}', "{oops"]
+)
+def test_upload_with_invalid_params_is_rejected(
+    mock_send_task: Mock, mock_upload_service: Mock, params: str
+):
+    response = client.post(
+        "/upload",
+        files={
+            "audio_file": ("test.mp3", BytesIO(b"ID3"), mimetypes.types_map[".mp3"])
+        },
+        data={"params": params},
+    )
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert response.json()["detail"][0]["loc"][:2] == ["body", "params"]
+    mock_upload_service.handle_upload.assert_not_called()
+    mock_send_task.assert_not_called()
+
+
+def test_direct_upload_returns_presigned_urls(mock_upload_service: Mock):
+    audio_id = uuid4()
+    mock_upload_service.start_direct_upload = AsyncMock(
+        return_value=(
+            Mock(id=audio_id),
+            PresignedUpload(
+                multipart_upload_id="upload-1", part_size=10, part_urls=["a", "b"]
+            ),
+        )
+    )
+
+    response = client.post(
+        "/uploads",
+        json={"filename": "test.wav", "size": 20, "params": {"scale": "power"}},
+    )
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert DirectUploadResponse(**response.json()) == DirectUploadResponse(
+        audio_id=audio_id,
+        multipart_upload_id="upload-1",
+        part_size=10,
+        part_urls=["a", "b"],
+        expires_in=get_settings().PRESIGNED_UPLOAD_EXPIRES_SECONDS,
+    )
+    filename, size, params, _ = mock_upload_service.start_direct_upload.await_args.args
+    assert (filename, size, params) == ("test.wav", 20, AnalysisParams(scale="power"))
+
+
+def test_completed_direct_upload_is_processed(
+    mock_send_task: Mock, mock_upload_service: Mock
+):
+    audio_id = uuid4()
+    mock_upload_service.complete_direct_upload = AsyncMock(
+        return_value=Mock(id=audio_id, status=AUDIO_STATUS_PENDING)
+    )
+    status_cache = AsyncMock()
+    app.dependency_overrides[get_status_cache] = lambda: status_cache
+
+    response = client.post(
+        f"/uploads/{audio_id}/complete",
+        json={
+            "multipart_upload_id": "upload-1",
+            "parts": [{"part_number": 1, "etag": "etag-1"}],
+        },
+    )
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert UploadResponse(**response.json()).audio_id == audio_id
+    mock_upload_service.complete_direct_upload.assert_awaited_once_with(
+        audio_id, "upload-1", [(1, "etag-1")]
+    )
+    status_cache.set.assert_awaited_once_with([audio_id], AUDIO_STATUS_PENDING)
+    mock_send_task.assert_called_once_with(AUDIO_UPLOADED, args=[audio_id])
+
+
+@pytest.mark.parametrize(
+    "result, status_code",
+    [
+        ({"return_value": None}, status.HTTP_404_NOT_FOUND),
+        ({"side_effect": InvalidAudioFile}, status.HTTP_400_BAD_REQUEST),
+    ],
+)
+def test_direct_upload_that_cant_be_completed(
+    mock_send_task: Mock, mock_upload_service: Mock, result: dict, status_code: int
+):
+    mock_upload_service.complete_direct_upload = AsyncMock(**result)
+
+    response = client.post(f"/uploads/{uuid4()}/complete")
+
+    assert response.status_code == status_code
+    mock_send_task.assert_not_called()
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.worker_runtime import WorkerRuntime
+
+
+@pytest.fixture
+def runtime():
+    runtime = WorkerRuntime()
+    yield runtime
+    runtime.close()
+
+
+def test_runs_coroutines_on_its_loop_thread(runtime: WorkerRuntime):
+    async def loop_thread() -> str:
+        return threading.current_thread().name
+
+    assert runtime.run(loop_thread()) == "worker-loop"
+    # Same loop for every call, clients opened on it stay usable
+    assert runtime.run(asyncio.sleep(0, result=runtime.loop)) is runtime.loop
+
+
+def test_tasks_from_several_threads_run_concurrently(runtime: WorkerRuntime):
+    """Each task waits for the other, they'd never finish if the loop ran them one
+    after the other."""
+    both_started = asyncio.Barrier(2)
+
+    async def task(n: int) -> int:
+        await both_started.wait()
+        return n
+
+    with ThreadPoolExecutor(2) as celery_threads:
+        results = celery_threads.map(lambda n: runtime.run(task(n), timeout=5), [1, 2])
+
+        assert sorted(results) == [1, 2]
+
+
+def test_exceptions_reach_the_caller(runtime: WorkerRuntime):
+    async def fail() -> None:
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        runtime.run(fail())
+
+
+def test_cancels_the_coroutine_if_the_caller_stops_waiting(runtime: WorkerRuntime):
+    cancelled = threading.Event()
+
+    async def slow() -> None:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(TimeoutError):
+        runtime.run(slow(), timeout=0.05)
+    assert cancelled.wait(5)
+
+
+def test_refuses_to_block_its_own_loop(runtime: WorkerRuntime):
+    async def nested() -> None:
+        runtime.run(asyncio.sleep(0))
+
+    with pytest.raises(RuntimeError):
+        runtime.run(nested())
+
+
+def test_closed_runtime_refuses_work():
+    runtime = WorkerRuntime()
+    runtime.close()
+    runtime.close()
+
+    with pytest.raises(RuntimeError):
+        runtime.run(asyncio.sleep(0))
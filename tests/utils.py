@@ -1,3 +1,6 @@
+from app.config import Settings
+
+
 class MockAsyncContextManager:
     """Mock for async context managers yielding a given mock.
 
@@ -32,3 +35,14 @@ class MockAsyncContextManager:
     # Optional: allow attribute passthrough or chaining
     def __getattr__(self, item):
         return getattr(self.mock, item)
+
+
+def make_settings(**overrides) -> Settings:
+    fields = dict(
+        DATABASE_URL="sqlite+aiosqlite:///:memory:",
+        CELERY_BROKER_URL="redis://localhost",
+        S3_ENDPOINT="http://localhost",
+        S3_ID="id",
+        S3_SECRET="secret",
+    )
+    return Settings(**{**fields, **overrides})